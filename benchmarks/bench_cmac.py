@@ -0,0 +1,260 @@
+""" Benchmark suite for the CMAC 2.0 pipeline on synthetic radar volumes.
+
+Times cmac() end to end and its processing functions on their own for the
+X-SAPR, C-SAPR2 and SAIL scan strategies, records the peak traced memory
+of each benchmark and writes the results as json lines, so regressions can
+be compared between commits.
+
+Usage::
+
+    python bench_cmac.py --scan xsapr sail --scale 1.0 -o results.jsonl
+
+"""
+
+import argparse
+import copy
+import json
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+import pyart
+
+from cmac import cmac, get_cmac_values, get_field_names
+from cmac.config import get_zs_relationships
+from cmac.cmac_processing import (
+    do_my_fuzz, fix_phase_fields, get_texture, snow_rate, snow_rates,
+    _fix_rain_above_bb)
+from cmac.cmac_ppi_quicklooks import quicklooks_ppi
+from cmac.radar_clutter import _RunningStats
+from cmac.testing import (SCAN_STRATEGIES, make_synthetic_radar,
+                          make_synthetic_sonde)
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """ Registers a benchmark. The decorated function takes the prepared
+    inputs and returns the function to time. """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def prepare(scan, scale):
+    """ Builds a synthetic volume and sonde, and a radar with the fields
+    the fuzzy logic needs. """
+    config = SCAN_STRATEGIES[scan]['config']
+    radar = make_synthetic_radar(scan, scale=scale)
+    cmac_config = get_cmac_values(config)
+    site_alt = cmac_config.get('site_alt', radar.altitude['data'][0])
+    sonde = make_synthetic_sonde(surface_temperature=6.5e-3 * 3000.0,
+                                 surface_altitude=site_alt)
+    field_config = get_field_names(config)
+
+    fuzz_radar = copy.deepcopy(radar)
+    z_dict, temp_dict = pyart.retrieve.map_profile_to_gates(
+        sonde.variables['tdry'][:], sonde.variables['alt'][:], fuzz_radar)
+    fuzz_radar.add_field('sounding_temperature', temp_dict,
+                         replace_existing=True)
+    fuzz_radar.add_field('height', z_dict, replace_existing=True)
+    if field_config['signal_to_noise_ratio'] is None:
+        fuzz_radar.add_field(
+            'signal_to_noise_ratio',
+            pyart.retrieve.calculate_snr_from_reflectivity(fuzz_radar),
+            replace_existing=True)
+    else:
+        fuzz_radar.fields['signal_to_noise_ratio'] = fuzz_radar.fields[
+            field_config['signal_to_noise_ratio']]
+    fuzz_radar.add_field(
+        'velocity_texture', get_texture(fuzz_radar, field_config['velocity']),
+        replace_existing=True)
+    return {'scan': scan, 'config': config, 'radar': radar, 'sonde': sonde,
+            'fuzz_radar': fuzz_radar, 'field_config': field_config}
+
+
+@benchmark('cmac')
+def bench_cmac(inputs):
+    def run():
+        cmac(copy.deepcopy(inputs['radar']), inputs['sonde'],
+             inputs['config'], verbose=False)
+    return run
+
+
+@benchmark('get_texture')
+def bench_get_texture(inputs):
+    vel_field = inputs['field_config']['velocity']
+    return lambda: get_texture(inputs['radar'], vel_field)
+
+
+@benchmark('do_my_fuzz')
+def bench_do_my_fuzz(inputs):
+    field_config = inputs['field_config']
+    return lambda: do_my_fuzz(
+        inputs['fuzz_radar'], field_config['cross_correlation_ratio'],
+        field_config['normalized_coherent_power'], verbose=False)
+
+
+@benchmark('_fix_rain_above_bb')
+def bench_fix_rain_above_bb(inputs):
+    field_config = inputs['field_config']
+    gid_fld, cats = do_my_fuzz(
+        inputs['fuzz_radar'], field_config['cross_correlation_ratio'],
+        field_config['normalized_coherent_power'], verbose=False)
+    cats = list(cats)
+    return lambda: _fix_rain_above_bb(
+        gid_fld, cats.index('rain'), cats.index('melting'),
+        cats.index('snow'))
+
+
+def _phase_inputs(inputs):
+    radar = inputs['radar']
+    phidp = copy.deepcopy(
+        radar.fields[inputs['field_config']['input_phidp_field']])
+    kdp = copy.deepcopy(phidp)
+    kdp['data'] = np.ma.masked_invalid(np.gradient(phidp['data'], axis=1))
+    gatefilter = pyart.correct.GateFilter(radar)
+    gatefilter.exclude_below(
+        inputs['field_config']['normalized_coherent_power'], 0.5)
+    return kdp, phidp, radar.range['data'], gatefilter
+
+
+@benchmark('fix_phase_fields')
+def bench_fix_phase_fields(inputs):
+    kdp, phidp, rrange, gatefilter = _phase_inputs(inputs)
+    return lambda: fix_phase_fields(kdp, phidp, rrange, gatefilter)
+
+
+@benchmark('fix_phase_fields_threads')
+def bench_fix_phase_fields_threads(inputs):
+    kdp, phidp, rrange, gatefilter = _phase_inputs(inputs)
+    return lambda: fix_phase_fields(kdp, phidp, rrange, gatefilter,
+                                    block_size=256, n_threads=4)
+
+
+def _snow_inputs(inputs):
+    radar = copy.deepcopy(inputs['radar'])
+    radar.add_field_like(
+        inputs['field_config']['reflectivity'], 'corrected_reflectivity',
+        radar.fields[inputs['field_config']['reflectivity']]['data'].copy())
+    snow_gates = pyart.correct.GateFilter(radar)
+    snow_gates.exclude_above('corrected_reflectivity', 20.0)
+    return radar, snow_gates, get_zs_relationships()
+
+
+@benchmark('snow_rate')
+def bench_snow_rate(inputs):
+    """ The per relationship loop cmac() used before snow_rates. """
+    radar, snow_gates, zs_relationships = _snow_inputs(inputs)
+
+    def run():
+        for citation, zs in zs_relationships.items():
+            snow_rate(radar, 1 / 0.073, zs['A'], zs['B'], citation,
+                      zs['abbreviation'])
+            field = radar.fields['snow_rate_%s' % zs['abbreviation']]
+            field['data'] = np.ma.masked_where(snow_gates.gate_excluded,
+                                               field['data'])
+    return run
+
+
+@benchmark('snow_rates')
+def bench_snow_rates(inputs):
+    radar, snow_gates, zs_relationships = _snow_inputs(inputs)
+    return lambda: snow_rates(radar, 1 / 0.073, zs_relationships,
+                              gatefilter=snow_gates)
+
+
+@benchmark('tall_clutter_accumulate')
+def bench_tall_clutter(inputs):
+    refl = inputs['radar'].fields[
+        inputs['field_config']['reflectivity']]['data']
+    volumes = [np.ma.masked_less(refl + offset, 10.0)
+               for offset in np.linspace(-2.0, 2.0, 10)]
+
+    def run():
+        run_stats = _RunningStats()
+        for volume in volumes:
+            run_stats.push(volume)
+        run_stats.standard_deviation()
+    return run
+
+
+@benchmark('quicklooks_ppi')
+def bench_quicklooks(inputs):
+    cmac_radar = cmac(copy.deepcopy(inputs['radar']), inputs['sonde'],
+                      inputs['config'], verbose=False)
+    image_directory = tempfile.mkdtemp()
+    return lambda: quicklooks_ppi(cmac_radar, inputs['config'],
+                                  image_directory=image_directory,
+                                  dd_lobes=False)
+
+
+def time_benchmark(func, repeat):
+    """ Times func repeat times and traces the peak memory of one extra
+    run. """
+    times = []
+    for _ in range(repeat):
+        bt = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - bt)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'min_time': min(times), 'mean_time': float(np.mean(times)),
+            'peak_memory_mb': peak / 1e6}
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD']).strip().decode('ascii')
+    except (OSError, subprocess.CalledProcessError):
+        return 'Unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark CMAC 2.0 on synthetic radar volumes.')
+    parser.add_argument('--scan', nargs='+', default=list(SCAN_STRATEGIES),
+                        choices=list(SCAN_STRATEGIES))
+    parser.add_argument('--scale', type=float, nargs='+', default=[1.0],
+                        help='Scale factors of the volume size.')
+    parser.add_argument('--bench', nargs='+', default=list(BENCHMARKS),
+                        choices=list(BENCHMARKS))
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', type=str,
+                        default='bench_results.jsonl')
+    args = parser.parse_args()
+
+    revision = _git_revision()
+    with open(args.output, 'a') as outfile:
+        for scan in args.scan:
+            for scale in args.scale:
+                inputs = prepare(scan, scale)
+                shape = inputs['radar'].fields[
+                    inputs['field_config']['reflectivity']]['data'].shape
+                for name in args.bench:
+                    result = {'benchmark': name, 'scan': scan,
+                              'scale': scale, 'nrays': shape[0],
+                              'ngates': shape[1], 'revision': revision,
+                              'python': platform.python_version()}
+                    try:
+                        func = BENCHMARKS[name](inputs)
+                        result.update(time_benchmark(func, args.repeat))
+                    except Exception as err:
+                        result['error'] = repr(err)
+                    result['max_rss_mb'] = resource.getrusage(
+                        resource.RUSAGE_SELF).ru_maxrss / 1e3
+                    print(json.dumps(result))
+                    outfile.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+""" Benchmarks the fixed per volume setup overhead of a CMAC worker with and
+without a WorkerContext.
+
+Usage::
+
+    python bench_worker_context.py flag_radar.nc dod.nc sonde.cdf -n 20
+
+"""
+
+import argparse
+import gc
+import time
+from copy import deepcopy
+
+import pyart
+import xarray as xr
+
+from cmac import config
+from cmac.worker_context import WorkerContext
+
+
+def cold_setup(radar_config, flag_file, dod_file, sonde_file):
+    """ Per volume setup as done by cmac_sail.py without a context. """
+    config.get_metadata(radar_config)
+    config.get_cmac_values(radar_config)
+    config.get_field_names(radar_config)
+    beam_block = pyart.io.read(flag_file)
+    cbb_flag = deepcopy(beam_block.fields['cbb_flag'])
+    del beam_block
+    sonde = xr.open_dataset(sonde_file)
+    sonde.load()
+    sonde.close()
+    dod = xr.open_dataset(dod_file, mask_and_scale=False)
+    dod.load()
+    gc.collect()
+    return cbb_flag
+
+
+def warm_setup(context, sonde_file):
+    """ Per volume setup when the resources come from a WorkerContext. """
+    cbb_flag = context.cbb_flag
+    context.open_sonde(sonde_file)
+    context.dod
+    context.finish_volume()
+    return cbb_flag
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the per volume setup overhead.')
+    parser.add_argument('flag_file', type=str)
+    parser.add_argument('dod_file', type=str)
+    parser.add_argument('sonde_file', type=str)
+    parser.add_argument('-c', '--config', type=str, default='sail_xband_ppi')
+    parser.add_argument('-n', '--n_volumes', type=int, default=20)
+    args = parser.parse_args()
+
+    bt = time.time()
+    for _ in range(args.n_volumes):
+        cold_setup(args.config, args.flag_file, args.dod_file,
+                   args.sonde_file)
+    cold_time = (time.time() - bt) / args.n_volumes
+
+    bt = time.time()
+    context = WorkerContext(args.config, flag_file=args.flag_file,
+                            dod_file=args.dod_file)
+    for _ in range(args.n_volumes):
+        warm_setup(context, args.sonde_file)
+    warm_time = (time.time() - bt) / args.n_volumes
+
+    print('Setup per volume without context: %.4f s' % cold_time)
+    print('Setup per volume with context:    %.4f s' % warm_time)
+    print('Speedup: %.1fx' % (cold_time / max(warm_time, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@ CMAC functions for determining gate ids, detect second trip returns and
 more.
 
     cmac
+    cmac_batch
     quicklooks
     snr_and_sounding
     get_texture
@@ -15,10 +16,30 @@ more.
     return_csu_kdp
     retrieve_qvp
     tall_clutter
+    ProcessingManifest
+    run_manifest
+    WorkerContext
+    get_worker_context
+    phase_proc_lp_parallel
+    GateCategories
+    get_gate_categories
+    GateMask
+    QVPTimeSeries
+    compute_qvp_series
+    coverage_statistics
+    PrecipAccumulator
+    accumulate_files
+    resolve_stages
+    StageCache
+    coefficient_sweep
+    cmac_sensitivity
+    VelocityReference
+    GeometryCache
+    ClutterMap
 
 """
 
-from .cmac_radar import cmac, area_coverage
+from .cmac_radar import cmac, cmac_batch, area_coverage
 from .cmac_ppi_quicklooks import quicklooks_ppi
 from .cmac_rhi_quicklooks import quicklooks_rhi
 from .cmac_processing import snr_and_sounding, do_my_fuzz
@@ -28,5 +49,19 @@ from .config import get_cmac_values, get_field_names
 from .config import get_metadata, get_plot_values
 from .data_catalouging import get_sounding_times, get_sounding_file_name
 from .radar_clutter import tall_clutter
+from .batch_processing import ProcessingManifest, run_manifest
+from .worker_context import WorkerContext, get_worker_context
+from .phase_processing import phase_proc_lp_parallel
+from .gate_categories import GateCategories, get_gate_categories
+from .gate_masks import GateMask
+from .qvp import QVPTimeSeries, compute_qvp_series
+from .radar_statistics import coverage_statistics
+from .accumulation import PrecipAccumulator, accumulate_files
+from .pipeline import resolve_stages
+from .stage_cache import StageCache
+from .sensitivity import coefficient_sweep, cmac_sensitivity
+from .velocity_reference import VelocityReference
+from .geometry_cache import GeometryCache
+from .clutter_map import ClutterMap
 
 __all__ = [s for s in dir() if not s.startswith('_')]
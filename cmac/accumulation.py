@@ -0,0 +1,379 @@
+""" Rain and snow accumulation from CMAC volumes. Rates of the lowest sweep
+are integrated in time with the trapezoidal rule over the actual gaps
+between volumes, on the native polar grid, into running hourly, daily and
+monthly totals that are written out as soon as each period is complete.
+Volumes can be accumulated in parallel time chunks whose partial totals
+are merged in time order. """
+
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import os
+
+import netCDF4
+import numpy as np
+import pyart
+import xarray as xr
+
+from .batch_processing import parse_file_datetime
+
+PERIODS = ('hourly', 'daily', 'monthly')
+
+
+def period_start(time, period):
+    """ Start of the hourly, daily or monthly period containing time. """
+    if period == 'hourly':
+        return time.replace(minute=0, second=0, microsecond=0)
+    if period == 'daily':
+        return time.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'monthly':
+        return time.replace(day=1, hour=0, minute=0, second=0,
+                            microsecond=0)
+    raise ValueError('Unknown accumulation period %s.' % period)
+
+
+def period_end(start, period):
+    """ End of the period beginning at start. """
+    if period == 'hourly':
+        return start + datetime.timedelta(hours=1)
+    if period == 'daily':
+        return start + datetime.timedelta(days=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def lowest_sweep_rates(radar, fields, sweep=None):
+    """
+    Rates and geometry of the lowest sweep of a CMAC volume.
+
+    Returns
+    -------
+    time : datetime
+        Mean time of the sweep.
+    azimuth : array
+        Azimuth of the rays of the sweep.
+    rates : dict
+        Rate of each field in mm/h with masked gates set to 0, fields
+        missing from the volume are None.
+
+    """
+    if sweep is None:
+        sweep = int(np.argmin(radar.fixed_angle['data']))
+    sweep_slice = radar.get_slice(sweep)
+    time = netCDF4.num2date(
+        radar.time['data'][sweep_slice].mean(), radar.time['units'],
+        only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+    rates = {}
+    for field in fields:
+        if field in radar.fields:
+            rates[field] = np.ma.filled(
+                radar.fields[field]['data'][sweep_slice], 0.0).astype(
+                    np.float32)
+        else:
+            rates[field] = None
+    return time, radar.azimuth['data'][sweep_slice], rates
+
+
+class PrecipAccumulator(object):
+    """
+    Running accumulations of precipitation rates.
+
+    Parameters
+    ----------
+    fields : list
+        Rate fields in mm/h to accumulate, such as rain_rate_A and the
+        snow_rate_* fields.
+    azimuth : array
+        Azimuth of the rays of the accumulation grid.
+    rrange : array
+        Range of the gates of the accumulation grid.
+
+    Other Parameters
+    ----------------
+    periods : list
+        Accumulation periods, any of hourly, daily and monthly.
+    max_gap : float
+        Largest gap in seconds between two volumes that is integrated
+        over. Longer gaps are treated as missing data.
+    output_dir : str
+        Directory the totals are written to, in one subdirectory per
+        period. If None nothing is written.
+    save_name : str
+        Prefix of the output file names.
+    open_start : bool
+        True if volumes before the first one added are accumulated
+        elsewhere, as for all but the first time chunk. Periods starting
+        before the first volume are then only written after merging.
+    site : dict
+        Latitude, longitude and altitude of the radar, written to the
+        output files.
+
+    """
+    def __init__(self, fields, azimuth, rrange, periods=PERIODS,
+                 max_gap=1800.0, output_dir=None,
+                 save_name='cmac_accumulation', open_start=False,
+                 site=None):
+        self.fields = list(fields)
+        self.azimuth = np.asarray(azimuth, dtype=np.float32)
+        self.range = np.asarray(rrange, dtype=np.float32)
+        self.periods = list(periods)
+        self.max_gap = max_gap
+        self.output_dir = output_dir
+        self.save_name = save_name
+        self.open_start = open_start
+        self.site = site if site is not None else {}
+        # Totals by (period, period start): depth of each field, and the
+        # integrated and missing seconds.
+        self.totals = {}
+        self.first = None
+        self.last = None
+        self.written = []
+
+    @classmethod
+    def from_radar(cls, radar, fields=None, sweep=None, **kwargs):
+        """ Creates an accumulator on the lowest sweep grid of a radar.
+        By default rain_rate_A and the snow_rate_* fields of the radar are
+        accumulated. """
+        if fields is None:
+            fields = [field for field in sorted(radar.fields)
+                      if field == 'rain_rate_A'
+                      or field.startswith('snow_rate_')]
+        _, azimuth, _ = lowest_sweep_rates(radar, [], sweep)
+        site = {'latitude': float(radar.latitude['data'][0]),
+                'longitude': float(radar.longitude['data'][0]),
+                'altitude': float(radar.altitude['data'][0])}
+        return cls(fields, azimuth, radar.range['data'], site=site, **kwargs)
+
+    def _to_grid(self, azimuth, data):
+        """ Maps a sweep onto the accumulation grid, by nearest ray in
+        azimuth and truncating or padding range. """
+        if data is None:
+            return None
+        if len(azimuth) == len(self.azimuth) and np.allclose(
+                azimuth, self.azimuth, atol=0.5):
+            rays = data
+        else:
+            order = np.argsort(azimuth)
+            sorted_az = np.asarray(azimuth)[order]
+            index = np.searchsorted(sorted_az, self.azimuth) % len(sorted_az)
+            previous = (index - 1) % len(sorted_az)
+            dist_next = np.abs((sorted_az[index] - self.azimuth + 180.0)
+                               % 360.0 - 180.0)
+            dist_prev = np.abs((sorted_az[previous] - self.azimuth + 180.0)
+                               % 360.0 - 180.0)
+            nearest = np.where(dist_prev < dist_next, previous, index)
+            rays = data[order[nearest]]
+        ngates = len(self.range)
+        if rays.shape[1] == ngates:
+            return rays
+        grid = np.zeros((len(self.azimuth), ngates), dtype=np.float32)
+        ngates = min(ngates, rays.shape[1])
+        grid[:, :ngates] = rays[:, :ngates]
+        return grid
+
+    def _total(self, period, start):
+        key = (period, start)
+        if key not in self.totals:
+            shape = (len(self.azimuth), len(self.range))
+            self.totals[key] = {
+                'depth': {field: np.zeros(shape, dtype=np.float64)
+                          for field in self.fields},
+                'seconds': 0.0, 'missing_seconds': 0.0}
+        return self.totals[key]
+
+    def _integrate(self, previous, current):
+        """ Adds the depth between two (time, rates) states to every
+        period they overlap, split by the time in each period. """
+        t0, rates0 = previous
+        t1, rates1 = current
+        gap = (t1 - t0).total_seconds()
+        if gap <= 0:
+            return
+        missing = gap > self.max_gap
+        mean_rates = {}
+        if not missing:
+            for field in self.fields:
+                if rates0[field] is None or rates1[field] is None:
+                    mean_rates[field] = None
+                else:
+                    mean_rates[field] = 0.5 * (rates0[field] + rates1[field])
+        for period in self.periods:
+            start = period_start(t0, period)
+            while start < t1:
+                end = period_end(start, period)
+                seconds = (min(end, t1) - max(start, t0)).total_seconds()
+                total = self._total(period, start)
+                if missing:
+                    total['missing_seconds'] += seconds
+                else:
+                    total['seconds'] += seconds
+                    for field, rate in mean_rates.items():
+                        if rate is not None:
+                            total['depth'][field] += rate * (seconds / 3600.0)
+                start = end
+
+    def add(self, time, azimuth, rates):
+        """ Adds the rates of one volume, which must be later than the
+        previous one. """
+        state = (time, {field: self._to_grid(azimuth, rates.get(field))
+                        for field in self.fields})
+        if self.last is not None:
+            if time <= self.last[0]:
+                raise ValueError('Volumes must be added in time order, %s '
+                                 'is not after %s.' % (time, self.last[0]))
+            self._integrate(self.last, state)
+        else:
+            self.first = state
+        self.last = state
+        if self.output_dir is not None:
+            self.flush()
+
+    def add_radar(self, radar, sweep=None):
+        """ Adds the lowest sweep of a CMAC volume. """
+        self.add(*lowest_sweep_rates(radar, self.fields, sweep))
+
+    def merge(self, other):
+        """ Merges the totals of an accumulator of the volumes following
+        those of this one, integrating over the gap between them. """
+        if other.first is None:
+            return self
+        if self.last is not None:
+            if other.first[0] <= self.last[0]:
+                raise ValueError('Merged accumulations must follow each '
+                                 'other in time.')
+            self._integrate(self.last, other.first)
+        else:
+            self.first = other.first
+            self.open_start = other.open_start
+        for key, other_total in other.totals.items():
+            total = self._total(*key)
+            total['seconds'] += other_total['seconds']
+            total['missing_seconds'] += other_total['missing_seconds']
+            for field in self.fields:
+                total['depth'][field] += other_total['depth'][field]
+        self.written.extend(other.written)
+        self.last = other.last
+        if self.output_dir is not None:
+            self.flush()
+        return self
+
+    def flush(self, final=False):
+        """ Writes and drops the totals of the periods that are complete,
+        or of all periods if final is True. Returns the files written. """
+        written = []
+        for key in sorted(self.totals, key=lambda key: key[1]):
+            period, start = key
+            end = period_end(start, period)
+            complete = self.last is not None and end <= self.last[0]
+            if self.open_start and start < self.first[0]:
+                complete = False
+            if not (complete or final):
+                continue
+            total = self.totals.pop(key)
+            if self.output_dir is not None:
+                written.append(self._write(period, start, end, total,
+                                           complete))
+        self.written.extend(written)
+        return written
+
+    def to_dataset(self, period, start, end, total, complete=True):
+        """ Dataset of the totals of one period. """
+        data_vars = {}
+        for field in self.fields:
+            data_vars[field + '_accumulation'] = (
+                ('azimuth', 'range'), total['depth'][field].astype(np.float32),
+                {'units': 'mm',
+                 'long_name': 'Accumulation of %s' % field,
+                 'cell_methods': 'time: sum'})
+        attrs = {'Conventions': 'CF-1.7',
+                 'title': '%s CMAC precipitation accumulation' % period,
+                 'time_coverage_start': start.isoformat(),
+                 'time_coverage_end': end.isoformat(),
+                 'integrated_seconds': total['seconds'],
+                 'missing_seconds': total['missing_seconds'],
+                 'max_gap_seconds': self.max_gap,
+                 'complete': int(complete)}
+        attrs.update({'radar_' + key: value
+                      for key, value in self.site.items()})
+        return xr.Dataset(data_vars, coords={
+            'azimuth': ('azimuth', self.azimuth, {'units': 'degrees'}),
+            'range': ('range', self.range, {'units': 'm'})}, attrs=attrs)
+
+    def _write(self, period, start, end, total, complete):
+        directory = os.path.join(self.output_dir, period)
+        os.makedirs(directory, exist_ok=True)
+        filename = os.path.join(directory, '%s.%s.%s.nc' % (
+            self.save_name, period, start.strftime('%Y%m%d.%H%M%S')))
+        self.to_dataset(period, start, end, total, complete).to_netcdf(
+            filename + '.part')
+        os.replace(filename + '.part', filename)
+        return filename
+
+
+def _accumulate_chunk(files, fields, azimuth, rrange, kwargs):
+    accumulator = PrecipAccumulator(fields, azimuth, rrange, **kwargs)
+    for filename in files:
+        radar = pyart.io.read(filename, include_fields=fields)
+        accumulator.add_radar(radar)
+        del radar
+    return accumulator
+
+
+def accumulate_files(files, output_dir=None, fields=None, n_workers=1,
+                     date_format=None, **kwargs):
+    """
+    Accumulates the rates of CMAC files.
+
+    Parameters
+    ----------
+    files : list
+        CMAC files. They are sorted by the time in their names.
+
+    Other Parameters
+    ----------------
+    output_dir : str
+        Directory the hourly, daily and monthly totals are written to.
+    fields : list
+        Rate fields to accumulate. By default rain_rate_A and the
+        snow_rate_* fields of the first file.
+    n_workers : int
+        Number of processes. The files are split into this many time
+        chunks, accumulated in parallel and merged in time order.
+    date_format : str
+        Format of the file names, see batch_processing.parse_file_datetime.
+    kwargs : dict
+        Keyword arguments of PrecipAccumulator.
+
+    Returns
+    -------
+    accumulator : PrecipAccumulator
+        The merged accumulator, with the list of written files in its
+        written attribute.
+
+    """
+    files = sorted(files, key=lambda x: parse_file_datetime(x, date_format))
+    first_radar = pyart.io.read(files[0])
+    accumulator = PrecipAccumulator.from_radar(
+        first_radar, fields=fields, output_dir=output_dir, **kwargs)
+    del first_radar
+    kwargs = dict(kwargs, site=accumulator.site)
+    if n_workers <= 1 or len(files) < 2 * n_workers:
+        for filename in files:
+            accumulator.add_radar(pyart.io.read(
+                filename, include_fields=accumulator.fields))
+        accumulator.flush(final=True)
+        return accumulator
+
+    bounds = np.linspace(0, len(files), n_workers + 1).astype(int)
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(
+            _accumulate_chunk, files[start:end], accumulator.fields,
+            accumulator.azimuth, accumulator.range,
+            dict(kwargs, output_dir=output_dir, open_start=i > 0))
+                   for i, (start, end) in enumerate(zip(bounds[:-1],
+                                                        bounds[1:]))]
+        # Merged in time order, so every gap between chunks is integrated.
+        for future in futures:
+            accumulator.merge(future.result())
+    accumulator.flush(final=True)
+    return accumulator
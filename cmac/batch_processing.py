@@ -0,0 +1,657 @@
+""" Manifest based batch scheduler for reprocessing radar archives with
+CMAC 2.0. A manifest records, for every radar volume, the matched sonde,
+the clutter file and the output path, along with the processing state of
+the volume. This makes month long reprocessing runs restartable and
+observable. """
+
+import datetime
+import glob
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+
+STATE_PENDING = 'pending'
+STATE_RUNNING = 'running'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+_DATETIME_REGEX = re.compile(r'(\d{8})[._-]?(\d{6})')
+
+
+def parse_file_datetime(filename, date_format=None):
+    """
+    Parse the datetime from a radar or sonde file name.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the file, only the base name is used.
+
+    Other Parameters
+    ----------------
+    date_format : str
+        strptime format of the whole base name, such as
+        'gucsondewnpnM1.b1.%Y%m%d.%H%M%S.cdf'. If None, the first
+        YYYYMMDD.HHMMSS like pattern in the file name is used.
+
+    Returns
+    -------
+    file_time : datetime
+        Datetime parsed from the file name.
+
+    """
+    fname = os.path.basename(filename)
+    if date_format is not None:
+        return datetime.datetime.strptime(fname, date_format)
+    match = _DATETIME_REGEX.search(fname)
+    if match is None:
+        raise ValueError('Unable to find a date in ' + fname)
+    return datetime.datetime.strptime(
+        match.group(1) + match.group(2), '%Y%m%d%H%M%S')
+
+
+def match_sonde(radar_time, sonde_times, sonde_files):
+    """ Returns the sonde file closest in time to radar_time. """
+    if len(sonde_files) == 0:
+        return None
+    index = np.argmin(np.abs(np.asarray(sonde_times) - radar_time))
+    return sonde_files[int(index)]
+
+
+def output_file_name(out_path, save_name, radar_time):
+    """ Returns the CMAC output file name, in a monthly directory, for a
+    radar volume. """
+    return os.path.join(
+        out_path, radar_time.strftime('%Y%m'),
+        save_name + '.' + radar_time.strftime('%Y%m%d.%H%M%S') + '.nc')
+
+
+def make_entry(radar_file, radar_time, sonde_file, clutter_file,
+               output_file, config):
+    """ Returns a new pending manifest entry for a radar volume. """
+    return {'radar_file': radar_file,
+            'radar_time': radar_time.isoformat(),
+            'sonde_file': sonde_file,
+            'clutter_file': clutter_file,
+            'output_file': output_file,
+            'config': config,
+            'state': STATE_PENDING,
+            'attempts': 0,
+            'error': None,
+            'started': None,
+            'finished': None}
+
+
+# Number of gate fields CMAC 2.0 adds to a volume and the factor of
+# temporary arrays on top of them during the phase processing and
+# attenuation correction. Used for the peak memory estimate.
+_CMAC_ADDED_FIELDS = 30
+_WORK_FACTOR = 3.0
+# Number of queued volumes looked at when searching for one that fits in
+# the memory budget.
+_LOOKAHEAD = 32
+
+
+def estimate_volume_memory(nrays, ngates, nfields, bytes_per_gate=8):
+    """
+    Estimates the peak memory in bytes of running CMAC 2.0 on a volume.
+
+    Parameters
+    ----------
+    nrays, ngates : int
+        Shape of the radar volume.
+    nfields : int
+        Number of gate fields in the input radar file.
+
+    Other Parameters
+    ----------------
+    bytes_per_gate : int
+        Size of a gate value, CMAC works in float64.
+
+    Returns
+    -------
+    memory : float
+        Estimated peak memory in bytes.
+
+    """
+    gate_bytes = float(nrays) * float(ngates) * bytes_per_gate
+    return gate_bytes * (nfields + _CMAC_ADDED_FIELDS) * _WORK_FACTOR
+
+
+def read_volume_shape(radar_file):
+    """ Returns nrays, ngates, nfields and nsweeps of a CF/Radial file.
+    Only the dimensions and variable headers are read. """
+    import netCDF4
+    with netCDF4.Dataset(radar_file) as dataset:
+        nrays = len(dataset.dimensions['time'])
+        ngates = len(dataset.dimensions['range'])
+        nsweeps = len(dataset.dimensions['sweep'])
+        nfields = len([
+            var for var in dataset.variables.values()
+            if var.dimensions == ('time', 'range')])
+    return nrays, ngates, nfields, nsweeps
+
+
+def plan_volume_memory(entry, max_volume_memory=None):
+    """
+    Adds the estimated peak memory to a manifest entry. If the estimate is
+    above max_volume_memory, the entry is planned for sweep chunked
+    processing and its estimate is reduced to that of a chunk.
+    """
+    if entry.get('memory') is not None:
+        return entry
+    nrays, ngates, nfields, nsweeps = read_volume_shape(entry['radar_file'])
+    memory = estimate_volume_memory(nrays, ngates, nfields)
+    entry['sweeps_per_chunk'] = None
+    if max_volume_memory is not None and memory > max_volume_memory:
+        n_chunks = int(np.ceil(memory / max_volume_memory))
+        sweeps_per_chunk = max(1, nsweeps // n_chunks)
+        entry['sweeps_per_chunk'] = sweeps_per_chunk
+        memory = memory * sweeps_per_chunk / float(nsweeps)
+    entry['memory'] = memory
+    return entry
+
+
+class ProcessingManifest(object):
+    """
+    A processing manifest of radar volumes and their state.
+
+    Every entry is a dictionary with the keys radar_file, radar_time,
+    sonde_file, clutter_file, output_file, state, attempts, error,
+    started and finished. States are pending, running, done and failed.
+    When a path is given the manifest is written to disk as json, and
+    every state change is appended to a journal next to it, so a killed
+    run can be restarted from it. The journal is folded into the json
+    file once it holds as many changes as there are entries, which keeps
+    the cost of a state change constant for long manifests.
+
+    Parameters
+    ----------
+    entries : list
+        List of entry dictionaries.
+
+    Other Parameters
+    ----------------
+    path : str
+        Json file to save the manifest to.
+
+    """
+
+    def __init__(self, entries, path=None):
+        self.entries = entries
+        self.path = path
+        self.start_time = None
+        self._index = {id(entry): i for i, entry in enumerate(entries)}
+        self._journal_size = 0
+
+    @classmethod
+    def build(cls, radar_files, sonde_files, config, out_path,
+              clutter_file=None, radar_date_format=None,
+              sonde_date_format=None, overwrite=False, path=None):
+        """
+        Builds a manifest from lists of radar and sonde files.
+
+        Parameters
+        ----------
+        radar_files : list
+            Radar files to process.
+        sonde_files : list
+            Sonde files to match against the radar files by time.
+        config : str
+            Radar configuration name found in default_config.py.
+        out_path : str
+            Directory to write the CMAC radar files to. Files are placed
+            in monthly sub directories.
+
+        Other Parameters
+        ----------------
+        clutter_file : str
+            Clutter file to use for every radar volume.
+        radar_date_format, sonde_date_format : str
+            strptime formats of the file names, see parse_file_datetime.
+        overwrite : bool
+            If False, volumes with an existing output file are marked done.
+        path : str
+            Json file to save the manifest to.
+
+        Returns
+        -------
+        manifest : ProcessingManifest
+            The built manifest.
+
+        """
+        from .config import get_cmac_values
+        save_name = get_cmac_values(config)['save_name']
+        sonde_files = sorted(sonde_files)
+        sonde_times = [parse_file_datetime(x, sonde_date_format)
+                       for x in sonde_files]
+        entries = []
+        for radar_file in sorted(radar_files):
+            try:
+                radar_time = parse_file_datetime(
+                    radar_file, radar_date_format)
+            except ValueError:
+                print(radar_file + ' has no parsable date, skipping!')
+                continue
+            output_file = output_file_name(out_path, save_name, radar_time)
+            entry = make_entry(
+                radar_file, radar_time,
+                match_sonde(radar_time, sonde_times, sonde_files),
+                clutter_file, output_file, config)
+            if not overwrite and os.path.exists(output_file):
+                entry['state'] = STATE_DONE
+            entries.append(entry)
+        manifest = cls(entries, path=path)
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, path):
+        """ Loads a manifest from a json file and its journal. Entries
+        that were running when the previous run stopped are set back to
+        pending. """
+        with open(path, 'r') as infile:
+            entries = json.load(infile)
+        journal_path = path + '.journal'
+        if os.path.exists(journal_path):
+            with open(journal_path, 'r') as infile:
+                for line in infile:
+                    try:
+                        change = json.loads(line)
+                    except ValueError:
+                        # Last line cut short by a killed run.
+                        break
+                    entries[change['index']] = change['entry']
+        for entry in entries:
+            if entry['state'] == STATE_RUNNING:
+                entry['state'] = STATE_PENDING
+        manifest = cls(entries, path=path)
+        manifest.save()
+        return manifest
+
+    def save(self):
+        """ Writes the manifest to its json file, if it has one, and
+        empties the journal. """
+        if self.path is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as outfile:
+            json.dump(self.entries, outfile, indent=1)
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.path + '.journal'):
+            os.remove(self.path + '.journal')
+        self._journal_size = 0
+
+    def _record(self, entry):
+        """ Appends the new state of an entry to the journal. """
+        if self.path is None:
+            return
+        if self._journal_size >= len(self.entries):
+            self.save()
+            return
+        change = {'index': self._index[id(entry)], 'entry': entry}
+        with open(self.path + '.journal', 'a') as outfile:
+            outfile.write(json.dumps(change) + '\n')
+        self._journal_size += 1
+
+    def select(self, state):
+        """ Returns the entries in a given state. """
+        return [entry for entry in self.entries if entry['state'] == state]
+
+    def reset_failed(self):
+        """ Sets failed entries back to pending so they are retried. """
+        for entry in self.select(STATE_FAILED):
+            entry['state'] = STATE_PENDING
+            entry['attempts'] = 0
+        self.save()
+
+    def mark_running(self, entry):
+        entry['state'] = STATE_RUNNING
+        entry['attempts'] += 1
+        entry['started'] = time.time()
+        self._record(entry)
+
+    def mark_done(self, entry):
+        entry['state'] = STATE_DONE
+        entry['error'] = None
+        entry['finished'] = time.time()
+        self._record(entry)
+
+    def mark_failed(self, entry, error, retry=False):
+        """ Records an error for an entry. If retry is True the entry is
+        set back to pending. """
+        entry['state'] = STATE_PENDING if retry else STATE_FAILED
+        entry['error'] = error
+        entry['finished'] = time.time()
+        self._record(entry)
+
+    def summary(self):
+        """ Returns the number of entries in each state and the throughput
+        of the current run in volumes per hour. """
+        counts = {state: len(self.select(state)) for state in (
+            STATE_PENDING, STATE_RUNNING, STATE_DONE, STATE_FAILED)}
+        finished = [entry for entry in self.entries
+                    if entry['state'] == STATE_DONE
+                    and entry['finished'] is not None
+                    and self.start_time is not None
+                    and entry['finished'] >= self.start_time]
+        if finished:
+            elapsed = time.time() - self.start_time
+            counts['volumes_per_hour'] = len(finished) / elapsed * 3600.0
+        else:
+            counts['volumes_per_hour'] = 0.0
+        return counts
+
+    def report(self):
+        """ Prints a one line progress report. """
+        counts = self.summary()
+        print('## %d done, %d failed, %d pending, %d running, '
+              '%.1f volumes per hour' % (
+                  counts[STATE_DONE], counts[STATE_FAILED],
+                  counts[STATE_PENDING], counts[STATE_RUNNING],
+                  counts['volumes_per_hour']))
+
+
+def process_volume(entry, image_directory=None, meta_append='config',
+                   preprocess=None, sweep=None, products=None,
+                   stage_cache_dir=None, reference_gap=None,
+                   geometry_cache_dir=None):
+    """
+    Default processing function for a manifest entry. Reads the radar,
+    sonde and clutter files, runs CMAC 2.0, writes the CMAC radar and
+    produces the quicklooks.
+
+    Parameters
+    ----------
+    entry : dict
+        Manifest entry.
+
+    Other Parameters
+    ----------------
+    image_directory : str
+        Directory to save quicklooks in, if None no quicklooks are made.
+    meta_append : str
+        Passed on to cmac.
+    preprocess : function
+        Function taking and returning a radar object, applied before
+        CMAC 2.0. Used for radar specific fixes such as trimming gates.
+    sweep : int
+        Sweep to plot in the quicklooks.
+    products : list
+        CMAC products to compute, see cmac. Only the input fields and
+        these products are written, and only their quicklooks are made.
+        None computes and writes every product.
+    stage_cache_dir : str
+        Directory of the stage cache, see stage_cache.StageCache. Cached
+        stages are keyed on the radar, sonde and clutter files, so a
+        change of preprocess needs a new directory.
+    reference_gap : float
+        If given, the dealiased velocity of the last volume processed by
+        the worker is the dealiasing reference of volumes recorded up to
+        reference_gap seconds after it, see
+        velocity_reference.VelocityReference. Volumes are only processed
+        in time order by a single worker, so this is meant for one
+        worker.
+    geometry_cache_dir : str
+        Directory the gate coordinates of each scan layout are stored in
+        and memory mapped from by every worker, see
+        geometry_cache.GeometryCache.
+
+    """
+    import pyart
+    from .cmac_radar import cmac, cmac_chunked
+    from .cmac_ppi_quicklooks import quicklooks_ppi
+    from .pipeline import select_fields
+    from .stage_cache import StageCache, file_hash
+    from .worker_context import get_worker_context
+
+    # The clutter map and sondes are cached in the worker context, so
+    # they are only read once per worker process.
+    context = get_worker_context(entry['config'],
+                                 clutter_file=entry['clutter_file'])
+    radar = pyart.io.read(entry['radar_file'])
+    context.add_static_fields(radar)
+    if preprocess is not None:
+        radar = preprocess(radar)
+    sonde = context.open_sonde(entry['sonde_file'])
+    input_fields = list(radar.fields.keys())
+    stage_cache = None
+    if stage_cache_dir is not None:
+        stage_cache = StageCache(stage_cache_dir, input_hash=file_hash(
+            entry['radar_file'], entry['sonde_file'], entry['clutter_file']))
+    geometry_cache = None
+    if geometry_cache_dir is not None:
+        geometry_cache = context.geometry_cache(geometry_cache_dir)
+    velocity_reference = None
+    if reference_gap is not None:
+        velocity_reference = context.velocity_reference(reference_gap)
+    if entry.get('sweeps_per_chunk'):
+        cmac_radar = cmac_chunked(
+            radar, sonde, entry['config'],
+            sweeps_per_chunk=entry['sweeps_per_chunk'],
+            meta_append=meta_append, verbose=False, products=products,
+            stage_cache=stage_cache, velocity_reference=velocity_reference,
+            geometry_cache=geometry_cache)
+    else:
+        cmac_radar = cmac(radar, sonde, entry['config'],
+                          meta_append=meta_append, verbose=False,
+                          products=products, stage_cache=stage_cache,
+                          velocity_reference=velocity_reference,
+                          geometry_cache=geometry_cache)
+    select_fields(cmac_radar, products, input_fields)
+    out_dir = os.path.dirname(entry['output_file'])
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+    # Write to a temporary name and rename, so the product is published
+    # atomically and consumers never see a partially written file.
+    part_file = entry['output_file'] + '.part'
+    pyart.io.write_cfradial(part_file, cmac_radar)
+    os.replace(part_file, entry['output_file'])
+    if image_directory is not None:
+        img_directory = os.path.join(
+            image_directory, os.path.basename(out_dir))
+        os.makedirs(img_directory, exist_ok=True)
+        quicklooks_ppi(cmac_radar, entry['config'], sweep=sweep,
+                       image_directory=img_directory, dd_lobes=False)
+    del cmac_radar
+    context.finish_volume()
+
+
+def _run_entry(process_func, entry, kwargs, transient_errors):
+    """ Runs process_func on an entry, returning the outcome instead of
+    raising so a single bad volume does not take down the worker. """
+    try:
+        process_func(entry, **kwargs)
+    except transient_errors as err:
+        return {'ok': False, 'transient': True,
+                'error': repr(err) + '\n' + traceback.format_exc()}
+    except Exception as err:
+        return {'ok': False, 'transient': False,
+                'error': repr(err) + '\n' + traceback.format_exc()}
+    return {'ok': True, 'transient': False, 'error': None}
+
+
+def _next_entry(queue, in_flight, memory_budget, max_volume_memory):
+    """ Pops the first queued entry whose estimated memory fits in what is
+    left of the memory budget, or None if no entry fits. Without a budget
+    the first entry is popped, planned for sweep chunks if it is estimated
+    above max_volume_memory. """
+    if memory_budget is None:
+        entry = queue.pop(0)
+        if max_volume_memory is not None:
+            _plan_entry(entry, max_volume_memory)
+        return entry
+    used = sum([entry['memory'] for entry in in_flight.values()])
+    for i, entry in enumerate(queue[:_LOOKAHEAD]):
+        _plan_entry(entry, max_volume_memory)
+        if not in_flight or used + entry['memory'] <= memory_budget:
+            return queue.pop(i)
+    return None
+
+
+def _plan_entry(entry, max_volume_memory):
+    try:
+        plan_volume_memory(entry, max_volume_memory)
+    except (OSError, KeyError, TypeError):
+        # Unreadable or not CF/Radial header, let the worker read the
+        # file and report any error.
+        entry['memory'] = 0.0
+        entry['sweeps_per_chunk'] = None
+
+
+def run_manifest(manifest, process_func=process_volume, client=None,
+                 n_workers=4, max_retries=2,
+                 transient_errors=(TimeoutError, ConnectionError,
+                                   BlockingIOError, InterruptedError),
+                 memory_budget=None, max_volume_memory=None,
+                 report_every=10, **kwargs):
+    """
+    Processes every pending entry of a manifest.
+
+    Parameters
+    ----------
+    manifest : ProcessingManifest
+        Manifest to process, its state is updated as volumes finish.
+
+    Other Parameters
+    ----------------
+    process_func : function
+        Function called with each entry and kwargs. Defaults to
+        process_volume.
+    client : distributed.Client
+        An existing dask client to submit to. If None, a local process
+        pool with n_workers processes is used.
+    n_workers : int
+        Number of processes in the local pool. Ignored when a client is
+        given, the number of dask worker threads is used instead.
+    max_retries : int
+        Number of times a volume failing with a transient error is
+        resubmitted.
+    transient_errors : tuple
+        Exception types treated as transient, such as network file system
+        timeouts. Missing or corrupt files are not retried, so OSError as
+        a whole is not transient by default.
+    memory_budget : float
+        Memory in bytes available to the workers. When given, the peak
+        memory of each volume is estimated from its shape and volumes are
+        only started while the estimates of the volumes in flight fit in
+        the budget. A single volume is always allowed to run.
+    max_volume_memory : float
+        Volumes estimated above this are processed in sweep chunks, with
+        or without a memory_budget. Defaults to memory_budget.
+    report_every : int
+        Print a progress report every report_every finished volumes.
+
+    Returns
+    -------
+    summary : dict
+        Counts of entries in each state and the throughput.
+
+    """
+    manifest.start_time = time.time()
+    if client is None:
+        executor = ProcessPoolExecutor(max_workers=n_workers)
+        wait_func = futures_wait
+    else:
+        from distributed import wait as dask_wait
+        executor = None
+        n_workers = sum(client.nthreads().values())
+        wait_func = dask_wait
+
+    def restart_pool():
+        nonlocal executor
+        print('## Worker pool broken, restarting it')
+        executor.shutdown(wait=False)
+        executor = ProcessPoolExecutor(max_workers=n_workers)
+
+    def submit(entry):
+        if executor is None:
+            return client.submit(_run_entry, process_func, entry, kwargs,
+                                 transient_errors, pure=False)
+        try:
+            future = executor.submit(_run_entry, process_func, entry,
+                                     kwargs, transient_errors)
+        except BrokenProcessPool:
+            restart_pool()
+            future = executor.submit(_run_entry, process_func, entry,
+                                     kwargs, transient_errors)
+        pools[future] = executor
+        return future
+
+    if max_volume_memory is None:
+        max_volume_memory = memory_budget
+
+    # Only n_workers volumes are in flight at a time, so the running
+    # state in the manifest reflects the volumes actually being worked on.
+    queue = manifest.select(STATE_PENDING)
+    in_flight = {}
+    pools = {}
+    finished = 0
+    try:
+        while queue or in_flight:
+            while queue and len(in_flight) < n_workers:
+                entry = _next_entry(queue, in_flight, memory_budget,
+                                    max_volume_memory)
+                if entry is None:
+                    break
+                manifest.mark_running(entry)
+                in_flight[submit(entry)] = entry
+            done, _ = wait_func(list(in_flight.keys()),
+                                return_when='FIRST_COMPLETED')
+            for future in done:
+                entry = in_flight.pop(future)
+                pool = pools.pop(future, None)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as err:
+                    # A worker died, such as an OOM kill, and took the
+                    # pool and every volume in flight down with it. The
+                    # volume that killed it is not known, so they are all
+                    # retried in a new pool.
+                    if pool is executor:
+                        restart_pool()
+                    result = {'ok': False, 'transient': True,
+                              'error': repr(err)}
+                except Exception as err:
+                    result = {'ok': False, 'transient': True,
+                              'error': repr(err)}
+                if result['ok']:
+                    manifest.mark_done(entry)
+                else:
+                    retry = (result['transient']
+                             and entry['attempts'] <= max_retries)
+                    manifest.mark_failed(entry, result['error'], retry=retry)
+                    if retry:
+                        queue.append(entry)
+                    print('## ' + entry['radar_file'] + ' failed: '
+                          + result['error'].split('\n')[0])
+                finished += 1
+                if finished % report_every == 0:
+                    manifest.report()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        manifest.save()
+    manifest.report()
+    return manifest.summary()
+
+
+def find_files(path, pattern='*'):
+    """ Returns the sorted list of files matching pattern, searching
+    path recursively. If path is a text file, each line is a file. """
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, '**', pattern),
+                                recursive=True))
+    elif os.path.isfile(path):
+        with open(path) as infile:
+            return sorted([x.strip() for x in infile.readlines()
+                           if x.strip()])
+    return sorted(glob.glob(path))
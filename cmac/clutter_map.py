@@ -0,0 +1,187 @@
+""" Clutter and terrain blockage maps aligned with the rays of each volume.
+A map, such as the ground_clutter field of tall_clutter or a cbb_flag file,
+is indexed once on a regular grid of scan angles per sweep. Volumes are
+then mapped through a nearest ray and nearest gate lookup, computed once
+per scan layout, so pointing jitter, missing rays, missing sweeps and a
+different ray order are handled at the cost of one indexing per field. """
+
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+
+from .sweep_filters import nearest_index, sweep_slices
+
+
+class ClutterMap(object):
+    """
+    Static fields of a radar indexed by sweep, scan angle and range.
+
+    Parameters
+    ----------
+    fields : dict
+        Fields of the map, each a dict with a data array of shape
+        (nrays, ngates) of the map radar.
+    fixed_angles : array
+        Fixed angle of each sweep of the map.
+    ray_angles : array
+        Azimuth, or elevation for RHIs, of each ray of the map.
+    sweeps : list
+        (start, end) ray index pairs of the sweeps of the map, end
+        exclusive.
+    ranges : array
+        Range of the gates of the map.
+
+    Other Parameters
+    ----------------
+    resolution : float
+        Width in degrees of the scan angle bins. Defaults to a tenth of
+        the median ray spacing of the map, so a ray is mapped to the map
+        ray nearest to it within a twentieth of the spacing.
+    ray_tolerance : float
+        Largest difference in degrees between a bin and the nearest map
+        ray for the ray to be used. Defaults to the median ray spacing.
+    angle_tolerance : float
+        Largest difference in degrees between the fixed angles of a volume
+        sweep and a map sweep.
+    fill_value : float or 'maximum'
+        Value of the gates of rays, sweeps or ranges the map does not
+        cover. 'maximum' fills the rays the map does not cover with the
+        maximum of the map rays at each gate, and the gates beyond its
+        range with the maximum of the field, the conservative choice for
+        flags such as cbb_flag.
+    max_layouts : int
+        Number of scan layouts whose lookups are kept.
+
+    """
+
+    def __init__(self, fields, fixed_angles, ray_angles, sweeps, ranges,
+                 resolution=None, ray_tolerance=None, angle_tolerance=0.5,
+                 fill_value=0, max_layouts=8):
+        self.fields = fields
+        self.fixed_angles = np.asarray(fixed_angles, dtype=float)
+        self.ranges = np.asarray(ranges, dtype=float)
+        self.angle_tolerance = angle_tolerance
+        self.fill_value = fill_value
+        self.max_layouts = max_layouts
+        ray_angles = np.mod(np.asarray(ray_angles, dtype=float), 360.0)
+        spacing = [np.median(np.abs(np.diff(ray_angles[start:end])))
+                   for start, end in sweeps if end - start > 1]
+        spacing = float(np.median(spacing)) if spacing else 1.0
+        if resolution is None:
+            resolution = spacing / 10.0
+        if ray_tolerance is None:
+            ray_tolerance = spacing
+        self.resolution = resolution
+        self.n_bins = int(round(360.0 / resolution))
+
+        # Map ray of every scan angle bin of every sweep, -1 where no ray
+        # is within ray_tolerance.
+        centers = np.arange(self.n_bins) * 360.0 / self.n_bins
+        self.index = np.full((len(sweeps), self.n_bins), -1, dtype=np.intp)
+        for sweep, (start, end) in enumerate(sweeps):
+            order = np.argsort(ray_angles[start:end], kind='stable')
+            nearest = nearest_index(ray_angles[start:end][order], centers,
+                                    ray_tolerance, circular=True)
+            self.index[sweep] = np.where(nearest < 0, -1,
+                                         start + order[nearest])
+        self._layouts = OrderedDict()
+
+    @classmethod
+    def from_radar(cls, radar, fields=('ground_clutter',), **kwargs):
+        """ Map of fields of a radar. Keyword arguments are passed on to
+        ClutterMap. """
+        return cls({name: radar.fields[name] for name in fields},
+                   radar.fixed_angle['data'], _ray_angles(radar),
+                   sweep_slices(radar), radar.range['data'], **kwargs)
+
+    @classmethod
+    def from_file(cls, filename, fields=('ground_clutter',), **kwargs):
+        """ Map of fields of a CF/Radial file. Keyword arguments are passed
+        on to ClutterMap. """
+        import pyart
+        radar = pyart.io.read(filename, include_fields=list(fields))
+        return cls.from_radar(radar, fields=fields, **kwargs)
+
+    def key(self, radar):
+        """ SHA1 hash of the scan layout of a radar, the fixed angles and
+        sweeps, the scan angle bins of the rays and the ranges. """
+        sha = hashlib.sha1()
+        for data in (radar.fixed_angle['data'],
+                     radar.sweep_start_ray_index['data'],
+                     self._bins(radar), radar.range['data']):
+            sha.update(np.ascontiguousarray(data, dtype='float64').tobytes())
+        return sha.hexdigest()
+
+    def _bins(self, radar):
+        return np.round(_ray_angles(radar) * self.n_bins / 360.0).astype(
+            np.intp) % self.n_bins
+
+    def lookup(self, radar):
+        """
+        Map ray and gate of each ray and gate of a radar.
+
+        Returns
+        -------
+        rays : array
+            Map ray nearest to each ray of the radar, -1 where the map
+            has no sweep of the same fixed angle or no ray close enough.
+        gates : array
+            Map gate nearest to each gate of the radar, -1 beyond half a
+            gate of the map range.
+
+        """
+        key = self.key(radar)
+        if key in self._layouts:
+            self._layouts.move_to_end(key)
+            return self._layouts[key]
+        bins = self._bins(radar)
+        rays = np.full(radar.nrays, -1, dtype=np.intp)
+        for sweep, (start, end) in enumerate(sweep_slices(radar)):
+            diff = np.abs(self.fixed_angles - radar.fixed_angle['data'][sweep])
+            if len(diff) == 0 or diff.min() > self.angle_tolerance:
+                continue
+            rays[start:end] = self.index[diff.argmin(), bins[start:end]]
+        if len(self.ranges) > 1:
+            gate_spacing = np.median(np.diff(self.ranges))
+        else:
+            gate_spacing = np.inf
+        gates = nearest_index(self.ranges, radar.range['data'],
+                              gate_spacing / 2.0)
+        self._layouts[key] = (rays, gates)
+        if len(self._layouts) > self.max_layouts:
+            self._layouts.popitem(last=False)
+        return rays, gates
+
+    def field_for(self, radar, name):
+        """ Field of the map aligned with the rays and gates of a radar,
+        fill_value where the map does not cover them. """
+        rays, gates = self.lookup(radar)
+        field = self.fields[name]
+        map_data = np.ma.asanyarray(field['data'])
+        data = map_data[np.maximum(rays, 0)][:, np.maximum(gates, 0)]
+        if self.fill_value == 'maximum':
+            data[rays < 0] = map_data.max(axis=0)[np.maximum(gates, 0)]
+            data[:, gates < 0] = map_data.max()
+        else:
+            data[rays < 0] = self.fill_value
+            data[:, gates < 0] = self.fill_value
+        new_field = {key: value for key, value in field.items()
+                     if key != 'data'}
+        new_field['data'] = data
+        return new_field
+
+    def add_fields(self, radar):
+        """ Adds every field of the map, aligned, to a radar. """
+        for name in self.fields:
+            radar.add_field(name, self.field_for(radar, name),
+                            replace_existing=True)
+        return radar
+
+
+def _ray_angles(radar):
+    """ Azimuth of the rays, or elevation for RHIs. """
+    if radar.scan_type == 'rhi':
+        return np.mod(np.asarray(radar.elevation['data'], dtype=float),
+                      360.0)
+    return np.mod(np.asarray(radar.azimuth['data'], dtype=float), 360.0)
@@ -2,7 +2,6 @@
 
 import os
 from datetime import datetime
-import operator
 
 import cartopy.crs as ccrs
 import netCDF4
@@ -15,6 +14,7 @@ from pyart.graph.common import (
     generate_radar_name, generate_radar_time_begin)
 
 from .config import get_plot_values, get_field_names
+from .gate_categories import get_gate_categories
 
 plt.switch_backend('agg')
 
@@ -111,491 +111,508 @@ def quicklooks_ppi(radar, config, sweep=None, image_directory=None,
         else:
             sweep = plot_config['sweep']
 
-    # Plot of the raw reflectivity from the radar.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, 
-                           subplot_kw=dict(projection=ccrs.PlateCarree()), 
-                           figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map(field_config['reflectivity'], sweep=sweep, resolution='50m', ax=ax,
-                         vmin=-8, vmax=64, mask_outside=False,
-                         cmap=pyart.graph.cm_colorblind.HomeyerRainbow,
-                         min_lat=min_lat, min_lon=min_lon,
-                         max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
+    # Gate filter of the rain, melting and snow gates, for the plots
+    # masked with it. Plots are only made for the fields in the radar,
+    # so runs of cmac with a subset of the products plot only those.
+    if 'gate_id' in radar.fields:
+        categories = get_gate_categories(radar)
+        cmac_gates = categories.gatefilter(
+            radar, ['rain', 'melting', 'snow'])
 
-    fig.savefig(
-        image_directory
-        + '/reflectivity' + combined_name + '.png')
-    del fig, ax
+    # Plot of the raw reflectivity from the radar.
+    if _has_fields(radar, [field_config['reflectivity']]):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, 
+                               subplot_kw=dict(projection=ccrs.PlateCarree()), 
+                               figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map(field_config['reflectivity'], sweep=sweep, resolution='50m', ax=ax,
+                             vmin=-8, vmax=64, mask_outside=False,
+                             cmap=pyart.graph.cm_colorblind.HomeyerRainbow,
+                             min_lat=min_lat, min_lon=min_lon,
+                             max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+
+        fig.savefig(
+            image_directory
+            + '/reflectivity' + combined_name + '.png')
+        del fig, ax
 
     # Four panel plot of gate_id, velocity_texture, reflectivity, and
     # cross_correlation_ratio.
-    cat_dict = {}
-    print('##')
-    print('## Keys for each gate id are as follows:')
-    for pair_str in radar.fields['gate_id']['notes'].split(','):
-        print('##   ', str(pair_str))
-        cat_dict.update({pair_str.split(':')[1]:int(pair_str.split(':')[0])})
-    sorted_cats = sorted(cat_dict.items(), key=operator.itemgetter(1))
-    cat_colors = {'rain': 'green',
-                  'multi_trip': 'red',
-                  'no_scatter': 'gray',
-                  'snow': 'cyan',
-                  'melting': 'yellow'}
-    lab_colors = ['red', 'cyan', 'grey', 'green', 'yellow']
-    #if 'ground_clutter' in radar.fields.keys():
-    cat_colors['clutter'] = 'black'
-    lab_colors = np.append(lab_colors, 'black')
-    if 'terrain_blockage' in radar.fields['gate_id']['notes']:
-        cat_colors['terrain_blockage'] = 'brown'
-        lab_colors = np.append(lab_colors, 'brown')
-    lab_colors = [cat_colors[kitty[0]] for kitty in sorted_cats]
-    cmap = matplotlib.colors.ListedColormap(lab_colors)
-
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(2, 2,
-              figsize=[15, 10], subplot_kw=dict(projection=ccrs.PlateCarree()))
-    ax[0, 0].set_aspect('auto')
-    display.plot_ppi_map('gate_id', sweep=sweep, min_lon=min_lon, ax=ax[0, 0],
-                         max_lon=max_lon, min_lat=min_lat,
-                         max_lat=max_lat, resolution='50m',
-                         lat_lines=lal, lon_lines=lol, cmap=cmap,
-                         vmin=0, vmax=6, projection=ccrs.PlateCarree())
-
-    if dd_lobes:
-        ax[0, 0].contour(grid_lon, grid_lat, bca,
-                        levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                        colors='k')
-
-    cbax = ax[0, 0]
-    if 'ground_clutter' in radar.fields.keys() or 'terrain_blockage' in radar.fields['gate_id']['notes']:
-        tick_locs = np.linspace(
-            0, len(sorted_cats) - 1, len(sorted_cats)) + 0.5
-    else:
-        tick_locs = np.linspace(
-            0, len(sorted_cats), len(sorted_cats)) + 0.5
-    display.cbs[-1].locator = matplotlib.ticker.FixedLocator(tick_locs)
-    catty_list = [sorted_cats[i][0] for i in range(len(sorted_cats))]
-    display.cbs[-1].formatter = matplotlib.ticker.FixedFormatter(catty_list)
-    display.cbs[-1].update_ticks()
-    ax[0, 1].set_aspect('auto')
-    display.plot_ppi_map(field_config['reflectivity'], sweep=sweep, vmin=-8, vmax=40.0, 
-                         ax=ax[0, 1], min_lon=min_lon, max_lon=max_lon,
-                         min_lat=min_lat,
-                         max_lat=max_lat, lat_lines=lal, lon_lines=lol,
-                         resolution='50m',
-                         cmap=pyart.graph.cm_colorblind.HomeyerRainbow,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax[0, 1].contour(grid_lon, grid_lat, bca,
-                        levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                        colors='k')
-    ax[1, 0].set_aspect('auto')
-    display.plot_ppi_map('velocity_texture', sweep=sweep, vmin=0, vmax=14,
-                         min_lon=min_lon, max_lon=max_lon, min_lat=min_lat,
-                         max_lat=max_lat, lat_lines=lal, lon_lines=lol,
-                         resolution='50m', ax=ax[1, 0],
-                         title=_generate_title(
-                             radar, 'velocity_texture', sweep),
-                         cmap=pyart.graph.cm.NWSRef,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax[1, 0].contour(grid_lon, grid_lat, bca, latlon='True',
-                        levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                         colors='k')
+    if _has_fields(radar, [
+            'gate_id',
+            field_config['reflectivity'],
+            'velocity_texture',
+            field_config['cross_correlation_ratio']]):
+        print('##')
+        print('## Keys for each gate id are as follows:')
+        for pair_str in categories.notes.split(','):
+            print('##   ', str(pair_str))
+        sorted_cats = categories.sorted_items()
+        lab_colors = categories.color_list()
+        cmap = matplotlib.colors.ListedColormap(lab_colors)
+
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(2, 2,
+                  figsize=[15, 10], subplot_kw=dict(projection=ccrs.PlateCarree()))
+        ax[0, 0].set_aspect('auto')
+        display.plot_ppi_map('gate_id', sweep=sweep, min_lon=min_lon, ax=ax[0, 0],
+                             max_lon=max_lon, min_lat=min_lat,
+                             max_lat=max_lat, resolution='50m',
+                             lat_lines=lal, lon_lines=lol, cmap=cmap,
+                             vmin=0, vmax=6, projection=ccrs.PlateCarree())
+
+        if dd_lobes:
+            ax[0, 0].contour(grid_lon, grid_lat, bca,
+                            levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                            colors='k')
+
+        cbax = ax[0, 0]
+        if 'ground_clutter' in radar.fields.keys() or 'terrain_blockage' in categories:
+            tick_locs = np.linspace(
+                0, len(sorted_cats) - 1, len(sorted_cats)) + 0.5
+        else:
+            tick_locs = np.linspace(
+                0, len(sorted_cats), len(sorted_cats)) + 0.5
+        display.cbs[-1].locator = matplotlib.ticker.FixedLocator(tick_locs)
+        catty_list = [sorted_cats[i][0] for i in range(len(sorted_cats))]
+        display.cbs[-1].formatter = matplotlib.ticker.FixedFormatter(catty_list)
+        display.cbs[-1].update_ticks()
+        ax[0, 1].set_aspect('auto')
+        display.plot_ppi_map(field_config['reflectivity'], sweep=sweep, vmin=-8, vmax=40.0, 
+                             ax=ax[0, 1], min_lon=min_lon, max_lon=max_lon,
+                             min_lat=min_lat,
+                             max_lat=max_lat, lat_lines=lal, lon_lines=lol,
+                             resolution='50m',
+                             cmap=pyart.graph.cm_colorblind.HomeyerRainbow,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax[0, 1].contour(grid_lon, grid_lat, bca,
+                            levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                            colors='k')
+        ax[1, 0].set_aspect('auto')
+        display.plot_ppi_map('velocity_texture', sweep=sweep, vmin=0, vmax=14,
+                             min_lon=min_lon, max_lon=max_lon, min_lat=min_lat,
+                             max_lat=max_lat, lat_lines=lal, lon_lines=lol,
+                             resolution='50m', ax=ax[1, 0],
+                             title=_generate_title(
+                                 radar, 'velocity_texture', sweep),
+                             cmap=pyart.graph.cm.NWSRef,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax[1, 0].contour(grid_lon, grid_lat, bca, latlon='True',
+                            levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                             colors='k')
     
-    rhv_field = field_config['cross_correlation_ratio']
-    ax[1, 1].set_aspect('auto')
-    display.plot_ppi_map(rhv_field, sweep=sweep, vmin=.5,
-                         vmax=1, min_lon=min_lon, max_lon=max_lon,
-                         min_lat=min_lat, max_lat=max_lat, lat_lines=lal,
-                         lon_lines=lol, resolution='50m', ax=ax[1, 1],
-                         cmap=pyart.graph.cm.Carbone42,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax[1, 1].contour(grid_lon, grid_lat, bca,
-                        levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                        colors='k')
-    fig.savefig(
-        image_directory
-        + '/cmac_four_panel_plot' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+        rhv_field = field_config['cross_correlation_ratio']
+        ax[1, 1].set_aspect('auto')
+        display.plot_ppi_map(rhv_field, sweep=sweep, vmin=.5,
+                             vmax=1, min_lon=min_lon, max_lon=max_lon,
+                             min_lat=min_lat, max_lat=max_lat, lat_lines=lal,
+                             lon_lines=lol, resolution='50m', ax=ax[1, 1],
+                             cmap=pyart.graph.cm.Carbone42,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax[1, 1].contour(grid_lon, grid_lat, bca,
+                            levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                            colors='k')
+        fig.savefig(
+            image_directory
+            + '/cmac_four_panel_plot' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot with reflectivity corrected with gate ids.
-    cmac_gates = pyart.correct.GateFilter(radar)
-    cmac_gates.exclude_all()
-    cmac_gates.include_equal('gate_id', cat_dict['rain'])
-    cmac_gates.include_equal('gate_id', cat_dict['melting'])
-    cmac_gates.include_equal('gate_id', cat_dict['snow'])
-
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map(field_config['reflectivity'],
-                         sweep=sweep, resolution='50m',
-                         vmin=-8, vmax=40, mask_outside=False,
-                         cmap=pyart.graph.cm_colorblind.HomeyerRainbow,
-                         title=_generate_title(
-                             radar, 'masked_corrected_reflectivity',
-                             sweep), ax=ax,
-                         min_lat=min_lat, min_lon=min_lon,
-                         max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol,
-                         gatefilter=cmac_gates,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
-    fig.savefig(
-        image_directory
-        + '/masked_corrected_reflectivity' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, [field_config['reflectivity'], 'gate_id']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map(field_config['reflectivity'],
+                             sweep=sweep, resolution='50m',
+                             vmin=-8, vmax=40, mask_outside=False,
+                             cmap=pyart.graph.cm_colorblind.HomeyerRainbow,
+                             title=_generate_title(
+                                 radar, 'masked_corrected_reflectivity',
+                                 sweep), ax=ax,
+                             min_lat=min_lat, min_lon=min_lon,
+                             max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol,
+                             gatefilter=cmac_gates,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+        fig.savefig(
+            image_directory
+            + '/masked_corrected_reflectivity' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
 
     # Creating a plot with reflectivity corrected with attenuation.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                           figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('corrected_reflectivity', sweep=sweep,
-                         vmin=0, vmax=40.0, resolution='50m',
-                         title=_generate_title(
-                             radar, 'corrected_reflectivity',
-                             sweep),
-                         cmap=pyart.graph.cm_colorblind.HomeyerRainbow,
-                         min_lat=min_lat, min_lon=min_lon,
-                         max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol, ax=ax,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
-    fig.savefig(
-        image_directory
-        + '/corrected_reflectivity' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, ['corrected_reflectivity']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                               figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('corrected_reflectivity', sweep=sweep,
+                             vmin=0, vmax=40.0, resolution='50m',
+                             title=_generate_title(
+                                 radar, 'corrected_reflectivity',
+                                 sweep),
+                             cmap=pyart.graph.cm_colorblind.HomeyerRainbow,
+                             min_lat=min_lat, min_lon=min_lon,
+                             max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol, ax=ax,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+        fig.savefig(
+            image_directory
+            + '/corrected_reflectivity' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot with differential phase.
-    phase_field = field_config['input_phidp_field']
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map(phase_field, sweep=sweep,
-                         resolution='50m', ax=ax,
-                         min_lat=min_lat, min_lon=min_lon,
-                         max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol,
-                         projection=ccrs.PlateCarree())
-    fig.savefig(
-        image_directory
-        + '/differential_phase' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, [field_config['input_phidp_field']]):
+        phase_field = field_config['input_phidp_field']
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map(phase_field, sweep=sweep,
+                             resolution='50m', ax=ax,
+                             min_lat=min_lat, min_lon=min_lon,
+                             max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol,
+                             projection=ccrs.PlateCarree())
+        fig.savefig(
+            image_directory
+            + '/differential_phase' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
 
     # Creating a plot of specific attenuation.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('specific_attenuation', sweep=sweep, vmin=0,
-                         vmax=1.0, resolution='50m', ax=ax,
-                         min_lat=min_lat, min_lon=min_lon,
-                         max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                    levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                    colors='k')
-    fig.savefig(
-        image_directory
-        + '/specific_attenuation' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, ['specific_attenuation']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('specific_attenuation', sweep=sweep, vmin=0,
+                             vmax=1.0, resolution='50m', ax=ax,
+                             min_lat=min_lat, min_lon=min_lon,
+                             max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                        levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                        colors='k')
+        fig.savefig(
+            image_directory
+            + '/specific_attenuation' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot of corrected differential phase.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('corrected_differential_phase', sweep=sweep,
-                         title=_generate_title(
-                             radar, 'corrected_differential_phase',
-                             sweep), ax=ax,
-                         resolution='50m', min_lat=min_lat,
-                         min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
-    fig.savefig(
-        image_directory
-        + '/corrected_differential_phase' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, ['corrected_differential_phase']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('corrected_differential_phase', sweep=sweep,
+                             title=_generate_title(
+                                 radar, 'corrected_differential_phase',
+                                 sweep), ax=ax,
+                             resolution='50m', min_lat=min_lat,
+                             min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+        fig.savefig(
+            image_directory
+            + '/corrected_differential_phase' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot of corrected specific differential phase.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('corrected_specific_diff_phase', sweep=sweep,
-                         vmin=0, vmax=6, resolution='50m',
-                         title=_generate_title(
-                             radar, 'corrected_specific_diff_phase',
-                             sweep), ax=ax,
-                         min_lat=min_lat, min_lon=min_lon, max_lat=max_lat,
-                         max_lon=max_lon, lat_lines=lal, lon_lines=lol,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
-    fig.savefig(
-        image_directory
-        + '/corrected_specific_diff_phase' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, ['corrected_specific_diff_phase']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('corrected_specific_diff_phase', sweep=sweep,
+                             vmin=0, vmax=6, resolution='50m',
+                             title=_generate_title(
+                                 radar, 'corrected_specific_diff_phase',
+                                 sweep), ax=ax,
+                             min_lat=min_lat, min_lon=min_lon, max_lat=max_lat,
+                             max_lon=max_lon, lat_lines=lal, lon_lines=lol,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+        fig.savefig(
+            image_directory
+            + '/corrected_specific_diff_phase' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot with region dealias corrected velocity.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('corrected_velocity', sweep=sweep, resolution='50m',
-                         cmap=pyart.graph.cm.NWSVel, vmin=-30, ax=ax,
-                         vmax=30, min_lat=min_lat, min_lon=min_lon,
-                         max_lat=max_lat, max_lon=max_lon, lat_lines=lal,
-                         lon_lines=lol, projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
-    fig.savefig(
-        image_directory
-        + '/corrected_velocity' + combined_name + '.png')
-    plt.close(fig) 
-    del fig, ax, display
+    if _has_fields(radar, ['corrected_velocity']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('corrected_velocity', sweep=sweep, resolution='50m',
+                             cmap=pyart.graph.cm.NWSVel, vmin=-30, ax=ax,
+                             vmax=30, min_lat=min_lat, min_lon=min_lon,
+                             max_lat=max_lat, max_lon=max_lon, lat_lines=lal,
+                             lon_lines=lol, projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+        fig.savefig(
+            image_directory
+            + '/corrected_velocity' + combined_name + '.png')
+        plt.close(fig) 
+        del fig, ax, display
 
     # Creating a plot of rain rate A
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('rain_rate_A', sweep=sweep, resolution='50m',
-                         vmin=0, vmax=120, min_lat=min_lat, min_lon=min_lon,
-                         max_lat=max_lat, ax=ax, max_lon=max_lon, lat_lines=lal,
-                         lon_lines=lol, projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
-    fig.savefig(
-        image_directory
-        + '/rain_rate_A' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, ['rain_rate_A']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('rain_rate_A', sweep=sweep, resolution='50m',
+                             vmin=0, vmax=120, min_lat=min_lat, min_lon=min_lon,
+                             max_lat=max_lat, ax=ax, max_lon=max_lon, lat_lines=lal,
+                             lon_lines=lol, projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+        fig.savefig(
+            image_directory
+            + '/rain_rate_A' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot of snowfall rate from Wolf and Snider
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('snow_rate_ws2012', sweep=sweep, resolution='50m',
-                         vmin=0, vmax=50, min_lat=min_lat, min_lon=min_lon,
-                         max_lat=max_lat, ax=ax, max_lon=max_lon, lat_lines=lal,
-                         lon_lines=lol, projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
-    fig.savefig(
-        image_directory
-        + '/snow_rate_ws2012' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, ['snow_rate_ws2012']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('snow_rate_ws2012', sweep=sweep, resolution='50m',
+                             vmin=0, vmax=50, min_lat=min_lat, min_lon=min_lon,
+                             max_lat=max_lat, ax=ax, max_lon=max_lon, lat_lines=lal,
+                             lon_lines=lol, projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+        fig.savefig(
+            image_directory
+            + '/snow_rate_ws2012' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot of filtered corrected differential phase.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('filtered_corrected_differential_phase', sweep=sweep,
-                         title=_generate_title(
-                             radar, 'filtered_corrected_differential_phase',
-                             sweep),
-                         resolution='50m', min_lat=min_lat, ax=ax,
-                         min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol,
-                         cmap=pyart.graph.cm.Theodore16,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                    levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                    colors='k')
-    fig.savefig(
-        image_directory
-        + '/filtered_corrected_differential_phase' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, ['filtered_corrected_differential_phase']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('filtered_corrected_differential_phase', sweep=sweep,
+                             title=_generate_title(
+                                 radar, 'filtered_corrected_differential_phase',
+                                 sweep),
+                             resolution='50m', min_lat=min_lat, ax=ax,
+                             min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol,
+                             cmap=pyart.graph.cm.Theodore16,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                        levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                        colors='k')
+        fig.savefig(
+            image_directory
+            + '/filtered_corrected_differential_phase' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot of filtered corrected specific differential phase.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('filtered_corrected_specific_diff_phase', sweep=sweep,
-                         title=_generate_title(
-                             radar, 'filtered_corrected_specific_diff_phase',
-                             sweep), ax=ax,
-                         resolution='50m', min_lat=min_lat,
-                         min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol,
-                         cmap=pyart.graph.cm.Theodore16,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                    levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                    colors='k')
-    fig.savefig(
-        image_directory
-        + '/filtered_corrected_specific_diff_phase' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, ['filtered_corrected_specific_diff_phase']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('filtered_corrected_specific_diff_phase', sweep=sweep,
+                             title=_generate_title(
+                                 radar, 'filtered_corrected_specific_diff_phase',
+                                 sweep), ax=ax,
+                             resolution='50m', min_lat=min_lat,
+                             min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol,
+                             cmap=pyart.graph.cm.Theodore16,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                        levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                        colors='k')
+        fig.savefig(
+            image_directory
+            + '/filtered_corrected_specific_diff_phase' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot of corrected differential phase.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('specific_differential_attenuation', sweep=sweep,
-                         title=_generate_title(
-                             radar, 'specific_differential_attenuation',
-                             sweep), ax=ax,
-                         resolution='50m', min_lat=min_lat,
-                         min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol, gatefilter=cmac_gates,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
-    fig.savefig(
-        image_directory
-        + '/specific_differential_attenuation' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, ['specific_differential_attenuation', 'gate_id']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('specific_differential_attenuation', sweep=sweep,
+                             title=_generate_title(
+                                 radar, 'specific_differential_attenuation',
+                                 sweep), ax=ax,
+                             resolution='50m', min_lat=min_lat,
+                             min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol, gatefilter=cmac_gates,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+        fig.savefig(
+            image_directory
+            + '/specific_differential_attenuation' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot of corrected differential phase.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('path_integrated_differential_attenuation',
-                         sweep=sweep,
-                         title=_generate_title(
-                             radar, 'path_integrated_differential_attenuation',
-                             sweep), ax=ax,
-                         resolution='50m', min_lat=min_lat,
-                         min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol, gatefilter=cmac_gates,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
-    fig.savefig(
-        image_directory
-        + '/path_integrated_differential_attenuation' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, [
+            'path_integrated_differential_attenuation',
+            'gate_id']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('path_integrated_differential_attenuation',
+                             sweep=sweep,
+                             title=_generate_title(
+                                 radar, 'path_integrated_differential_attenuation',
+                                 sweep), ax=ax,
+                             resolution='50m', min_lat=min_lat,
+                             min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol, gatefilter=cmac_gates,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+        fig.savefig(
+            image_directory
+            + '/path_integrated_differential_attenuation' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot of corrected differential phase.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                          figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('corrected_differential_reflectivity', sweep=sweep,
-                         title=_generate_title(
-                             radar, 'corrected_differential_reflectivity',
-                             sweep), ax=ax,
-                         resolution='50m', min_lat=min_lat,
-                         min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol, gatefilter=cmac_gates,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                    levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                    colors='k')
-    fig.savefig(
-        image_directory
-        + '/corrected_differential_reflectivity' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, ['corrected_differential_reflectivity', 'gate_id']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                              figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('corrected_differential_reflectivity', sweep=sweep,
+                             title=_generate_title(
+                                 radar, 'corrected_differential_reflectivity',
+                                 sweep), ax=ax,
+                             resolution='50m', min_lat=min_lat,
+                             min_lon=min_lon, max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol, gatefilter=cmac_gates,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                        levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                        colors='k')
+        fig.savefig(
+            image_directory
+            + '/corrected_differential_reflectivity' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
 
     # Creating a plot with reflectivity corrected with attenuation.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                           figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map(field_config['normalized_coherent_power'], sweep=sweep,
-                         resolution='50m',
-                         title=_generate_title(
-                             radar, field_config['normalized_coherent_power'],
-                             sweep),
-                         min_lat=min_lat, min_lon=min_lon,
-                         max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol, ax=ax,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
-    fig.savefig(
-        image_directory
-        + '/normalized_coherent_power' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
-
-   # Creating a plot with reflectivity corrected with attenuation.
-    display = pyart.graph.RadarMapDisplay(radar)
-    fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
-                           figsize=[12, 8])
-    ax.set_aspect('auto')
-    display.plot_ppi_map('signal_to_noise_ratio', sweep=sweep,
-                         resolution='50m',
-                         title=_generate_title(
-                             radar, 'signal_to_noise_ratio',
-                             sweep),
-                         min_lat=min_lat, min_lon=min_lon,
-                         max_lat=max_lat, max_lon=max_lon,
-                         lat_lines=lal, lon_lines=lol, ax=ax,
-                         projection=ccrs.PlateCarree())
-    if dd_lobes:
-        ax.contour(grid_lon, grid_lat, bca,
-                   levels=[np.pi/6, 5*np.pi/6], linewidths=2,
-                   colors='k')
-    fig.savefig(
-        image_directory
-        + '/signal_to_noise_ratio' + combined_name + '.png')
-    plt.close(fig)
-    del fig, ax, display
+    if _has_fields(radar, [field_config['normalized_coherent_power']]):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                               figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map(field_config['normalized_coherent_power'], sweep=sweep,
+                             resolution='50m',
+                             title=_generate_title(
+                                 radar, field_config['normalized_coherent_power'],
+                                 sweep),
+                             min_lat=min_lat, min_lon=min_lon,
+                             max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol, ax=ax,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+        fig.savefig(
+            image_directory
+            + '/normalized_coherent_power' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
+
+    # Creating a plot with reflectivity corrected with attenuation.
+    if _has_fields(radar, ['signal_to_noise_ratio']):
+        display = pyart.graph.RadarMapDisplay(radar)
+        fig, ax = plt.subplots(1, 1, subplot_kw=dict(projection=ccrs.PlateCarree()),
+                               figsize=[12, 8])
+        ax.set_aspect('auto')
+        display.plot_ppi_map('signal_to_noise_ratio', sweep=sweep,
+                             resolution='50m',
+                             title=_generate_title(
+                                 radar, 'signal_to_noise_ratio',
+                                 sweep),
+                             min_lat=min_lat, min_lon=min_lon,
+                             max_lat=max_lat, max_lon=max_lon,
+                             lat_lines=lal, lon_lines=lol, ax=ax,
+                             projection=ccrs.PlateCarree())
+        if dd_lobes:
+            ax.contour(grid_lon, grid_lat, bca,
+                       levels=[np.pi/6, 5*np.pi/6], linewidths=2,
+                       colors='k')
+        fig.savefig(
+            image_directory
+            + '/signal_to_noise_ratio' + combined_name + '.png')
+        plt.close(fig)
+        del fig, ax, display
+
+
+def _has_fields(radar, fields):
+    """ True if every field of a plot is in the radar. """
+    return all([field in radar.fields for field in fields])
 
 
 def _generate_title(radar, field, sweep):
@@ -11,11 +11,16 @@ import fnmatch
 import netCDF4
 import numpy as np
 import pyart
-from scipy import integrate
 from scipy import ndimage, interpolate
 import skfuzzy as fuzz
 import wradlib as wrl
 
+from .gate_categories import get_gate_categories
+from .phase_reconstruction import reconstruct_phase
+from .sweep_filters import (
+    full_circle_sweeps, sweep_median_filter, sweep_slices)
+from .texture import velocity_texture
+
 
 def snow_rate(radar, swe_ratio, A, B, citation='Wolf and Snider 2012', abbrev='ws2012'):
     """
@@ -49,6 +54,74 @@ def snow_rate(radar, swe_ratio, A, B, citation='Wolf and Snider 2012', abbrev='w
     return radar
 
 
+def snow_rates(radar, swe_ratio, zs_relationships, gatefilter=None,
+               refl_field='corrected_reflectivity'):
+    """
+    Snow rates from several Z-S relationships at once.
+
+    Reflectivity is converted to linear units once, only for the gates
+    included by the gatefilter, and every relationship is evaluated in one
+    broadcasted operation. One field per relationship is added to the
+    radar, as in snow_rate, and all of them share one mask.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar object with the reflectivity field.
+    swe_ratio : float
+        Snow water equivalent ratio.
+    zs_relationships : dict
+        Z-S relationships keyed by citation, each a dict with A, B and
+        abbreviation as returned by config.get_zs_relationships.
+
+    Other Parameters
+    ----------------
+    gatefilter : GateFilter
+        Gates excluded by the gatefilter are masked and not computed.
+    refl_field : str
+        Name of the reflectivity field.
+
+    Returns
+    -------
+    radar : Radar
+        Radar object with the snow_rate_<abbreviation> fields added.
+
+    """
+    refl = radar.fields[refl_field]['data']
+    mask = np.ma.getmaskarray(refl).copy()
+    if gatefilter is not None:
+        mask |= gatefilter.gate_excluded
+    include = ~mask
+
+    citations = list(zs_relationships.keys())
+    coef_a = np.array([zs_relationships[key]['A'] for key in citations])
+    coef_b = np.array([zs_relationships[key]['B'] for key in citations])
+    z_lin = 10.0**(np.ma.getdata(refl)[include] / 10.0)
+    rates = swe_ratio * (
+        z_lin[np.newaxis, :] / coef_a[:, np.newaxis])**(
+            1.0 / coef_b[:, np.newaxis])
+
+    template = {key: value for key, value in radar.fields[refl_field].items()
+                if key != 'data'}
+    for i, citation in enumerate(citations):
+        abbrev = zs_relationships[citation]['abbreviation']
+        data = np.zeros(refl.shape, dtype=refl.dtype)
+        data[include] = rates[i]
+        field = copy.deepcopy(template)
+        field['data'] = np.ma.MaskedArray(data, mask=mask, copy=False)
+        field['units'] = 'mm/h'
+        field['standard_name'] = 'snowfall_rate'
+        field['long_name'] = 'Snowfall rate from Z using %s' % citation
+        field['valid_min'] = 0
+        field['valid_max'] = 500
+        field['swe_ratio'] = swe_ratio
+        field['A'] = zs_relationships[citation]['A']
+        field['B'] = zs_relationships[citation]['B']
+        radar.add_field('snow_rate_%s' % abbrev, field,
+                        replace_existing=True)
+    return radar
+
+
 def snr_and_sounding(radar, soundings_dir, override_file=None, verbose=True):
     if override_file is None:
         radar_start_date = netCDF4.num2date(radar.time['data'][0],
@@ -81,26 +154,104 @@ def snr_and_sounding(radar, soundings_dir, override_file=None, verbose=True):
     return z_dict, temp_dict, snr
 
 
-def get_texture(radar, vel_field, nyq=None):
-    """ Calculates velocity texture field. """
+def get_texture(radar, vel_field, nyq=None, block_size=1024, n_threads=1,
+                sweep_aware=False):
+    """ Calculates velocity texture field. The texture is computed in
+    blocks of block_size rays, optionally on n_threads threads, which
+    bounds the memory used by temporaries. See texture.velocity_texture.
+    If sweep_aware is True the blocks are the sweeps, so windows do not
+    mix elevations and wrap around north in full circle sweeps. """
     if nyq is None:
         nyq = radar.instrument_parameters['nyquist_velocity']['data'][0]
     else:
         nyq = nyq
     start_time = time.time()
+    vel = _texture_input(radar, vel_field)
+
+    if sweep_aware:
+        sweeps = sweep_slices(radar)
+        wrap = full_circle_sweeps(radar)
+    else:
+        sweeps = wrap = None
+    filtered_data = velocity_texture(vel, nyq, block_size=block_size,
+                                     n_threads=n_threads, sweeps=sweeps,
+                                     wrap=wrap)
+    texture_field = _texture_field(filtered_data)
+    total_time = time.time() - start_time
+    return texture_field
+
+
+def batch_texture(radars, vel_field, nyq=None, n_threads=1,
+                  sweep_aware=False):
+    """
+    Velocity texture of several volumes of the same Nyquist velocity,
+    computed in one call of texture.velocity_texture on the volumes
+    stacked along the ray axis. Each volume, or each sweep if sweep_aware
+    is True, is one block, so the textures are those of get_texture.
+
+    Parameters
+    ----------
+    radars : list
+        Radar objects with the velocity field.
+    vel_field : str
+        Name of the velocity field.
+
+    Other Parameters
+    ----------------
+    nyq : float
+        Nyquist velocity, by default that of the first ray of the first
+        radar.
+    n_threads : int
+        Number of threads to process blocks with.
+    sweep_aware : bool
+        If True, windows do not mix sweeps and wrap around north in full
+        circle sweeps.
+
+    Returns
+    -------
+    textures : list
+        Velocity texture field of each radar.
+
+    """
+    if nyq is None:
+        nyq = radars[0].instrument_parameters[
+            'nyquist_velocity']['data'][0]
+    vel = np.concatenate([np.asarray(_texture_input(radar, vel_field))
+                          for radar in radars])
+    offsets = np.cumsum([0] + [radar.nrays for radar in radars])
+    if sweep_aware:
+        sweeps = [(offset + start, offset + end)
+                  for offset, radar in zip(offsets, radars)
+                  for start, end in sweep_slices(radar)]
+        wrap = [this_wrap for radar in radars
+                for this_wrap in full_circle_sweeps(radar)]
+    else:
+        sweeps = list(zip(offsets[:-1], offsets[1:]))
+        wrap = None
+    filtered_data = velocity_texture(vel, nyq, n_threads=n_threads,
+                                     sweeps=sweeps, wrap=wrap)
+    return [_texture_field(filtered_data[start:end])
+            for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _texture_input(radar, vel_field):
+    """ Velocity the texture is computed from, NaN at clutter gates. """
     if 'ground_clutter' in radar.fields.keys():
-        vel = np.ma.masked_where(radar.fields['ground_clutter']['data'] == 1,
-                                 radar.fields[vel_field]['data'])
-        vel = vel.filled(np.nan)
+        is_clutter = np.ma.filled(
+            radar.fields['ground_clutter']['data'] == 1, True)
+        vel = np.where(is_clutter, np.nan,
+                       np.ma.getdata(radar.fields[vel_field]['data']))
+        if np.ma.is_masked(radar.fields[vel_field]['data']):
+            vel[np.ma.getmaskarray(radar.fields[vel_field]['data'])] = np.nan
     else:
         vel = radar.fields[vel_field]['data']
-    
-    std_dev = pyart.util.angular_texture_2d(vel, 4, nyq)
-    filtered_data = ndimage.filters.median_filter(std_dev, size=(4, 4))
+    return vel
+
+
+def _texture_field(filtered_data):
     texture_field = pyart.config.get_metadata('velocity')
     texture_field['data'] = np.ma.masked_where(
-        np.isnan(filtered_data), filtered_data)
-    total_time = time.time() - start_time
+        np.isnan(filtered_data), filtered_data, copy=False)
     return texture_field
 
 
@@ -108,7 +259,13 @@ def get_texture(radar, vel_field, nyq=None):
 def cum_score_fuzzy_logic(radar, mbfs=None,
                           ret_scores=False,
                           hard_const=None,
-                          verbose=False):
+                          verbose=False,
+                          sweep_aware=False,
+                          n_threads=1):
+    """ Cumulative score fuzzy logic classification. The score of each
+    class is median filtered over the whole volume, or sweep by sweep on
+    n_threads threads if sweep_aware is True, see
+    sweep_filters.sweep_median_filter. """
     if mbfs is None:
         second_trip = {'velocity_texture': [[0, 0, 1.8, 2], 1.0],
                        'cross_correlation_ratio': [[.5, .7, 1, 1], 0.0],
@@ -148,7 +305,63 @@ def cum_score_fuzzy_logic(radar, mbfs=None,
         mbfs = {'multi_trip': second_trip, 'rain': rain, 'snow': snow,
                 'no_scatter': no_scatter, 'melting': melting}
 
-    flds = radar.fields
+    if sweep_aware:
+        def median_filter(score):
+            return sweep_median_filter(
+                radar, score, size=(3, 4), n_threads=n_threads)
+    else:
+        median_filter = None
+    gid, scores = fuzzy_classification(
+        radar.fields, mbfs, hard_const=hard_const,
+        median_filter=median_filter, verbose=verbose)
+
+    if ret_scores is False:
+        rv = (gid, scores.keys())
+    else:
+        rv = (gid, scores.keys(), scores)
+    return rv
+
+
+def fuzzy_classification(fields, mbfs, hard_const=None, median_filter=None,
+                         verbose=False):
+    """
+    Cumulative score fuzzy logic classification of field arrays of any
+    shape, such as the fields of a radar or of several volumes stacked.
+
+    Parameters
+    ----------
+    fields : dict
+        Fields by name, each a dict with a data array. Arrays are all of
+        the shape of the first field.
+    mbfs : dict
+        Membership functions of the fields for each class,
+        {class: {field: [[start_up, finish_up, start_down, finish_down],
+        weight]}}.
+
+    Other Parameters
+    ----------------
+    hard_const : list
+        Constraints [[class, field, (v1, v2)], ...] setting the score of
+        class to zero where field is between v1 and v2.
+    median_filter : function
+        Function filtering the score of each class. Defaults to a (3, 4)
+        median filter over the whole array.
+    verbose : bool
+        If True, the classes are printed as they are scored.
+
+    Returns
+    -------
+    gid : dict
+        Gate id field, the class of highest score.
+    scores : dict
+        Filtered score of each class.
+
+    """
+    if median_filter is None:
+        def median_filter(score):
+            return ndimage.filters.median_filter(score, size=[3, 4])
+
+    flds = fields
     scores = {}
     for key in mbfs.keys():
         if verbose:
@@ -162,8 +375,7 @@ def cum_score_fuzzy_logic(radar, mbfs=None,
 
         this_score = this_score.reshape(
             flds[list(flds.keys())[0]]['data'].shape)
-        scores.update({key: ndimage.filters.median_filter(
-            this_score, size=[3, 4])})
+        scores.update({key: median_filter(this_score)})
 
     if hard_const is not None:
         # hard_const = [[class, field, (v1, v2)], ...]
@@ -172,7 +384,7 @@ def cum_score_fuzzy_logic(radar, mbfs=None,
                 print('##    Doing hard constraining', this_const[0])
             key = this_const[0]
             const = this_const[1]
-            fld_data = radar.fields[const]['data']
+            fld_data = flds[const]['data']
             lower = this_const[2][0]
             upper = this_const[2][1]
             const_area = np.where(np.logical_and(fld_data >= lower,
@@ -180,11 +392,12 @@ def cum_score_fuzzy_logic(radar, mbfs=None,
             if verbose:
                 print('##    ', str(const_area))
             scores[key][const_area] = 0.0
-    stacked_scores = np.dstack([scores[key] for key in scores.keys()])
+    stacked_scores = np.stack([scores[key] for key in scores.keys()],
+                              axis=-1)
     #sum_of_scores = stacked_scores.sum(axis = 2)
     #print(sum_of_scores.shape)
     #norm_stacked_scores = stacked_scores
-    max_score = stacked_scores.argmax(axis=2)
+    max_score = stacked_scores.argmax(axis=-1)
 
     gid = {}
     gid['data'] = max_score
@@ -199,21 +412,114 @@ def cum_score_fuzzy_logic(radar, mbfs=None,
     gid['valid_max'] = max_score.max()
     gid['valid_min'] = 0.0
 
-    if ret_scores is False:
-        rv = (gid, scores.keys())
-    else:
-        rv = (gid, scores.keys(), scores)
-    return rv
+    return gid, scores
 
 
 def do_my_fuzz(radar, rhv_field, ncp_field,
                tex_start=2.0, tex_end=2.1,
                custom_mbfs=None, custom_hard_constraints=None,
-               verbose=True):  # NEEDS DOCSTRING
+               verbose=True, sweep_aware=False,
+               n_threads=1):  # NEEDS DOCSTRING
     if verbose:
         print('##')
         print('## CMAC calculation using fuzzy logic:')
 
+    mbfs, hard_const = _fuzz_memberships(
+        rhv_field, ncp_field, tex_start, tex_end, custom_mbfs,
+        custom_hard_constraints)
+    gid_fld, cats = cum_score_fuzzy_logic(radar, mbfs=mbfs, verbose=verbose,
+                                          hard_const=hard_const,
+                                          sweep_aware=sweep_aware,
+                                          n_threads=n_threads)
+    rain_val = list(cats).index('rain')
+    snow_val = list(cats).index('snow')
+    melt_val = list(cats).index('melting')
+    return _fix_rain_above_bb(gid_fld, rain_val, melt_val, snow_val), cats
+
+
+def batch_fuzz(radars, rhv_field, ncp_field,
+               tex_start=2.0, tex_end=2.1,
+               custom_mbfs=None, custom_hard_constraints=None,
+               verbose=True, sweep_aware=False, n_threads=1):
+    """
+    Gate ids of several volumes of the same shape, see do_my_fuzz. The
+    fuzzy logic scores are computed once on the fields stacked along a
+    leading volume axis, and the median filters do not mix volumes, so
+    the gate ids are those of do_my_fuzz.
+
+    Parameters
+    ----------
+    radars : list
+        Radar objects with the fields of the membership functions.
+    rhv_field, ncp_field : str
+        Names of the cross correlation ratio and normalized coherent
+        power fields.
+
+    Other Parameters
+    ----------------
+    tex_start, tex_end : float
+        Velocity texture where the multi trip membership starts.
+    custom_mbfs, custom_hard_constraints : dict, list
+        Membership functions and hard constraints replacing the defaults.
+    verbose : bool
+        If True, the classes are printed as they are scored.
+    sweep_aware : bool
+        If True, the scores are median filtered sweep by sweep, see
+        sweep_filters.sweep_median_filter.
+    n_threads : int
+        Number of threads of the sweep aware median filter.
+
+    Returns
+    -------
+    gate_ids : list
+        Gate id field and class names of each radar.
+
+    """
+    if verbose:
+        print('##')
+        print('## CMAC calculation using fuzzy logic on %d volumes:'
+              % len(radars))
+    mbfs, hard_const = _fuzz_memberships(
+        rhv_field, ncp_field, tex_start, tex_end, custom_mbfs,
+        custom_hard_constraints)
+    names = set([name for key in mbfs for name in mbfs[key]])
+    if hard_const is not None:
+        names.update([this_const[1] for this_const in hard_const])
+    fields = {name: {'data': np.ma.stack(
+        [radar.fields[name]['data'] for radar in radars])}
+              for name in names}
+
+    if sweep_aware:
+        def median_filter(score):
+            out = np.empty_like(score)
+            for i, radar in enumerate(radars):
+                sweep_median_filter(radar, score[i], size=(3, 4),
+                                    n_threads=n_threads, out=out[i])
+            return out
+    else:
+        def median_filter(score):
+            return ndimage.filters.median_filter(score, size=[1, 3, 4])
+    gid, scores = fuzzy_classification(
+        fields, mbfs, hard_const=hard_const, median_filter=median_filter,
+        verbose=verbose)
+
+    cats = scores.keys()
+    rain_val = list(cats).index('rain')
+    snow_val = list(cats).index('snow')
+    melt_val = list(cats).index('melting')
+    gate_ids = []
+    for data in gid['data']:
+        gid_fld = dict(gid)
+        gid_fld['data'] = data
+        gid_fld['valid_max'] = data.max()
+        gate_ids.append((_fix_rain_above_bb(
+            gid_fld, rain_val, melt_val, snow_val), cats))
+    return gate_ids
+
+
+def _fuzz_memberships(rhv_field, ncp_field, tex_start, tex_end,
+                      custom_mbfs=None, custom_hard_constraints=None):
+    """ Membership functions and hard constraints of do_my_fuzz. """
     second_trip = {'velocity_texture': [[tex_start, tex_end, 130., 130.], 4.0],
                    rhv_field: [[.5, .7, 1, 1], 0.0],
                    ncp_field: [[0, 0, .5, .6], 1.0],
@@ -264,24 +570,19 @@ def do_my_fuzz(radar, rhv_field, ncp_field,
     else:
         hard_const = custom_hard_constraints
 
-    gid_fld, cats = cum_score_fuzzy_logic(radar, mbfs=mbfs, verbose=verbose,
-                                          hard_const=hard_const)
-    rain_val = list(cats).index('rain')
-    snow_val = list(cats).index('snow')
-    melt_val = list(cats).index('melting')
-    return _fix_rain_above_bb(gid_fld, rain_val, melt_val, snow_val), cats
+    return mbfs, hard_const
 
 
-def get_melt(radar, melt_cat=None):
+def get_melt(radar, melt_cat=None, categories=None):
+    """ Freezing level from the melting class of gate_id and the
+    sounding. The melting gates are taken from the gate category registry,
+    see gate_categories.get_gate_categories, unless melt_cat is given. """
     if melt_cat is None:
-        cat_dict = {}
-        for pair_str in radar.fields['gate_id']['notes'].split(','):
-            cat_dict.update(
-                {pair_str.split(':')[1]: int(pair_str.split(':')[0])})
-
-        melt_cat = cat_dict['melting']
-
-    melt_locations = np.where(radar.fields['gate_id']['data'] == melt_cat)
+        if categories is None:
+            categories = get_gate_categories(radar)
+        melt_locations = np.where(categories.mask('melting'))
+    else:
+        melt_locations = np.where(radar.fields['gate_id']['data'] == melt_cat)
     kinda_cold = np.where(radar.fields['sounding_temperature']['data'] < 0)
     fzl_sounding = radar.gate_altitude['data'][kinda_cold].min()
     if len(melt_locations[0] > 1):
@@ -298,15 +599,146 @@ def get_melt(radar, melt_cat=None):
     return fzl
 
 def fix_phase_fields(orig_kdp, orig_phidp, rrange, happy_kdp,
-                     max_kdp=15.0):
-
-    orig_kdp['data'][happy_kdp.gate_excluded] = 0.0
-    orig_kdp['data'][orig_kdp['data'] > max_kdp] = max_kdp
-    interg = integrate.cumtrapz(orig_kdp['data'], rrange, axis=1)
-    print(interg.shape)
-    print(orig_phidp['data'].shape)
-    orig_phidp['data'][:, 0:-1] = interg/len(rrange)
-    return orig_phidp, orig_kdp
+                     max_kdp=15.0, block_size=1024, n_threads=1):
+    """ Filtered KDP and PhiDP. KDP is set to zero at gates excluded by
+    happy_kdp and clipped at max_kdp, and PhiDP is rebuilt by integrating
+    it along range, see phase_reconstruction.reconstruct_phase. The input
+    fields are not modified, new fields with their metadata are
+    returned. """
+    excluded = happy_kdp.gate_excluded
+    kdp_data, phase = reconstruct_phase(
+        orig_kdp['data'], excluded, rrange, max_kdp=max_kdp,
+        block_size=block_size, n_threads=n_threads)
+
+    # Gates written by the reconstruction are unmasked, as assigning into
+    # the masked arrays did.
+    kdp_mask = np.ma.getmaskarray(orig_kdp['data']) & ~excluded
+    kdp_field = _field_like(orig_kdp, kdp_data.astype(
+        orig_kdp['data'].dtype, copy=False), kdp_mask)
+
+    phidp_data = np.array(np.ma.getdata(orig_phidp['data']))
+    phidp_data[:, :-1] = phase
+    phidp_mask = np.ma.getmaskarray(orig_phidp['data']).copy()
+    phidp_mask[:, :-1] = False
+    phidp_field = _field_like(orig_phidp, phidp_data, phidp_mask)
+    return phidp_field, kdp_field
+
+
+def _field_like(field, data, mask):
+    """ Copy of the metadata of a field with new data and mask. """
+    new_field = copy.deepcopy({key: value for key, value in field.items()
+                               if key != 'data'})
+    new_field['data'] = np.ma.MaskedArray(data, mask=mask, copy=False)
+    return new_field
+
+def attenuation_inputs(radar, field_config, gatefilter, iso0=None):
+    """
+    Fields read by the attenuation correction.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar object with the sounding fields.
+    field_config : dict
+        Field names of the radar, see config.get_field_names.
+    gatefilter : GateFilter
+        Gates of reflectivity kept for the correction.
+
+    Other Parameters
+    ----------------
+    iso0 : float
+        Height of the 0C isotherm. None computes it from the sounding
+        fields of the radar, see iso0_height.
+
+    Returns
+    -------
+    fields : dict
+        The reflectivity masked outside gatefilter and the differential
+        reflectivity, as corrected_reflectivity and
+        corrected_differential_reflectivity, and the height of the gates
+        over the 0C isotherm, height_over_iso0.
+
+    """
+    zdr = copy.deepcopy(
+        radar.fields[field_config['differential_reflectivity']])
+    refl = copy.deepcopy(radar.fields[field_config['reflectivity']])
+    refl['data'] = np.ma.masked_where(gatefilter.gate_excluded, refl['data'])
+
+    # Get specific differential attenuation.
+    # Need height over 0C isobar.
+    if iso0 is None:
+        iso0 = iso0_height(radar)
+    height = copy.deepcopy(radar.fields['height'])
+    height['data'] -= iso0
+    height['long_name'] = 'Height of radar beam over freezing level'
+    return {'corrected_differential_reflectivity': zdr,
+            'corrected_reflectivity': refl,
+            'height_over_iso0': height}
+
+
+def iso0_height(radar):
+    """ Mean height of the gates within 0.1C of 0C in the sounding
+    temperature field. """
+    return np.ma.mean(radar.fields['height']['data'][
+        np.where(np.abs(radar.fields['sounding_temperature']['data']) < 0.1)])
+
+
+def attenuation_zphi(radar, field_config, coefficients, gatefilter):
+    """
+    Attenuation correction with Py-ART's ZPhi method, on a radar holding
+    the fields of attenuation_inputs and the filtered differential phase.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar object with the input fields.
+    field_config : dict
+        Field names of the radar, see config.get_field_names.
+    coefficients : dict
+        attenuation_a_coef, c_coef, d_coef and beta_coef of the
+        correction.
+    gatefilter : GateFilter
+        Gates the correction is applied to.
+
+    Returns
+    -------
+    spec_at, pia, cor_z, spec_diff_at, pida, cor_zdr : dict
+        Specific attenuation, path integrated attenuation, corrected
+        reflectivity, specific differential attenuation, path integrated
+        differential attenuation and corrected differential reflectivity.
+
+    """
+    return pyart.correct.calculate_attenuation_zphi(
+        radar, temp_field='sounding_temperature',
+        iso0_field='height_over_iso0',
+        zdr_field=field_config['zdr_field'],
+        pia_field=field_config['pia_field'],
+        phidp_field=field_config['phidp_field'],
+        refl_field=field_config['refl_field'],
+        c=coefficients['c_coef'], d=coefficients['d_coef'],
+        a_coef=coefficients['attenuation_a_coef'],
+        beta=coefficients['beta_coef'], gatefilter=gatefilter)
+
+
+def rain_rate_from_attenuation(spec_at, rr_a, rr_b):
+    """ Rain rate field R = rr_a * A ** rr_b from a specific attenuation
+    field. """
+    R = rr_a * (spec_at['data']) ** rr_b
+    rainrate = copy.deepcopy(spec_at)
+    rainrate['data'] = R
+    rainrate['valid_min'] = 0.0
+    rainrate['valid_max'] = 400.0
+    rainrate['standard_name'] = 'rainfall_rate'
+    rainrate['long_name'] = 'rainfall_rate'
+    rainrate['least_significant_digit'] = 1
+    rainrate['units'] = 'mm/hr'
+    rainrate['comment'] = (
+        'Rain rate calculated from specific_attenuation,'
+        + ' R=%s*specific_attenuation**%s, note R=0.0 where' % (
+            str(rr_a), str(rr_b))
+        + ' norm coherent power < 0.4 or rhohv < 0.8')
+    return rainrate
+
 
 def return_csu_kdp(radar):
     dzN = _extract_unmasked_data(radar, 'reflectivity')
@@ -2,6 +2,7 @@
 correct velocity and more. A new radar object is then created with all CMAC
 2.0 products. """
 
+from collections import OrderedDict
 import copy
 import json
 import sys
@@ -13,12 +14,23 @@ import netCDF4
 
 from .cmac_processing import (
     do_my_fuzz, get_melt, get_texture, fix_phase_fields, gen_clutter_field_from_refl, beam_block,
-    snow_rate)
+    snow_rates, attenuation_inputs, attenuation_zphi, iso0_height,
+    rain_rate_from_attenuation, batch_texture, batch_fuzz)
+from .gate_categories import GateCategories
+from .gate_masks import GateMask
+from .radar_statistics import (
+    coverage_key, coverage_statistics, statistics_to_metadata)
 from .config import get_cmac_values, get_field_names, get_metadata, get_zs_relationships
+from .phase_processing import (
+    phase_field_metadata, phase_proc_lp_parallel, system_phase)
+from .pipeline import STAGES, print_stage_timings, resolve_stages, run_stages
+from .stage_cache import stage_keys, volume_hash
 
 
 def cmac(radar, sonde, config, geotiff=None, flip_velocity=False,
-         meta_append=None, verbose=True, snow_density=0.073, snowfall=True):
+         meta_append=None, verbose=True, snow_density=0.073, snowfall=True,
+         n_lp_workers=1, products=None, stage_cache=None,
+         velocity_reference=None, geometry_cache=None, volume_inputs=None):
     """
     Corrected Moments in Antenna Coordinates
 
@@ -45,6 +57,33 @@ def cmac(radar, sonde, config, geotiff=None, flip_velocity=False,
         If True, this will display more statistics.
     snow_density : float
         1 / Snow water equivalent ratio for snowfall rate
+    n_lp_workers : int
+        Number of processes used to solve the LP phase processing. With
+        one process Py-ART's phase_proc_lp_gf is called directly.
+    products : list
+        Fields, or stages, of pipeline.STAGES to compute. Only the stages
+        these products depend on are run, see pipeline.resolve_stages.
+        None computes every product.
+    stage_cache : StageCache
+        If given, the fields of the cached stages are read from it when
+        the input volume and the settings the stages depend on are
+        unchanged, and stored in it otherwise, see stage_cache.StageCache.
+    velocity_reference : VelocityReference
+        If given, the dealiased velocity of the previous volume it holds is
+        the reference of the dealiasing when it is recent enough, instead
+        of the velocity simulated from the sonde. The dealiased velocity of
+        this volume is then stored in it for the next volume, see
+        velocity_reference.VelocityReference.
+    geometry_cache : GeometryCache
+        If given, the gate coordinates are taken from it instead of being
+        computed for this radar object, see geometry_cache.GeometryCache.
+    volume_inputs : dict
+        Inputs computed on the whole volume when the radar holds only some
+        of its sweeps, see cmac_chunked: the fields of the stages of
+        VOLUME_STAGES, which are then not run, the freezing level 'fzl',
+        the 0C isotherm height 'iso0', the 'system_phase', the
+        'precip_gates' count and 'last_chunk',
+        True if the radar holds the last sweep of the volume.
 
     Returns
     -------
@@ -56,6 +95,129 @@ def cmac(radar, sonde, config, geotiff=None, flip_velocity=False,
     field_config = get_field_names(config)
     meta_config = get_metadata(config)
     zs_relationship_dict = get_zs_relationships()
+
+    # The stage cache is keyed on the volume as it was read, before the
+    # offsets and flips below.
+    if stage_cache is not None:
+        input_hash = stage_cache.input_hash
+        if input_hash is None:
+            input_hash = volume_hash(radar, sonde, [
+                field_config[name] for name in (
+                    'temperature', 'altitude', 'u_wind', 'v_wind')])
+        # Sweep chunks of a volume share the input files.
+        input_hash = '%s %d %d %r' % (
+            input_hash, radar.nrays, radar.ngates,
+            float(radar.time['data'][0]))
+
+    _config_defaults(cmac_config)
+    _prepare_volume(radar, cmac_config, field_config, flip_velocity)
+    if geometry_cache is not None:
+        geometry_cache.apply(radar)
+
+    stages = _cmac_stages(products, snowfall)
+    state = _stage_state(sonde, cmac_config, field_config, verbose, geotiff,
+                         n_lp_workers, snow_density, zs_relationship_dict,
+                         velocity_reference=velocity_reference,
+                         volume_inputs=volume_inputs)
+
+    if not verbose:
+        print('## Adding radar fields...')
+
+    if verbose:
+        print('##')
+        print('## These radar fields are being added:')
+
+    functions = _STAGE_FUNCTIONS
+    if stage_cache is not None:
+        settings = dict(cmac_config)
+        settings.update({'flip_velocity': flip_velocity, 'geotiff': geotiff,
+                         'n_lp_workers': n_lp_workers,
+                         'snow_density': snow_density,
+                         'zs_relationships': zs_relationship_dict})
+        if velocity_reference is not None:
+            settings['velocity_reference'] = velocity_reference.key()
+        if volume_inputs is not None:
+            settings['volume_inputs'] = [volume_inputs[name] for name in (
+                'fzl', 'iso0', 'system_phase', 'precip_gates',
+                'last_chunk')]
+        keys = stage_keys(input_hash, settings, field_config)
+        functions = {name: stage_cache.wrap(
+            name, function, keys[name], restore=_STAGE_RESTORE.get(name))
+                     for name, function in _STAGE_FUNCTIONS.items()}
+    if volume_inputs is not None:
+        functions = dict(functions)
+        for name in VOLUME_STAGES:
+            functions[name] = _volume_stage(name, volume_inputs['fields'])
+
+    timings = run_stages(radar, state, stages, functions,
+                         n_threads=cmac_config['stage_threads'])
+    if verbose:
+        print_stage_timings(timings)
+    if (velocity_reference is not None
+            and 'corrected_velocity' in radar.fields):
+        velocity_reference.update(radar)
+
+    _finish_volume(radar, state, stages, products, meta_append, meta_config)
+    return radar
+
+
+def _config_defaults(cmac_config):
+    """ Sets the default of the config values that are optional. """
+    if 'gen_clutter_from_refl' not in cmac_config.keys():
+        cmac_config['gen_clutter_from_refl'] = False
+
+    if 'flip_phidp' not in cmac_config.keys():
+        cmac_config['flip_phidp'] = False
+
+    if 'clutter_mask_z_for_texture' not in cmac_config.keys():
+        cmac_config['clutter_mask_z_for_texture'] = False
+
+    # Sweep aware filtering keeps the texture and fuzzy logic median
+    # filters within a sweep and wraps them in azimuth. Off by default so
+    # products match those already archived.
+    if 'sweep_aware_filter' not in cmac_config.keys():
+        cmac_config['sweep_aware_filter'] = False
+
+    if 'filter_threads' not in cmac_config.keys():
+        cmac_config['filter_threads'] = 1
+
+    if 'mbfs' not in cmac_config:
+        cmac_config['mbfs'] = None
+
+    if 'hard_const' not in cmac_config:
+        cmac_config['hard_const'] = None
+
+    # Volumes with fewer rain, melting and snow gates than
+    # fast_path_gates skip the dealiasing, LP phase processing and
+    # attenuation correction, whose fields are written fully masked.
+    # The default of 0 never skips.
+    if 'fast_path_gates' not in cmac_config.keys():
+        cmac_config['fast_path_gates'] = 0
+
+    # Rays with fewer kdp gates than lp_min_gates are not solved by the LP
+    # and hold the system phase and zero KDP. None solves every ray.
+    if 'lp_min_gates' not in cmac_config.keys():
+        cmac_config['lp_min_gates'] = None
+
+    # LP solver of the phase processing, see pyart.correct.phase_proc_lp_gf.
+    if 'lp_solver' not in cmac_config.keys():
+        cmac_config['lp_solver'] = 'cylp'
+
+    # Statistics to store in the metadata, a dict of keyword arguments of
+    # radar_statistics.coverage_statistics, or None for no statistics.
+    if 'coverage_statistics' not in cmac_config.keys():
+        cmac_config['coverage_statistics'] = None
+
+    # Number of threads running the stages that do not depend on each
+    # other, such as the sounding mapping, SNR, texture, beam blockage and
+    # simulated velocity, at the same time. One runs them in order.
+    if 'stage_threads' not in cmac_config.keys():
+        cmac_config['stage_threads'] = 1
+
+
+def _prepare_volume(radar, cmac_config, field_config, flip_velocity=False):
+    """ Applies the site altitude, generated clutter field, offsets and
+    flips of the config to the input fields. """
     # Over write site altitude
 
     if 'site_alt' in cmac_config.keys():
@@ -68,13 +230,8 @@ def cmac(radar, sonde, config, geotiff=None, flip_velocity=False,
     ##    only_use_cftime_datetimes=False, only_use_python_datetimes=True)
     ##print('##', str(radar_start_date))
 
-    temp_field = field_config['temperature']
-    alt_field = field_config['altitude']
     vel_field = field_config['velocity']
 
-    if 'gen_clutter_from_refl' not in cmac_config.keys():
-        cmac_config['gen_clutter_from_refl'] = False
-
     if cmac_config['gen_clutter_from_refl']:
         new_clutter_field = gen_clutter_field_from_refl(
             radar, field_config['input_clutter_corrected_reflectivity'],
@@ -92,16 +249,13 @@ def cmac(radar, sonde, config, geotiff=None, flip_velocity=False,
         else:
             radar.fields[
                 field_config['input_zdr']]['data'] += cmac_config['zdr_offset']
-    
+
     # Reflectivity offsets
     if cmac_config["ref_offset"]:
         # note need input reflectivity, not corrected reflectivity variable name
         radar.fields[field_config["reflectivity"]]['data'] += cmac_config["ref_offset"]
-        
-    # flipping phidp
-    if 'flip_phidp' not in cmac_config.keys():
-        cmac_config['flip_phidp'] = False
 
+    # flipping phidp
     if cmac_config['flip_phidp']:
         # user specifies fields to flip
         if 'phidp_flipped' in cmac_config.keys():
@@ -116,11 +270,145 @@ def cmac(radar, sonde, config, geotiff=None, flip_velocity=False,
         radar.fields[vel_field]['data'] = radar.fields[
             vel_field]['data'] * -1.0
 
+
+def _cmac_stages(products=None, snowfall=True):
+    """ Stages computing the products, without the snowfall rates if
+    snowfall is False. """
+    stages = resolve_stages(products)
+    if not snowfall and 'snow_rate' in stages:
+        stages.remove('snow_rate')
+    return stages
+
+
+def _stage_state(sonde, cmac_config, field_config, verbose, geotiff,
+                 n_lp_workers, snow_density, zs_relationships,
+                 velocity_reference=None, volume_inputs=None):
+    """ Values shared between the stages. Stages add their results, such
+    as the gate_id categories and gate filters, for the stages after
+    them. Stages may run on different threads, so they only add new
+    keys. """
+    return {'sonde': sonde, 'cmac_config': cmac_config,
+            'field_config': field_config, 'verbose': verbose,
+            'geotiff': geotiff, 'n_lp_workers': n_lp_workers,
+            'snow_density': snow_density,
+            'zs_relationships': zs_relationships,
+            'velocity_reference': velocity_reference,
+            'volume_inputs': volume_inputs}
+
+
+def _finish_volume(radar, state, stages, products, meta_append, meta_config):
+    """ Replaces the radar metadata with the CMAC metadata and statistics
+    once the stages are done. """
+    cmac_config = state['cmac_config']
+    # The previous volume used as the dealiasing reference is not a
+    # product of this volume.
+    radar.fields.pop('reference_velocity', None)
+    print('##')
+    print('## All CMAC fields have been added to the radar object.')
+    print('##')
+
+    # Adding the metadata to the cmac radar object.
+    print('## Appending metadata')
+    command_line = ''
+    for item in sys.argv:
+        command_line = command_line + ' ' + item
+    if meta_append is None:
+        meta = {
+            'site_id': None,
+            'data_level': 'sgp',
+            'comment': 'This is highly experimental and initial data. '
+                       + 'There are many known and unknown issues. Please do '
+                       + 'not use before contacting the Translator responsible '
+                       + 'scollis@anl.gov',
+            'attributions': 'This data is collected by the ARM Climate Research '
+                            + 'facility. Radar system is operated by the radar '
+                            + 'engineering team radar@arm.gov and the data is '
+                            + 'processed by the precipitation radar products '
+                            + 'team. LP code courtesy of Scott Giangrande, BNL.',
+            'version': '2.0 lite',
+            'vap_name': 'cmac',
+            'known_issues': 'False phidp jumps in insect regions. Still uses '
+                            + 'old Giangrande code.',
+            'developers': 'Robert Jackson, ANL. Zachary Sherman, ANL.',
+            'translator': 'Scott Collis, ANL.',
+            'mentors': 'Bradley Isom, PNNL., Iosif Lindenmaier, PNNL.',
+            'Conventions': 'CF/Radial instrument_parameters ARM-1.3'}
+    else:
+        if meta_append.lower().endswith('.json'):
+            with open(meta_append, 'r') as infile:
+                meta = json.load(infile)
+        elif meta_append == 'config':
+            meta = meta_config
+        else:
+            raise RuntimeError('Must provide the file name of the json file',
+                               'or say config to use the meta data from',
+                               'config.py')
+
+    radar.metadata.clear()
+    radar.metadata.update(meta)
+    radar.metadata['command_line'] = command_line
+    if products is not None:
+        radar.metadata['cmac_stages'] = ' '.join(stages)
+    if cmac_config['fast_path_gates'] > 0 and 'precip_gates' in state:
+        radar.metadata['precipitation_gates'] = state['precip_gates']
+        radar.metadata['skipped_stages'] = len([
+            name for name in ('dealias', 'phase', 'attenuation')
+            if state['fast_path'] and name in stages])
+
+    _add_statistics(radar, cmac_config, state.get('categories'))
+
+
+def _add_statistics(radar, cmac_config, categories=None):
+    """ Coverage statistics computed from the fields and gate_id masks
+    already in memory, stored in the metadata. """
+    stats_config = cmac_config['coverage_statistics']
+    if stats_config is not None and stats_config.get(
+            'field', 'corrected_reflectivity') in radar.fields:
+        statistics = coverage_statistics(
+            radar, categories=categories, **stats_config)
+        radar.metadata.update(statistics_to_metadata(
+            statistics,
+            field=stats_config.get('field', 'corrected_reflectivity'),
+            histogram_bins=stats_config.get('histogram_bins')))
+
+
+def _sounding_stage(radar, state):
+    """ Maps the sonde temperature and altitude to the gates. """
+    field_config = state['field_config']
+    sonde = state['sonde']
     z_dict, temp_dict = pyart.retrieve.map_profile_to_gates(
-        sonde.variables[temp_field][:], sonde.variables[alt_field][:], radar)
+        sonde.variables[field_config['temperature']][:],
+        sonde.variables[field_config['altitude']][:], radar)
+    temp_dict['units'] = 'degC'
+    z_dict['units'] = 'm'
+    radar.add_field('sounding_temperature', temp_dict, replace_existing=True)
+    radar.add_field('height', z_dict, replace_existing=True)
+    if state['verbose']:
+        print('##    sounding_temperature')
+        print('##    height')
 
-    if 'clutter_mask_z_for_texture' not in cmac_config.keys():
-        cmac_config['clutter_mask_z_for_texture'] = False
+
+def _snr_stage(radar, state):
+    """ Signal to noise ratio from the reflectivity, unless the radar
+    provides one. """
+    field_config = state['field_config']
+    if field_config['signal_to_noise_ratio'] is None:
+        snr = pyart.retrieve.calculate_snr_from_reflectivity(radar)
+        radar.add_field('signal_to_noise_ratio', snr, replace_existing=True)
+    else:
+        radar.fields[
+            'signal_to_noise_ratio'] = radar.fields.pop(
+                field_config['signal_to_noise_ratio'])
+    if state['verbose']:
+        print('##    signal_to_noise_ratio')
+
+
+def _texture_stage(radar, state):
+    """ Velocity texture, optionally with the clutter masked. """
+    cmac_config = state['cmac_config']
+    vel_field = state['field_config']['velocity']
+    sweep_aware = cmac_config['sweep_aware_filter']
+    filter_threads = cmac_config['filter_threads']
 
     if cmac_config['clutter_mask_z_for_texture']:
         masked_vr = copy.deepcopy(radar.fields[vel_field])
@@ -134,65 +422,73 @@ def cmac(radar, sonde, config, geotiff=None, flip_velocity=False,
         radar.fields[
             'clutter_masked_velocity']['long_name'] = 'Radial mean Doppler velocity, positive for motion away from the instrument, clutter removed'
 
-        texture = get_texture(radar, 'clutter_masked_velocity')
+        texture = get_texture(radar, 'clutter_masked_velocity',
+                              n_threads=filter_threads,
+                              sweep_aware=sweep_aware)
         texture['data'][np.isnan(texture['data'])] = 0.0
     else:
-        texture = get_texture(radar, vel_field)
-    
-    if field_config['signal_to_noise_ratio'] is None:
-        snr = pyart.retrieve.calculate_snr_from_reflectivity(radar)
+        texture = get_texture(radar, vel_field, n_threads=filter_threads,
+                              sweep_aware=sweep_aware)
+    _add_texture(radar, state, texture)
 
-    if not verbose:
-        print('## Adding radar fields...')
 
-    if verbose:
-        print('##')
-        print('## These radar fields are being added:')
-    temp_dict['units'] = 'degC'
-    z_dict['units'] = 'm'
-    radar.add_field('sounding_temperature', temp_dict, replace_existing=True)
-    radar.add_field('height', z_dict, replace_existing=True)
-    if field_config['signal_to_noise_ratio'] is None:
-        radar.add_field('signal_to_noise_ratio', snr, replace_existing=True)
-    else:
-        radar.fields[
-            'signal_to_noise_ratio'] = radar.fields.pop(
-                field_config['signal_to_noise_ratio'])
-        
+def _add_texture(radar, state, texture):
+    texture['units'] = 'm/s'
     radar.add_field('velocity_texture', texture, replace_existing=True)
-    if verbose:
-        print('##    sounding_temperature')
-        print('##    height')
-        print('##    signal_to_noise_ratio')
+    if state['verbose']:
         print('##    velocity_texture')
 
+
+def _beam_blockage_stage(radar, state):
+    """ Partial and cumulative beam blockage from the geotiff, if one is
+    given. """
+    if state['geotiff'] is None:
+        return
+    cmac_config = state['cmac_config']
+    pbb_all, cbb_all = beam_block(
+        radar, state['geotiff'], cmac_config['radar_height_offset'],
+        cmac_config['beam_width'])
+    radar.add_field('partial_beam_blockage', pbb_to_dict(pbb_all),
+                    replace_existing=True)
+    radar.add_field('cumulative_beam_blockage', cbb_to_dict(cbb_all),
+                    replace_existing=True)
+
+
+def _classification_stage(radar, state):
+    """ Gate ids from the fuzzy logic, clutter and beam blockage, and the
+    gate filters derived from them. """
+    cmac_config = state['cmac_config']
+    field_config = state['field_config']
+
     # Performing fuzzy logic to obtain the gate ids.
     rhv_field = field_config['cross_correlation_ratio']
     ncp_field = field_config['normalized_coherent_power']
 
-    if 'mbfs' not in cmac_config:
-        cmac_config['mbfs'] = None
-
-    if 'hard_const' not in cmac_config:
-        cmac_config['hard_const'] = None
-
     # Specifically for dealing with the ingested C-SAPR2 data
 
-    my_fuzz, _ = do_my_fuzz(radar, rhv_field, ncp_field, verbose=verbose,
+    my_fuzz, _ = do_my_fuzz(radar, rhv_field, ncp_field,
+                            verbose=state['verbose'],
                             custom_mbfs=cmac_config['mbfs'],
-                            custom_hard_constraints=cmac_config['hard_const'])
+                            custom_hard_constraints=cmac_config['hard_const'],
+                            sweep_aware=cmac_config['sweep_aware_filter'],
+                            n_threads=cmac_config['filter_threads'])
+    _set_gate_id(radar, state, my_fuzz)
+
 
+def _set_gate_id(radar, state, my_fuzz):
+    """ Adds the fuzzy logic gate ids with the clutter and beam blockage
+    classes, and the gate filters derived from them. """
+    verbose = state['verbose']
     radar.add_field('gate_id', my_fuzz,
                     replace_existing=True)
+    categories = GateCategories.from_notes(my_fuzz['notes'])
+    radar.gate_categories = categories
 
     if 'ground_clutter' in radar.fields.keys():
         # Adding fifth gate id, clutter.
         clutter_data = radar.fields['ground_clutter']['data']
-        gate_data = radar.fields['gate_id']['data'].copy()
         radar.fields['gate_id']['data'][clutter_data == 1] = 5
-        notes = radar.fields['gate_id']['notes']
-        radar.fields['gate_id']['notes'] = notes + ',5:clutter'
-        radar.fields['gate_id']['valid_max'] = 5
+        categories.add('clutter', 5, radar.fields['gate_id'])
         radar.fields['gate_id']['valid_min'] = 0
     
     if 'classification_mask' in radar.fields.keys():
@@ -204,100 +500,208 @@ def cmac(radar, sonde, config, geotiff=None, flip_velocity=False,
         radar.fields['gate_id']['data'][clutter_data == 1] = 0
         radar.fields['gate_id']['data'][clutter_data == 2] = 0
         radar.fields['gate_id']['data'][gate_data == 0] = 0
-        notes = radar.fields['gate_id']['notes']
-        radar.fields['gate_id']['notes'] = notes + ',5:clutter'
-        radar.fields['gate_id']['valid_max'] = 5
+        categories.add('clutter', 5, radar.fields['gate_id'])
         radar.fields['gate_id']['valid_min'] = 0
 
-    if geotiff is not None:
-        pbb_all, cbb_all = beam_block(
-            radar, geotiff, cmac_config['radar_height_offset'],
-            cmac_config['beam_width'])
+    if state['geotiff'] is not None:
+        cbb_all = radar.fields['cumulative_beam_blockage']['data']
         radar.fields['gate_id']['data'][cbb_all > 0.80] = 6
-        notes = radar.fields['gate_id']['notes']
-        radar.fields['gate_id']['notes'] = notes + ',6:terrain_blockage'
-        radar.fields['gate_id']['valid_max'] = 6
-
-        pbb_dict = pbb_to_dict(pbb_all)
-        cbb_dict = cbb_to_dict(cbb_all)
-        radar.add_field('partial_beam_blockage', pbb_dict)
-        radar.add_field('cumulative_beam_blockage', cbb_dict)
+        categories.add('terrain_blockage', 6, radar.fields['gate_id'])
 
     if 'cbb_flag' in radar.fields.keys():
+        # WorkerContext aligns cbb_flag with the rays. A flag missing the
+        # last rays, as read from a file, is padded with its maximum so
+        # they are flagged as blocked.
         cbb = radar.fields['cbb_flag']['data']
-        if cbb.shape[0] < radar.fields['gate_id']['data'].shape[0]:
-            # find the difference in shape
-            sdiff = radar.fields['gate_id']['data'].shape[0] - cbb.shape[0]
-            # pad the cbb gate to match the radar
-            cbb = np.pad(cbb, ((0, sdiff), (0, 0)),  'maximum')
-        radar.fields['gate_id']['data'][cbb == 1] = 6
-        notes = radar.fields['gate_id']['notes']
-        radar.fields['gate_id']['notes'] = notes + ',6:terrain_blockage'
-        radar.fields['gate_id']['valid_max'] = 6
-
-    cat_dict = {}
-    for pair_str in radar.fields['gate_id']['notes'].split(','):
-        cat_dict.update(
-            {pair_str.split(':')[1]:int(pair_str.split(':')[0])})
+        gate_id = radar.fields['gate_id']['data']
+        if cbb.shape[0] < gate_id.shape[0]:
+            sdiff = gate_id.shape[0] - cbb.shape[0]
+            cbb = np.pad(cbb, ((0, sdiff), (0, 0)), 'maximum')
+        if cbb.shape != gate_id.shape:
+            raise ValueError(
+                'The cbb_flag field has shape %s, the radar fields have '
+                'shape %s. Align it with clutter_map.ClutterMap.'
+                % (cbb.shape, gate_id.shape))
+        gate_id[cbb == 1] = 6
+        categories.add('terrain_blockage', 6, radar.fields['gate_id'])
+
+    # The gate ids are final, the class masks are computed once from here.
+    radar.fields['gate_id'].update(categories.flag_metadata())
+    categories.bind(radar.fields['gate_id']['data'])
 
     if verbose:
         print('##    gate_id')
+        for pair_str in categories.notes.split(','):
+            print(pair_str)
+    _classification_state(radar, state, categories)
+
+
+def _restore_snr(radar, state):
+    """ Removes the signal to noise ratio field of the radar that the
+    stage renames to signal_to_noise_ratio. """
+    field_config = state['field_config']
+    if field_config['signal_to_noise_ratio'] is not None:
+        radar.fields.pop(field_config['signal_to_noise_ratio'], None)
+
+
+def _restore_classification(radar, state):
+    """ Rebuilds the gate_id categories of a cached gate_id field. """
+    categories = GateCategories.from_notes(radar.fields['gate_id']['notes'])
+    categories.bind(radar.fields['gate_id']['data'])
+    radar.gate_categories = categories
+    _classification_state(radar, state, categories)
+
 
-    # Corrected velocity using pyart's region dealiaser.
-    cmac_gates = pyart.correct.GateFilter(radar)
-    cmac_gates.exclude_all()
-    cmac_gates.include_equal('gate_id', cat_dict['rain'])
-    cmac_gates.include_equal('gate_id', cat_dict['melting'])
-    cmac_gates.include_equal('gate_id', cat_dict['snow'])
-
-    # Create a simulated velocity field from the sonde object.
-    u_field = field_config['u_wind']
-    v_field = field_config['v_wind']
-    u_wind = sonde[u_field].values
-    v_wind = sonde[v_field].values
-    alt_field = field_config['altitude']
-    sonde_alt = sonde[alt_field].values
+def _classification_state(radar, state, categories):
+    """ Adds the categories, gate filter of the rain, melting and snow
+    gates and fast path decision to the state. """
+    cmac_config = state['cmac_config']
+    cmac_mask = categories.select(['rain', 'melting', 'snow'])
+    if state['volume_inputs'] is not None:
+        precip_gates = state['volume_inputs']['precip_gates']
+    else:
+        precip_gates = cmac_mask.count()
+    fast_path = precip_gates < cmac_config['fast_path_gates']
+    if fast_path:
+        print('## Only %d precipitation gates, skipping dealiasing, phase '
+              'processing and attenuation correction' % precip_gates)
+    state.update({'categories': categories, 'cmac_mask': cmac_mask,
+                  'cmac_gates': cmac_mask.gatefilter(radar),
+                  'precip_gates': precip_gates, 'fast_path': fast_path})
+
+
+def _simulated_velocity_stage(radar, state):
+    """ Velocity simulated from the sonde winds, the reference of the
+    dealiasing. If the velocity reference holds a recent volume, its
+    dealiased velocity is added as the reference_velocity field and used
+    as the reference instead. reference_velocity is only an input of the
+    dealiasing and is removed from the radar once the stages are done, so
+    every volume has the same fields. """
+    _add_simulated_velocity(radar, state)
+    if state['velocity_reference'] is not None:
+        ref_vel = state['velocity_reference'].reference(radar)
+        if ref_vel is not None:
+            radar.add_field('reference_velocity', ref_vel,
+                            replace_existing=True)
+            state['ref_vel_field'] = 'reference_velocity'
+            if state['verbose']:
+                print('##    reference_velocity')
+
+
+def _restore_reference(radar, state):
+    """ Uses the cached reference_velocity field as the reference. """
+    if 'reference_velocity' in radar.fields:
+        state['ref_vel_field'] = 'reference_velocity'
+
+
+def _add_simulated_velocity(radar, state):
+    """ Simulated velocity field from the sonde winds. """
+    field_config = state['field_config']
+    sonde = state['sonde']
+    u_wind = sonde[field_config['u_wind']].values
+    v_wind = sonde[field_config['v_wind']].values
+    sonde_alt = sonde[field_config['altitude']].values
     profile = pyart.core.HorizontalWindProfile.from_u_and_v(
         sonde_alt, u_wind, v_wind)
     sim_vel = pyart.util.simulated_vel_from_profile(radar, profile)
+    sim_vel['units'] = 'm/s'
     radar.add_field('simulated_velocity', sim_vel, replace_existing=True)
+    if state['verbose']:
+        print('##    simulated_velocity')
 
-    # Create the corrected velocity field from the region dealias algorithm.
-    speckled_cmac_gates = pyart.correct.despeckle_field(
-        radar, vel_field, gatefilter=cmac_gates)
-    corr_vel = pyart.correct.dealias_region_based(
-        radar, vel_field=vel_field, ref_vel_field='simulated_velocity',
-        keep_original=False, gatefilter=speckled_cmac_gates, centered=True)
 
+def _dealias_stage(radar, state):
+    """ Corrected velocity using pyart's region dealiaser. """
+    vel_field = state['field_config']['velocity']
+    if state['fast_path']:
+        # Dealiasing no gate only builds the field, masked, with the
+        # metadata and dtype of a dealiased volume.
+        corr_vel = pyart.correct.dealias_region_based(
+            radar, vel_field=vel_field, keep_original=False,
+            gatefilter=_exclude_all(radar), centered=True)
+        nyquist = max([radar.get_nyquist_vel(sweep)
+                       for sweep in range(radar.nsweeps)])
+        corr_vel['valid_min'] = -nyquist
+        corr_vel['valid_max'] = nyquist
+    else:
+        speckled_cmac_gates = pyart.correct.despeckle_field(
+            radar, vel_field, gatefilter=state['cmac_gates'])
+        ref_vel_field = state.get('ref_vel_field', 'simulated_velocity')
+        if (ref_vel_field == 'reference_velocity' and not _reference_overlaps(
+                radar, ref_vel_field, speckled_cmac_gates)):
+            print('## The previous volume does not overlap the gates of '
+                  'every sweep, dealiasing with the sonde winds')
+            ref_vel_field = 'simulated_velocity'
+        corr_vel = pyart.correct.dealias_region_based(
+            radar, vel_field=vel_field, ref_vel_field=ref_vel_field,
+            keep_original=False, gatefilter=speckled_cmac_gates,
+            centered=True)
+
+    corr_vel['units'] = 'm/s'
+    if 'valid_min' not in corr_vel.keys():
+        corr_vel['valid_min'] = -100.0
+
+    if 'valid_max' not in corr_vel.keys():
+        corr_vel['valid_max'] = 100.0
+
+    corr_vel['valid_min'] = np.round(corr_vel['valid_min'], 4)
+    corr_vel['valid_max'] = np.round(corr_vel['valid_max'], 4)
     radar.add_field('corrected_velocity', corr_vel, replace_existing=True)
-    if verbose:
+    if state['verbose']:
         print('##    corrected_velocity')
-        print('##    simulated_velocity')
 
-    fzl = get_melt(radar)
-    
-    # Is the freezing level realistic? If not, assume
-    
+
+def _reference_overlaps(radar, ref_vel_field, gatefilter):
+    """ True if every sweep has a gate where both the reference velocity
+    and the gate filter are valid. """
+    valid = (~np.ma.getmaskarray(radar.fields[ref_vel_field]['data'])
+             & ~gatefilter.gate_excluded)
+    return all([valid[start:end].any() for start, end in zip(
+        radar.sweep_start_ray_index['data'],
+        radar.sweep_end_ray_index['data'] + 1)])
+
+
+def _phase_stage(radar, state):
+    """ LP phase processing and the filtered PhiDP and KDP. """
+    cmac_config = state['cmac_config']
+    field_config = state['field_config']
+    cmac_gates = state['cmac_gates']
+    volume_inputs = state['volume_inputs']
+
+    if volume_inputs is not None:
+        fzl = volume_inputs['fzl']
+        phase_kwargs = {'system_phase': volume_inputs['system_phase'],
+                        'fill_last_sweep': volume_inputs['last_chunk']}
+    else:
+        fzl = get_melt(radar, categories=state['categories'])
+        phase_kwargs = {}
+
     ref_offset = cmac_config['ref_offset']
     self_const = cmac_config['self_const']
+
     # Calculating differential phase fields.
-    radar.fields[field_config['input_phidp_field']]['data'][
-        radar.fields[field_config['input_phidp_field']]['data'] < 0] += 360.0
-    kdp_gates = copy.deepcopy(cmac_gates)
-    kdp_gates.exclude_above('height', fzl)
-
-    phidp, kdp = pyart.correct.phase_proc_lp_gf(
-        radar, gatefilter=kdp_gates, offset=ref_offset, debug=True,
-        LP_solver='cylp', nowrap=50, fzl=fzl, self_const=self_const,
-        phidp_field=field_config['input_phidp_field'],
-        refl_field=field_config['reflectivity'])
-    print("Processed phase")
-    # We do not use KDP, phase above freezing level
-    kdp_gates = copy.deepcopy(cmac_gates)
-    kdp_gates.exclude_above('height', fzl)
+    _unfold_input_phidp(radar, state)
+    kdp_gates = _kdp_gates(radar, state['cmac_mask'], fzl)
+
+    if state['fast_path']:
+        phidp, kdp, unf = phase_field_metadata(
+            radar, phidp_field=field_config['input_phidp_field'])
+        for field in (phidp, kdp, unf):
+            field['data'] = np.ma.masked_all((radar.nrays, radar.ngates))
+        radar.add_field('unfolded_differential_phase', unf,
+                        replace_existing=True)
+    else:
+        phidp, kdp = phase_proc_lp_parallel(
+            radar, gatefilter=kdp_gates, n_workers=state['n_lp_workers'],
+            min_gates=cmac_config['lp_min_gates'],
+            offset=ref_offset, debug=True,
+            LP_solver=cmac_config['lp_solver'], nowrap=50, fzl=fzl,
+            self_const=self_const,
+            phidp_field=field_config['input_phidp_field'],
+            refl_field=field_config['reflectivity'], **phase_kwargs)
+        print("Processed phase")
     phidp_filt, kdp_filt = fix_phase_fields(
-        copy.deepcopy(kdp), copy.deepcopy(phidp), radar.range['data'],
-        cmac_gates)
+        kdp, phidp, radar.range['data'], cmac_gates)
 
     radar.add_field('corrected_differential_phase', phidp,
                     replace_existing=True)
@@ -314,49 +718,48 @@ def cmac(radar, sonde, config, geotiff=None, flip_velocity=False,
     radar.fields[
         'filtered_corrected_specific_diff_phase']['long_name'] = 'Filtered Corrected Specific differential phase (KDP)'
     radar.fields['filtered_corrected_differential_phase']['long_name'] = 'Filtered Corrected Differential Phase'
-    if verbose:
+    radar.fields['unfolded_differential_phase']['long_name'] = 'Unfolded differential propagation phase shift'
+    if state['verbose']:
         print('##    corrected_specific_diff_phase')
         print('##    filtered_corrected_specific_diff_phase')
         print('##    corrected_differential_phase')
         print('##    filtered_corrected_differential_phase')
 
-    # Calculating attenuation by using pyart.
-    refl_field = field_config['reflectivity']
-    attenuation_a_coef = cmac_config['attenuation_a_coef']
-    c_coef = cmac_config['c_coef']
-    d_coef = cmac_config['d_coef']
-    beta_coef = cmac_config['beta_coef']
-    rr_a = cmac_config['rain_rate_a_coef']
-    rr_b = cmac_config['rain_rate_b_coef']
-    zdr_field = field_config['differential_reflectivity']
-
-    radar.fields['corrected_differential_reflectivity'] = copy.deepcopy(
-        radar.fields[zdr_field])
-    radar.fields['corrected_reflectivity'] = copy.deepcopy(
-        radar.fields[refl_field])
-    radar.fields['corrected_reflectivity']['data'] = np.ma.masked_where(
-        cmac_gates.gate_excluded,
-        radar.fields['corrected_reflectivity']['data'])
-
-    # Get specific differential attenuation.
-    # Need height over 0C isobar.
-    iso0 = np.ma.mean(radar.fields['height']['data'][
-        np.where(np.abs(radar.fields['sounding_temperature']['data']) < 0.1)])
-    radar.fields['height_over_iso0'] = copy.deepcopy(radar.fields['height'])
-    radar.fields['height_over_iso0']['data'] -= iso0
-    radar.fields['height_over_iso0']['long_name'] = 'Height of radar beam over freezing level'
-    phidp_field = field_config['phidp_field']
-    
+
+def _kdp_gates(radar, cmac_mask, fzl):
+    """ Gate filter of the phase processing, the precipitation gates
+    below the freezing level. """
+    # We do not use KDP, phase above freezing level
+    above_fzl = GateMask.from_array(
+        np.ma.filled(radar.fields['height']['data'] > fzl, True))
+    return (cmac_mask - above_fzl).gatefilter(radar)
+
+
+def _unfold_input_phidp(radar, state):
+    """ Adds 360 degrees to the negative input differential phase. """
+    phidp_field = state['field_config']['input_phidp_field']
+    radar.fields[phidp_field]['data'][
+        radar.fields[phidp_field]['data'] < 0] += 360.0
+
+
+def _attenuation_stage(radar, state):
+    """ Attenuation correction of reflectivity and differential
+    reflectivity by using pyart. """
+    field_config = state['field_config']
+    iso0 = None
+    if state['volume_inputs'] is not None:
+        iso0 = state['volume_inputs']['iso0']
+    radar.fields.update(attenuation_inputs(
+        radar, field_config, state['cmac_gates'], iso0=iso0))
+
+    # Correcting no gate only builds the fields, masked, with the
+    # metadata and dtype of a corrected volume.
+    gatefilter = state['cmac_gates']
+    if state['fast_path']:
+        gatefilter = _exclude_all(radar)
     (spec_at, pia_dict, cor_z, spec_diff_at,
-     pida_dict, cor_zdr) = pyart.correct.calculate_attenuation_zphi(
-         radar, temp_field='sounding_temperature',
-         iso0_field='height_over_iso0',
-         zdr_field=field_config['zdr_field'],
-         pia_field=field_config['pia_field'],
-         phidp_field=field_config['phidp_field'],
-         refl_field=field_config['refl_field'], c=c_coef, d=d_coef,
-         a_coef=attenuation_a_coef, beta=beta_coef,
-         gatefilter=cmac_gates)
+     pida_dict, cor_zdr) = attenuation_zphi(
+         radar, field_config, state['cmac_config'], gatefilter)
 
     #  cor_zdr['data'] += cmac_config['zdr_offset'] Now taken care of at start
     radar.add_field('specific_attenuation', spec_at, replace_existing=True)
@@ -370,131 +773,343 @@ def cmac(radar, sonde, config, geotiff=None, flip_velocity=False,
     radar.add_field('corrected_differential_reflectivity', cor_zdr,
                     replace_existing=True)
 
-    radar.fields['corrected_velocity']['units'] = 'm/s'
-    if 'valid_min' not in radar.fields['corrected_velocity'].keys():
-        radar.fields['corrected_velocity']['valid_min'] = -100.0
 
-    if 'valid_max' not in radar.fields['corrected_velocity'].keys():
-        radar.fields['corrected_velocity']['valid_max'] = 100.0
+def _rain_rate_stage(radar, state):
+    """ Rain rate from the specific attenuation. """
+    cmac_config = state['cmac_config']
+    _add_rain_rate(radar, state, rain_rate_from_attenuation(
+        radar.fields['specific_attenuation'],
+        cmac_config['rain_rate_a_coef'], cmac_config['rain_rate_b_coef']))
 
-    radar.fields['corrected_velocity']['valid_min'] = np.round(
-        radar.fields['corrected_velocity']['valid_min'], 4)
-    radar.fields['corrected_velocity']['valid_max'] = np.round(
-        radar.fields['corrected_velocity']['valid_max'], 4)
-    radar.fields['simulated_velocity']['units'] = 'm/s'
-    radar.fields['velocity_texture']['units'] = 'm/s'
-    radar.fields['unfolded_differential_phase']['long_name'] = 'Unfolded differential propagation phase shift'
-    cat_dict = {}
-    for pair_str in radar.fields['gate_id']['notes'].split(','):
-        if verbose:
-            print(pair_str)
-        cat_dict.update({pair_str.split(':')[1]: int(pair_str.split(':')[0])})
 
-    rain_gates = pyart.correct.GateFilter(radar)
-    rain_gates.exclude_all()
-    rain_gates.include_equal('gate_id', cat_dict['rain'])
-    
-    # Calculating rain rate.
-    R = rr_a * (radar.fields['specific_attenuation']['data']) ** rr_b
-    rainrate = copy.deepcopy(radar.fields['specific_attenuation'])
-    rainrate['data'] = R
-    rainrate['valid_min'] = 0.0
-    rainrate['valid_max'] = 400.0
-    rainrate['standard_name'] = 'rainfall_rate'
-    rainrate['long_name'] = 'rainfall_rate'
-    rainrate['least_significant_digit'] = 1
-    rainrate['units'] = 'mm/hr'
-    radar.fields.update({'rain_rate_A': rainrate})
-
-    mask = cmac_gates.gate_excluded
-
-    rain_rate_comment = (
-        'Rain rate calculated from specific_attenuation,'
-        + ' R=%s*specific_attenuation**%s, note R=0.0 where' % (
-            str(rr_a), str(rr_b))
-        + ' norm coherent power < 0.4 or rhohv < 0.8')
-    radar.fields['rain_rate_A'].update({
-        'comment': rain_rate_comment})
-
-    if snowfall == True:
-        snow_gates = pyart.correct.GateFilter(radar)
-        snow_gates.exclude_all()
-        snow_gates.include_equal('gate_id', cat_dict['snow'])
-        if verbose:
-            print('## Rainfall rate as a function of A ##')
+def _add_rain_rate(radar, state, rainrate):
+    radar.fields['rain_rate_A'] = rainrate
+    if state['verbose']:
+        print('## Rainfall rate as a function of A ##')
 
-    
-        for zs_key in zs_relationship_dict.keys():
-            abbreviation = zs_relationship_dict[zs_key]["abbreviation"]
-            A = zs_relationship_dict[zs_key]["A"]
-            B = zs_relationship_dict[zs_key]["B"]
-            radar = snow_rate(radar, 1 / snow_density, A, B, zs_key, abbreviation)
-            radar.fields['snow_rate_%s' % abbreviation]['data'] = np.ma.masked_where(snow_gates.gate_excluded,
-            radar.fields['snow_rate_%s' % abbreviation]['data'])
 
+def _snow_rate_stage(radar, state):
+    """ Snowfall rates from the Z-S relationships. """
+    snow_gates = state['categories'].plane('snow').gatefilter(radar)
+    snow_rates(radar, 1 / state['snow_density'], state['zs_relationships'],
+               gatefilter=snow_gates)
+    if state['verbose']:
+        print("## Snowfall rate from Z-S relationship")
 
-    # Calculating snowfall rate
 
-    if verbose:
-        print("## Snowfall rate from Z-S relationship")
+# Functions of the stages of pipeline.STAGES. Each takes the radar and the
+# state dict shared by the stages of a cmac run.
+# Stages run once on the whole volume by cmac_chunked.
+VOLUME_STAGES = ('sounding', 'snr', 'texture', 'beam_blockage',
+                 'classification')
+
+_STAGE_FUNCTIONS = {
+    'sounding': _sounding_stage,
+    'snr': _snr_stage,
+    'texture': _texture_stage,
+    'beam_blockage': _beam_blockage_stage,
+    'classification': _classification_stage,
+    'simulated_velocity': _simulated_velocity_stage,
+    'dealias': _dealias_stage,
+    'phase': _phase_stage,
+    'attenuation': _attenuation_stage,
+    'rain_rate': _rain_rate_stage,
+    'snow_rate': _snow_rate_stage,
+}
+
+# Functions rebuilding what stages read from the stage cache add to the
+# state or to the input fields.
+_STAGE_RESTORE = {
+    'snr': _restore_snr,
+    'classification': _restore_classification,
+    'simulated_velocity': _restore_reference,
+    'phase': _unfold_input_phidp,
+}
+
+
+def _batch_texture_stage(radars, states):
+    """ Velocity texture of the volumes in one call, see
+    cmac_processing.batch_texture. The clutter masked texture is
+    computed volume by volume. """
+    cmac_config = states[0]['cmac_config']
+    if cmac_config['clutter_mask_z_for_texture']:
+        for radar, state in zip(radars, states):
+            _texture_stage(radar, state)
+        return
+    textures = batch_texture(
+        radars, states[0]['field_config']['velocity'],
+        n_threads=cmac_config['filter_threads'],
+        sweep_aware=cmac_config['sweep_aware_filter'])
+    for radar, state, texture in zip(radars, states, textures):
+        _add_texture(radar, state, texture)
+
+
+def _batch_classification_stage(radars, states):
+    """ Fuzzy logic gate ids of the volumes stacked, see
+    cmac_processing.batch_fuzz. """
+    cmac_config = states[0]['cmac_config']
+    field_config = states[0]['field_config']
+    gate_ids = batch_fuzz(
+        radars, field_config['cross_correlation_ratio'],
+        field_config['normalized_coherent_power'],
+        verbose=states[0]['verbose'], custom_mbfs=cmac_config['mbfs'],
+        custom_hard_constraints=cmac_config['hard_const'],
+        sweep_aware=cmac_config['sweep_aware_filter'],
+        n_threads=cmac_config['filter_threads'])
+    for radar, state, (my_fuzz, _) in zip(radars, states, gate_ids):
+        _set_gate_id(radar, state, my_fuzz)
+
+
+def _batch_rain_rate_stage(radars, states):
+    """ Rain rate of the volumes stacked. """
+    cmac_config = states[0]['cmac_config']
+    spec_at = dict(radars[0].fields['specific_attenuation'])
+    spec_at['data'] = np.ma.stack(
+        [radar.fields['specific_attenuation']['data'] for radar in radars])
+    rainrate = rain_rate_from_attenuation(
+        spec_at, cmac_config['rain_rate_a_coef'],
+        cmac_config['rain_rate_b_coef'])
+    for radar, state, data in zip(radars, states, rainrate['data']):
+        field = copy.deepcopy({key: value for key, value in rainrate.items()
+                               if key != 'data'})
+        field['data'] = data
+        _add_rain_rate(radar, state, field)
+
+
+# Functions of the stages computed on a batch of volumes of the same
+# geometry at once, called with the lists of radars and states. The other
+# stages run volume by volume.
+_BATCH_FUNCTIONS = {
+    'texture': _batch_texture_stage,
+    'classification': _batch_classification_stage,
+    'rain_rate': _batch_rain_rate_stage,
+}
+
+
+def batch_key(radar):
+    """ Scan geometry of a volume. Volumes of the same key can be stacked
+    by cmac_batch. """
+    nyquist = None
+    if (radar.instrument_parameters is not None
+            and 'nyquist_velocity' in radar.instrument_parameters):
+        nyquist = float(
+            radar.instrument_parameters['nyquist_velocity']['data'][0])
+    return (radar.scan_type, radar.nrays, radar.ngates,
+            tuple(radar.sweep_start_ray_index['data'].tolist()),
+            tuple(np.round(radar.fixed_angle['data'], 1).tolist()), nyquist)
+
+
+def cmac_batch(volumes, sondes, config, geotiff=None, flip_velocity=False,
+               meta_append=None, verbose=True, snow_density=0.073,
+               snowfall=True, n_lp_workers=1, products=None, max_batch=None,
+               geometry_cache=None):
+    """
+    Runs CMAC 2.0 on several volumes, stacking the volumes of the same scan
+    geometry for the vectorizable stages.
 
-    print('##')
-    print('## All CMAC fields have been added to the radar object.')
-    print('##')
+    The velocity texture, fuzzy logic scores and rain rate are computed
+    once for each group of volumes with the same batch_key, on the
+    fields stacked along a leading volume axis, with filters that do not
+    mix volumes. The stages that depend on the volume alone, such as the
+    dealiasing, LP phase processing and attenuation correction, run on
+    each volume in turn. The fields are those of cmac run on each volume.
 
-    # Adding the metadata to the cmac radar object.
-    print('## Appending metadata')
-    command_line = ''
-    for item in sys.argv:
-        command_line = command_line + ' ' + item
-    if meta_append is None:
-        meta = {
-            'site_id': None,
-            'data_level': 'sgp',
-            'comment': 'This is highly experimental and initial data. '
-                       + 'There are many known and unknown issues. Please do '
-                       + 'not use before contacting the Translator responsible '
-                       + 'scollis@anl.gov',
-            'attributions': 'This data is collected by the ARM Climate Research '
-                            + 'facility. Radar system is operated by the radar '
-                            + 'engineering team radar@arm.gov and the data is '
-                            + 'processed by the precipitation radar products '
-                            + 'team. LP code courtesy of Scott Giangrande, BNL.',
-            'version': '2.0 lite',
-            'vap_name': 'cmac',
-            'known_issues': 'False phidp jumps in insect regions. Still uses '
-                            + 'old Giangrande code.',
-            'developers': 'Robert Jackson, ANL. Zachary Sherman, ANL.',
-            'translator': 'Scott Collis, ANL.',
-            'mentors': 'Bradley Isom, PNNL., Iosif Lindenmaier, PNNL.',
-            'Conventions': 'CF/Radial instrument_parameters ARM-1.3'}
-    else:
-        if meta_append.lower().endswith('.json'):
-            with open(meta_append, 'r') as infile:
-                meta = json.load(infile)
-        elif meta_append == 'config':
-            meta = meta_config
-        else:
-            raise RuntimeError('Must provide the file name of the json file',
-                               'or say config to use the meta data from',
-                               'config.py')
+    Parameters
+    ----------
+    volumes : list
+        Radar objects to use in the CMAC calculation.
+    sondes : list or xarray Dataset
+        Sonde data of each volume, or one sonde for all of them.
+    config : str
+        A string pointing to dictionaries containing values for CMAC 2.0
+        specific to a radar.
 
-    radar.metadata.clear()
-    radar.metadata.update(meta)
-    radar.metadata['command_line'] = command_line
+    Other Parameters
+    ----------------
+    max_batch : int
+        Maximum number of volumes stacked at a time, bounding the memory
+        of the stacked fields. None stacks every volume of a group.
+    geotiff, flip_velocity, meta_append, verbose, snow_density, snowfall,
+    n_lp_workers, products, geometry_cache
+        See cmac.
+
+    Returns
+    -------
+    radars : list
+        Radar objects with new CMAC added fields, in the order of volumes.
+    """
+    volumes = list(volumes)
+    if not isinstance(sondes, (list, tuple)):
+        sondes = [sondes] * len(volumes)
+    cmac_config = get_cmac_values(config)
+    field_config = get_field_names(config)
+    meta_config = get_metadata(config)
+    zs_relationship_dict = get_zs_relationships()
+    _config_defaults(cmac_config)
+    stages = _cmac_stages(products, snowfall)
+
+    groups = OrderedDict()
+    for index, radar in enumerate(volumes):
+        groups.setdefault(batch_key(radar), []).append(index)
+    batches = []
+    for indices in groups.values():
+        size = len(indices) if max_batch is None else max_batch
+        batches.extend([indices[start:start + size]
+                        for start in range(0, len(indices), size)])
+
+    for indices in batches:
+        radars = [volumes[index] for index in indices]
+        states = []
+        for index, radar in zip(indices, radars):
+            _prepare_volume(radar, cmac_config, field_config, flip_velocity)
+            if geometry_cache is not None:
+                geometry_cache.apply(radar)
+            states.append(_stage_state(
+                sondes[index], cmac_config, field_config, verbose, geotiff,
+                n_lp_workers, snow_density, zs_relationship_dict))
+        print('## Processing a batch of %d volumes' % len(radars))
+        for name in stages:
+            if name in _BATCH_FUNCTIONS and len(radars) > 1:
+                _BATCH_FUNCTIONS[name](radars, states)
+            else:
+                for radar, state in zip(radars, states):
+                    _STAGE_FUNCTIONS[name](radar, state)
+        for radar, state in zip(radars, states):
+            _finish_volume(radar, state, stages, products, meta_append,
+                           meta_config)
+    return volumes
+
+
+def cmac_chunked(radar, sonde, config, sweeps_per_chunk=1, **kwargs):
+    """
+    Runs CMAC 2.0 on groups of sweeps instead of on the whole volume, and
+    joins the results back together. This bounds the peak memory of the
+    dealiasing, phase processing and attenuation correction for large
+    volumes.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar object to use in the CMAC calculation.
+    sonde : xarray Dataset
+        Object containing all the sonde data.
+    config : str
+        A string pointing to dictionaries containing values for CMAC 2.0
+        specific to a radar.
+
+    Other Parameters
+    ----------------
+    sweeps_per_chunk : int
+        Number of sweeps processed at a time.
+    kwargs : dict
+        Keyword arguments passed on to cmac.
+
+    Returns
+    -------
+    radar : Radar
+        Radar object with new CMAC added fields.
+
+    Notes
+    -----
+    The stages of VOLUME_STAGES, the sounding, texture and gate id
+    classification, run once on the whole volume, from which the freezing
+    level, the 0C isotherm height, the system phase and the number of
+    precipitation gates are also taken, see volume_inputs of cmac. The
+    other stages run on each chunk, and the coverage statistics are
+    computed on the joined volume, so the fields and metadata are those
+    of cmac on the whole volume.
+    """
+    if sweeps_per_chunk >= radar.nsweeps:
+        return cmac(radar, sonde, config, **kwargs)
+
+    volume, inputs = _volume_inputs(radar, sonde, config, **kwargs)
+    volume_fields = inputs['fields']
+    chunk_fields = []
+    for start in range(0, radar.nsweeps, sweeps_per_chunk):
+        sweeps = list(range(start, min(start + sweeps_per_chunk,
+                                       radar.nsweeps)))
+        rays = slice(radar.sweep_start_ray_index['data'][sweeps[0]],
+                     radar.sweep_end_ray_index['data'][sweeps[-1]] + 1)
+        inputs['fields'] = {
+            name: dict(field, data=field['data'][rays])
+            for name, field in volume_fields.items()}
+        inputs['last_chunk'] = sweeps[-1] == radar.nsweeps - 1
+        chunk = cmac(radar.extract_sweeps(sweeps), sonde, config,
+                     volume_inputs=inputs, **kwargs)
+        chunk_fields.append(chunk.fields)
+        if start == 0:
+            metadata = chunk.metadata
+            altitude = chunk.altitude
+        del chunk
+
+    fields = {}
+    for field in chunk_fields[0].keys():
+        if not all([field in x for x in chunk_fields]):
+            continue
+        fields[field] = chunk_fields[0][field].copy()
+        fields[field]['data'] = np.ma.concatenate(
+            [x[field]['data'] for x in chunk_fields])
+    if 'gate_id' in fields:
+        fields['gate_id']['valid_max'] = max(
+            [x['gate_id']['valid_max'] for x in chunk_fields])
+    radar.fields = fields
+    radar.metadata = metadata
+    radar.altitude = altitude
+    cmac_config = get_cmac_values(config)
+    _config_defaults(cmac_config)
+    _add_statistics(radar, cmac_config, volume.gate_categories)
     return radar
 
 
+def _volume_inputs(radar, sonde, config, **kwargs):
+    """ Runs the stages of VOLUME_STAGES on a copy of the whole volume.
+    Returns the copy and the volume_inputs of cmac, see cmac_chunked. """
+    kwargs['products'] = VOLUME_STAGES
+    volume = cmac(radar.extract_sweeps(list(range(radar.nsweeps))), sonde,
+                  config, **kwargs)
+    field_config = get_field_names(config)
+    categories = volume.gate_categories
+    cmac_mask = categories.select(['rain', 'melting', 'snow'])
+    fzl = get_melt(volume, categories=categories)
+    _unfold_input_phidp(volume, {'field_config': field_config})
+    phase = system_phase(volume, _kdp_gates(volume, cmac_mask, fzl),
+                         phidp_field=field_config['input_phidp_field'])
+    fields = {name: volume.fields[name] for stage in VOLUME_STAGES
+              for name in STAGES[stage]['fields'] if name in volume.fields}
+    return volume, {'fields': fields, 'fzl': fzl,
+                    'iso0': iso0_height(volume), 'system_phase': phase,
+                    'precip_gates': cmac_mask.count(), 'last_chunk': True}
+
+
+def _volume_stage(name, fields):
+    """ Stage function adding the fields of a stage computed on the whole
+    volume, see cmac_chunked. """
+    def _stage(radar, state):
+        radar.fields.update({field: fields[field]
+                             for field in STAGES[name]['fields']
+                             if field in fields})
+        restore = _STAGE_RESTORE.get(name)
+        if restore is not None:
+            restore(radar, state)
+    return _stage
+
+
+def _exclude_all(radar):
+    """ GateFilter excluding every gate. """
+    gatefilter = pyart.correct.GateFilter(radar)
+    gatefilter.exclude_all()
+    return gatefilter
+
+
 def area_coverage(radar, precip_threshold=10.0, convection_threshold=40.0):
-    """ Returns percent coverage of precipitation and convection. """
-    temp_radar = radar.extract_sweeps([0])
-    ref = temp_radar.fields['corrected_reflectivity']['data']
-    total_len = len(ref.flatten())
-    ref_10_len = len(np.argwhere(ref >= precip_threshold))
-    ref_40_len = len(np.argwhere(ref >= convection_threshold))
-    ref_10_per = (ref_10_len/total_len)*100
-    ref_40_per = (ref_40_len/total_len)*100
-    del temp_radar
+    """ Returns percent coverage of precipitation and convection in the
+    first sweep. See radar_statistics.coverage_statistics for more
+    statistics. """
+    sweep_stats = coverage_statistics(
+        radar, thresholds=(precip_threshold, convection_threshold),
+        sweeps=(0,))['sweep_0']
+    ref_10_per = sweep_stats[coverage_key(precip_threshold)]
+    ref_40_per = sweep_stats[coverage_key(convection_threshold)]
     return ref_10_per, ref_40_per
 
 
@@ -0,0 +1,164 @@
+""" Registry of the gate_id classes. The registry owns the class ids, names
+and plot colors of the gate_id field, writes its notes and flag metadata,
+and keeps one packed mask per class so the gate filters of CMAC are derived
+with bitwise operations instead of each rescanning the gate_id array. """
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .gate_masks import GateMask
+
+# Quicklook colors of the gate_id classes.
+DEFAULT_CATEGORY_COLORS = {'multi_trip': 'red',
+                           'rain': 'green',
+                           'snow': 'cyan',
+                           'no_scatter': 'gray',
+                           'melting': 'yellow',
+                           'clutter': 'black',
+                           'terrain_blockage': 'brown'}
+
+
+class GateCategories(object):
+    """
+    Class ids, names and colors of a gate_id field, with cached per class
+    masks stored as packed bit planes, see gate_masks.GateMask.
+
+    Parameters
+    ----------
+    names : list
+        Class names, in order of class id starting at 0.
+
+    Other Parameters
+    ----------------
+    colors : dict
+        Colors of the classes, by name. Classes without a color use
+        DEFAULT_CATEGORY_COLORS.
+
+    """
+    def __init__(self, names=(), colors=None):
+        self.ids = OrderedDict()
+        for class_id, name in enumerate(names):
+            self.ids[name] = class_id
+        self.colors = dict(DEFAULT_CATEGORY_COLORS)
+        if colors is not None:
+            self.colors.update(colors)
+        self.source_notes = None
+        self._data = None
+        self._planes = {}
+
+    @classmethod
+    def from_notes(cls, notes):
+        """ Creates the registry from a notes string of id:name pairs
+        separated by commas, as written in the gate_id field. """
+        categories = cls()
+        categories.source_notes = notes
+        for pair_str in notes.split(','):
+            class_id, name = pair_str.split(':')
+            categories.ids[name] = int(class_id)
+        return categories
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __getitem__(self, name):
+        return self.ids[name]
+
+    def __repr__(self):
+        return 'GateCategories(%s)' % self.notes
+
+    @property
+    def notes(self):
+        """ Notes string of the gate_id field. """
+        return ','.join('%d:%s' % (class_id, name)
+                        for name, class_id in self.ids.items())
+
+    def sorted_items(self):
+        """ Returns a list of (name, id) pairs sorted by id. """
+        return sorted(self.ids.items(), key=lambda item: item[1])
+
+    def color_list(self):
+        """ Returns the colors of the classes sorted by id. """
+        return [self.colors.get(name, 'white')
+                for name, _ in self.sorted_items()]
+
+    def flag_metadata(self):
+        """ Returns the notes and CF flag attributes of the gate_id
+        field. """
+        items = self.sorted_items()
+        return {'notes': self.notes,
+                'flag_values': np.array([class_id for _, class_id in items]),
+                'flag_meanings': ' '.join(name for name, _ in items)}
+
+    def add(self, name, class_id, field=None):
+        """ Registers a class, which replaces any class with the same name.
+        If the gate_id field is given its notes and valid_max are
+        updated. """
+        self.ids[name] = class_id
+        self._planes.clear()
+        if field is not None:
+            field['notes'] = self.notes
+            field['valid_max'] = class_id
+        return class_id
+
+    def bind(self, data):
+        """ Sets the gate_id array the masks are computed from and packs
+        the bit plane of every class. Call it again after gate_id is
+        changed in place. """
+        self._data = data
+        self._planes.clear()
+        for name in self.ids:
+            self.plane(name)
+
+    def plane(self, name):
+        """ GateMask of the gates of the class name. """
+        if name not in self._planes:
+            if self._data is None:
+                raise ValueError('No gate_id data bound to the registry.')
+            self._planes[name] = GateMask.from_array(
+                self._data == self.ids[name])
+        return self._planes[name]
+
+    def select(self, names):
+        """ GateMask of the gates of any of the classes in names. """
+        result = self.plane(names[0])
+        for name in names[1:]:
+            result = result | self.plane(name)
+        return result
+
+    def mask(self, name):
+        """ Boolean array, True where the gate is of the class name. """
+        return self.plane(name).to_array()
+
+    def mask_any(self, names):
+        """ Boolean array, True where the gate is of any of the classes
+        in names. """
+        return self.select(names).to_array()
+
+    def gatefilter(self, radar, names):
+        """ GateFilter that includes only the gates of the classes in
+        names. """
+        return self.select(names).gatefilter(radar)
+
+
+def get_gate_categories(radar, field='gate_id'):
+    """
+    Returns the category registry of the gate_id field of a radar.
+
+    Field dictionaries are written verbatim as netCDF attributes, so the
+    registry is attached to the radar as radar.gate_categories rather than
+    stored in the field. It is rebuilt from the field notes, and attached,
+    when the radar has none or its notes no longer match, for example
+    for a radar read back from a CMAC file.
+
+    """
+    data = radar.fields[field]['data']
+    notes = radar.fields[field]['notes']
+    categories = getattr(radar, 'gate_categories', None)
+    if categories is None or notes not in (categories.notes,
+                                           categories.source_notes):
+        categories = GateCategories.from_notes(notes)
+        radar.gate_categories = categories
+    if categories._data is not data:
+        categories.bind(data)
+    return categories
@@ -0,0 +1,111 @@
+""" Gate mask algebra on packed bit planes. A GateMask stores one bit per
+gate, so combining masks with |, & and ~ touches an eighth of the memory of
+boolean arrays and an order of magnitude less than rescanning gate_id. The
+gate filters of CMAC are derived from the per class masks of the gate_id
+registry, see gate_categories.GateCategories.select. """
+
+import numpy as np
+import pyart
+
+
+class GateMask(object):
+    """
+    Set of gates of a radar volume stored as a packed bit plane.
+
+    Masks are combined with | (union), & (intersection), - (difference) and
+    ~ (complement), and converted back to a boolean array or a GateFilter
+    once they are composed.
+
+    Parameters
+    ----------
+    bits : array
+        Packed uint8 bits, as returned by numpy.packbits of the flattened
+        boolean mask.
+    shape : tuple
+        Shape of the boolean mask, (nrays, ngates).
+
+    """
+    def __init__(self, bits, shape):
+        self.bits = bits
+        self.shape = tuple(shape)
+
+    @classmethod
+    def from_array(cls, mask):
+        """ Packs a boolean array, masked values are treated as False. """
+        mask = np.ma.filled(mask, False)
+        return cls(np.packbits(mask.ravel()), mask.shape)
+
+    @classmethod
+    def from_gatefilter(cls, gatefilter):
+        """ Packs the gates included by a GateFilter. """
+        return cls.from_array(gatefilter.gate_included)
+
+    @classmethod
+    def empty(cls, shape):
+        """ Mask with no gates set. """
+        size = int(np.prod(shape))
+        return cls(np.zeros((size + 7) // 8, dtype=np.uint8), shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def _check(self, other):
+        if not isinstance(other, GateMask):
+            other = GateMask.from_array(other)
+        if other.shape != self.shape:
+            raise ValueError('Gate masks of shapes %s and %s can not be '
+                             'combined.' % (self.shape, other.shape))
+        return other
+
+    def __or__(self, other):
+        return GateMask(self.bits | self._check(other).bits, self.shape)
+
+    def __and__(self, other):
+        return GateMask(self.bits & self._check(other).bits, self.shape)
+
+    def __sub__(self, other):
+        return GateMask(self.bits & ~self._check(other).bits, self.shape)
+
+    def __invert__(self):
+        bits = ~self.bits
+        # Clear the padding bits of the last byte.
+        spare = self.bits.size * 8 - self.size
+        if spare:
+            bits[-1] &= np.uint8((0xFF << spare) & 0xFF)
+        return GateMask(bits, self.shape)
+
+    def __eq__(self, other):
+        return (isinstance(other, GateMask) and self.shape == other.shape
+                and np.array_equal(self.bits, other.bits))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'GateMask(shape=%s, count=%d)' % (self.shape, self.count())
+
+    def count(self):
+        """ Number of gates in the mask. """
+        return int(np.unpackbits(self.bits, count=self.size).sum())
+
+    def count_rays(self, start, stop):
+        """ Number of gates in the mask in rays start to stop, stop
+        excluded, unpacking only the bytes of those rays. """
+        ngates = self.shape[1]
+        first, last = start * ngates, stop * ngates
+        byte_start = first // 8
+        bits = np.unpackbits(self.bits[byte_start:(last + 7) // 8])
+        offset = first - byte_start * 8
+        return int(np.count_nonzero(bits[offset:offset + last - first]))
+
+    def to_array(self):
+        """ Boolean array of the mask. """
+        return np.unpackbits(
+            self.bits, count=self.size).view(bool).reshape(self.shape)
+
+    def gatefilter(self, radar):
+        """ GateFilter that includes only the gates in the mask. """
+        gatefilter = pyart.correct.GateFilter(radar)
+        gatefilter.exclude_gates(~self.to_array())
+        return gatefilter
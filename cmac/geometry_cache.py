@@ -0,0 +1,170 @@
+""" Cache of the gate geometry of fixed scan strategies. Py-ART computes the
+Cartesian, geographic and altitude coordinates of every gate lazily for
+each radar object, although they only depend on the site, the range gates
+and the ray angles, which do not change from one volume of a scan strategy
+to the next. The geometry is computed once per scan layout, shared as read
+only arrays, and optionally stored as .npy files that every worker on a
+node memory maps. """
+
+from collections import OrderedDict
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pyart
+
+# Gate coordinates, in the order they are computed and stored.
+GEOMETRY_NAMES = ('gate_x', 'gate_y', 'gate_z', 'gate_longitude',
+                  'gate_latitude', 'gate_altitude')
+
+
+class GeometryCache(object):
+    """
+    Gate coordinates of the scan layouts seen, keyed on the site location,
+    the range gates and the ray angles quantized to angle_quantum.
+
+    Parameters
+    ----------
+    directory : str
+        If given, the coordinates are stored as .npy files in a sub
+        directory per scan layout and memory mapped read only, so
+        processes on a node share them. If None, they are only kept in
+        memory.
+
+    Other Parameters
+    ----------------
+    angle_quantum : float
+        Resolution in degrees the azimuths and elevations are rounded to,
+        for the key and for computing the coordinates, so volumes with
+        pointing jitter below it share a layout. None uses the angles
+        as they are.
+    max_layouts : int
+        Number of scan layouts kept in memory.
+
+    """
+
+    def __init__(self, directory=None, angle_quantum=0.01, max_layouts=8):
+        self.directory = directory
+        self.angle_quantum = angle_quantum
+        self.max_layouts = max_layouts
+        self._layouts = OrderedDict()
+
+    def __getstate__(self):
+        # Workers rebuild or memory map the layouts, they are not pickled.
+        state = self.__dict__.copy()
+        state['_layouts'] = OrderedDict()
+        return state
+
+    def _angles(self, radar):
+        # The angles keep the dtype of the radar, the coordinates are
+        # then computed in the same precision as Py-ART computes them.
+        azimuth = radar.azimuth['data']
+        elevation = radar.elevation['data']
+        if self.angle_quantum is not None:
+            azimuth = (np.round(azimuth / self.angle_quantum)
+                       * self.angle_quantum).astype(azimuth.dtype)
+            elevation = (np.round(elevation / self.angle_quantum)
+                         * self.angle_quantum).astype(elevation.dtype)
+        return azimuth, elevation
+
+    def key(self, radar):
+        """ SHA1 hash of the scan layout of a radar. """
+        azimuth, elevation = self._angles(radar)
+        sha = hashlib.sha1()
+        for data in (radar.latitude['data'], radar.longitude['data'],
+                     radar.altitude['data'], radar.range['data'], azimuth,
+                     elevation):
+            sha.update(np.ascontiguousarray(
+                data, dtype='float64').tobytes())
+        sha.update(repr(sorted(radar.projection.items())).encode())
+        return sha.hexdigest()
+
+    def geometry(self, radar):
+        """
+        Gate coordinates of a radar.
+
+        Parameters
+        ----------
+        radar : Radar
+            Radar object of a fixed platform.
+
+        Returns
+        -------
+        geometry : dict
+            Read only array of shape (nrays, ngates) of each name of
+            GEOMETRY_NAMES.
+
+        """
+        key = self.key(radar)
+        if key in self._layouts:
+            self._layouts.move_to_end(key)
+            return self._layouts[key]
+        geometry = None
+        if self.directory is not None:
+            geometry = self._load(key)
+        if geometry is None:
+            geometry = self._compute(radar)
+            for data in geometry.values():
+                data.setflags(write=False)
+            if self.directory is not None:
+                self._store(key, geometry)
+                geometry = self._load(key)
+        self._layouts[key] = geometry
+        if len(self._layouts) > self.max_layouts:
+            self._layouts.popitem(last=False)
+        return geometry
+
+    def apply(self, radar):
+        """ Sets the gate coordinate attributes of a radar to the cached
+        arrays. Moving platforms, whose site changes from ray to ray, are
+        left to Py-ART. """
+        if (len(radar.latitude['data']) > 1
+                or len(radar.longitude['data']) > 1
+                or len(radar.altitude['data']) > 1):
+            return radar
+        geometry = self.geometry(radar)
+        for name in GEOMETRY_NAMES:
+            field = pyart.config.get_metadata(name)
+            field['data'] = geometry[name]
+            setattr(radar, name, field)
+        return radar
+
+    def _compute(self, radar):
+        """ Gate coordinates as Py-ART computes them, from the quantized
+        angles. """
+        azimuth, elevation = self._angles(radar)
+        x, y, z = pyart.core.antenna_vectors_to_cartesian(
+            radar.range['data'], azimuth, elevation, edges=False)
+        projparams = radar.projection.copy()
+        if projparams.pop('_include_lon_0_lat_0', False):
+            projparams['lon_0'] = radar.longitude['data'][0]
+            projparams['lat_0'] = radar.latitude['data'][0]
+        lon, lat = pyart.core.cartesian_to_geographic(x, y, projparams)
+        altitude = radar.altitude['data'] + z
+        return OrderedDict(zip(GEOMETRY_NAMES, (x, y, z, lon, lat, altitude)))
+
+    def _layout_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def _load(self, key):
+        layout_dir = self._layout_dir(key)
+        if not os.path.isdir(layout_dir):
+            return None
+        return OrderedDict([
+            (name, np.load(os.path.join(layout_dir, name + '.npy'),
+                           mmap_mode='r')) for name in GEOMETRY_NAMES])
+
+    def _store(self, key, geometry):
+        # Written to a temporary directory and renamed so concurrent
+        # workers never map a partial layout.
+        os.makedirs(self.directory, exist_ok=True)
+        part_dir = tempfile.mkdtemp(dir=self.directory, prefix=key + '.')
+        for name, data in geometry.items():
+            np.save(os.path.join(part_dir, name + '.npy'), data)
+        try:
+            os.rename(part_dir, self._layout_dir(key))
+        except OSError:
+            # Another worker stored the layout first.
+            shutil.rmtree(part_dir, ignore_errors=True)
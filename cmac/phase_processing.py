@@ -0,0 +1,361 @@
+""" Parallel LP phase processing. The rays of a volume are split into
+batches that are solved by Py-ART's LP phase processor in separate worker
+processes, and the results are joined back into full volume fields. """
+
+import copy
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pyart
+
+_SOLVER_MODULES = {'cylp': 'cylp', 'cylp_mp': 'cylp',
+                   'cvxopt': 'cvxopt', 'pyglpk': 'glpk'}
+
+
+def solver_available(LP_solver='cylp'):
+    """ Returns True if the python module of an LP solver can be
+    imported. """
+    try:
+        __import__(_SOLVER_MODULES.get(LP_solver, LP_solver))
+    except ImportError:
+        return False
+    return True
+
+
+def phase_proc_lp_parallel(radar, gatefilter, n_workers=1,
+                           rays_per_batch=None, LP_solver='cylp',
+                           min_gates=None, fill_last_sweep=True, **kwargs):
+    """
+    LP phase processing with the rays solved in parallel processes.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar object to process.
+    gatefilter : GateFilter
+        Gates to exclude from the phase processing.
+
+    Other Parameters
+    ----------------
+    n_workers : int
+        Number of worker processes. With one worker and no min_gates,
+        pyart.correct.phase_proc_lp_gf is called on the whole volume.
+    rays_per_batch : int
+        Number of rays solved per task. Batches never cross sweep
+        boundaries. Defaults to splitting the rays into four batches per
+        worker.
+    LP_solver : str
+        LP solver passed to pyart.correct.phase_proc_lp_gf.
+    min_gates : int
+        If given, only rays with at least min_gates gates included by the
+        gatefilter are solved. The other rays hold zero phase and KDP, so
+        the solver time scales with the precipitation coverage rather
+        than the volume size. Their unfolded differential phase is still
+        computed.
+    fill_last_sweep : bool
+        If False, the last sweep is solved like the others, without the
+        fill of its last gates described below, as for sweeps that are
+        not the end of the volume.
+    kwargs : dict
+        Keyword arguments passed on to pyart.correct.phase_proc_lp_gf.
+
+    Returns
+    -------
+    phidp, kdp : dict
+        Field dictionaries of the processed differential phase and
+        specific differential phase. Like phase_proc_lp_gf, the unfolded
+        differential phase field is added to the radar.
+
+    Raises
+    ------
+    ImportError
+        If the module of LP_solver can not be imported.
+
+    Notes
+    -----
+    The system phase is determined once from the whole volume, so every
+    batch uses the same system phase as a single process run. Within a
+    worker the LP constraint matrix depends only on the number of gates,
+    so it is built once and reused for every batch the worker solves.
+    phase_proc_lp_gf sets the last 16 gates of the rays of the last sweep
+    to the phase of the 16th last gate. Batches of the other sweeps are
+    solved with one extra ray as a last sweep, which takes that fill and
+    is dropped, so the fields equal those of a single process run.
+    """
+    if not solver_available(LP_solver):
+        raise ImportError('The module of the %s LP solver can not be '
+                          'imported, install it or choose another '
+                          'LP_solver.' % LP_solver)
+    if n_workers <= 1 and min_gates is None and fill_last_sweep:
+        return pyart.correct.phase_proc_lp_gf(
+            radar, gatefilter=gatefilter, LP_solver=LP_solver, **kwargs)
+
+    phidp_field = kwargs.get('phidp_field')
+    if phidp_field is None:
+        phidp_field = pyart.config.get_field_name('differential_phase')
+    refl_field = kwargs.get('refl_field')
+    if refl_field is None:
+        refl_field = pyart.config.get_field_name('reflectivity')
+    kdp_field = kwargs.get('kdp_field')
+    if kdp_field is None:
+        kdp_field = pyart.config.get_field_name(
+            'specific_differential_phase')
+    unf_field = kwargs.get('unf_field')
+    if unf_field is None:
+        unf_field = pyart.config.get_field_name(
+            'unfolded_differential_phase')
+
+    if kwargs.get('system_phase') is None:
+        kwargs['system_phase'] = system_phase(
+            radar, gatefilter, phidp_field=phidp_field,
+            first_gate_sysp=kwargs.get('first_gate_sysp'))
+
+    excluded = gatefilter.gate_excluded
+    if min_gates is None:
+        solved = np.ones(radar.nrays, dtype=bool)
+    else:
+        solved = np.count_nonzero(~excluded, axis=1) >= min_gates
+    nsolved = int(np.count_nonzero(solved))
+    print('## Solving the LP for %d of %d rays' % (nsolved, radar.nrays))
+    if rays_per_batch is None:
+        rays_per_batch = max(
+            int(np.ceil(nsolved / (4.0 * max(n_workers, 1)))), 1)
+    batches = _ray_batches(radar, rays_per_batch, solved)
+    field_names = [fld for fld in (
+        phidp_field, refl_field, kwargs.get('ncp_field'),
+        kwargs.get('rhv_field')) if fld is not None and fld in radar.fields]
+
+    # Batches of all but the last sweep get a padding sweep. Subsets are
+    # built as they are submitted, and at most two batches per worker
+    # are in flight, so they are not all held at once.
+    pads = [not fill_last_sweep or _ray_sweep(radar, rays) != radar.nsweeps - 1
+            for rays in batches]
+    jobs = ((_ray_subset_radar(radar, rays, field_names, pad),
+             excluded[rays], LP_solver, kwargs)
+            for rays, pad in zip(batches, pads))
+    if n_workers > 1 and len(batches) > 1:
+        results = [None] * len(batches)
+        pending = {}
+        with ProcessPoolExecutor(max_workers=n_workers,
+                                 initializer=_init_lp_worker) as executor:
+            for index, job in enumerate(jobs):
+                if len(pending) >= 2 * n_workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results[pending.pop(future)] = future.result()
+                pending[executor.submit(_solve_batch, *job)] = index
+            for future, index in pending.items():
+                results[index] = future.result()
+    else:
+        results = [_solve_batch(*job) for job in jobs]
+
+    # Rays that are not solved hold zero phase, relative to the system
+    # phase, and zero KDP. Their unfolded phase is the input phase
+    # unfolded as for the solved rays.
+    templates = phase_field_metadata(radar, phidp_field, kdp_field)
+    fields = []
+    for i in range(3):
+        if results:
+            field = copy.copy(results[0][i])
+        else:
+            field = templates[i]
+        data = np.ma.MaskedArray(
+            np.zeros((radar.nrays, radar.ngates), dtype=np.float64),
+            mask=np.zeros((radar.nrays, radar.ngates), dtype=bool))
+        for rays, result in zip(batches, results):
+            data[rays] = result[i]['data']
+        field['data'] = data
+        fields.append(field)
+    unsolved = np.flatnonzero(~solved)
+    if len(unsolved) > 0:
+        fields[2]['data'][unsolved] = _unfold_rays(
+            radar, unsolved, excluded, phidp_field, kwargs)
+    radar.add_field(unf_field, fields[2], replace_existing=True)
+    return fields[0], fields[1]
+
+
+def system_phase(radar, gatefilter, phidp_field=None, first_gate_sysp=None):
+    """
+    System phase as pyart.correct.phase_proc_lp_gf determines it, from
+    the first sweep of the volume, -135 if it can not be determined.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar object holding the differential phase field.
+    gatefilter : GateFilter
+        Gates to exclude from the phase processing.
+
+    Other Parameters
+    ----------------
+    phidp_field : str
+        Name of the differential phase field. None uses the Py-ART
+        default name.
+    first_gate_sysp : int
+        First gate of the rays used, 0 if None.
+
+    Returns
+    -------
+    system_phase : float
+        System phase in degrees.
+
+    """
+    if phidp_field is None:
+        phidp_field = pyart.config.get_field_name('differential_phase')
+    phase = pyart.correct.phase_proc.det_sys_phase_gf(
+        radar, gatefilter, phidp_field=phidp_field,
+        first_gate=0 if first_gate_sysp is None else int(first_gate_sysp))
+    if phase is None:
+        phase = -135.0
+    return phase
+
+
+def phase_field_metadata(radar, phidp_field=None, kdp_field=None):
+    """
+    Metadata of the fields of the LP phase processing, as
+    pyart.correct.phase_proc_lp_gf sets it.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar object holding the differential phase field.
+
+    Other Parameters
+    ----------------
+    phidp_field, kdp_field : str
+        Names of the differential phase and specific differential phase
+        fields. None uses the Py-ART default names.
+
+    Returns
+    -------
+    phidp, kdp, unf : dict
+        Field dictionaries, without data, of the processed differential
+        phase, the specific differential phase and the unfolded
+        differential phase.
+
+    """
+    if phidp_field is None:
+        phidp_field = pyart.config.get_field_name('differential_phase')
+    if kdp_field is None:
+        kdp_field = pyart.config.get_field_name(
+            'specific_differential_phase')
+    unf = copy.deepcopy({key: value for key, value in
+                         radar.fields[phidp_field].items() if key != 'data'})
+    phidp = copy.deepcopy(unf)
+    phidp['valid_min'] = 0.0
+    phidp['valid_max'] = 400.0
+    if kdp_field in radar.fields:
+        kdp = copy.deepcopy({key: value for key, value in
+                             radar.fields[kdp_field].items()
+                             if key != 'data'})
+    else:
+        kdp = pyart.config.get_metadata(kdp_field)
+    kdp['_FillValue'] = pyart.config.get_fillvalue()
+    return phidp, kdp, unf
+
+
+def _ray_batches(radar, rays_per_batch, solved=None):
+    """ Returns arrays of the indices of batches of at most rays_per_batch
+    rays that do not cross sweep boundaries. If solved is given, only the
+    rays where it is True are batched. """
+    batches = []
+    for sweep_start, sweep_end in zip(
+            radar.sweep_start_ray_index['data'],
+            radar.sweep_end_ray_index['data']):
+        rays = np.arange(int(sweep_start), int(sweep_end) + 1)
+        if solved is not None:
+            rays = rays[solved[rays]]
+        for start in range(0, len(rays), rays_per_batch):
+            batches.append(rays[start:start + rays_per_batch])
+    return batches
+
+
+def _ray_sweep(radar, rays):
+    """ Sweep of a batch of rays. """
+    return int(np.searchsorted(radar.sweep_end_ray_index['data'], rays[0]))
+
+
+def _ray_subset_radar(radar, rays, field_names, pad_sweep=False):
+    """ Returns a single sweep radar holding the given rays of the given
+    fields, used to ship a batch to a worker. If pad_sweep is True, the
+    first ray is repeated as a second sweep of one ray. """
+    nrays = len(rays)
+    sweep = _ray_sweep(radar, rays)
+    sweeps = [sweep]
+    if pad_sweep:
+        rays = np.append(rays, rays[0])
+        sweeps.append(sweep)
+
+    def _take(dic):
+        new_dic = dic.copy()
+        new_dic['data'] = dic['data'][rays]
+        return new_dic
+
+    fields = {fld: _take(radar.fields[fld]) for fld in field_names}
+    return pyart.core.Radar(
+        _take(radar.time), radar.range, fields, {}, radar.scan_type,
+        radar.latitude, radar.longitude, radar.altitude,
+        {'data': np.array([0], dtype='int32')},
+        {'data': radar.sweep_mode['data'][sweeps]},
+        {'data': radar.fixed_angle['data'][sweeps]},
+        {'data': np.array([0, nrays][:len(sweeps)], dtype='int32')},
+        {'data': np.array([nrays - 1, nrays][:len(sweeps)], dtype='int32')},
+        _take(radar.azimuth), _take(radar.elevation))
+
+
+def _unfold_rays(radar, rays, excluded, phidp_field, kwargs):
+    """ Unfolded differential phase of the given rays, as
+    phase_proc_lp_gf unfolds it before solving the LP. """
+    subset = _ray_subset_radar(radar, rays, [phidp_field])
+    gatefilter = pyart.correct.GateFilter(subset)
+    gatefilter.exclude_gates(excluded[rays])
+    unf = pyart.correct.phase_proc.get_phidp_unf_gf(
+        subset, gatefilter, ncpts=kwargs.get('ncpts'),
+        sys_phase=kwargs['system_phase'], nowrap=kwargs.get('nowrap'),
+        phidp_field=phidp_field,
+        first_gate_sysp=kwargs.get('first_gate_sysp'))
+    unf[:, -1] = unf[:, -2]
+    return unf
+
+
+def _solve_batch(radar, excluded, LP_solver, kwargs):
+    """ Runs the LP phase processing on a batch of rays. The rays of a
+    padding sweep, see _ray_subset_radar, are dropped from the
+    results. """
+    nrays = len(excluded)
+    if radar.nrays > nrays:
+        excluded = np.concatenate([excluded, excluded[:1]])
+    gatefilter = pyart.correct.GateFilter(radar)
+    gatefilter.exclude_gates(excluded)
+    phidp, kdp = pyart.correct.phase_proc_lp_gf(
+        radar, gatefilter=gatefilter, LP_solver=LP_solver, **kwargs)
+    unf_field = kwargs.get('unf_field')
+    if unf_field is None:
+        unf_field = pyart.config.get_field_name(
+            'unfolded_differential_phase')
+    unf = radar.fields[unf_field]
+    for field in (phidp, kdp, unf):
+        field['data'] = field['data'][:nrays]
+    return phidp, kdp, unf
+
+
+def _init_lp_worker():
+    """ Memoizes Py-ART's LP constraint matrix construction in a worker.
+    The matrix only depends on the number of gates and the filter, so all
+    batches of a volume share it. A copy is handed out in case a solver
+    modifies it. This replaces pyart.correct.phase_proc.construct_A_matrix,
+    a Py-ART internal that phase_proc_lp_gf looks up in its module; if a
+    Py-ART version does not have it, the matrices are not memoized. """
+    from pyart.correct import phase_proc
+    if not hasattr(phase_proc, 'construct_A_matrix'):
+        return
+    construct_A_matrix = phase_proc.construct_A_matrix
+    a_matrices = {}
+
+    def cached_A_matrix(n_gates, filt):
+        key = (n_gates, tuple(filt))
+        if key not in a_matrices:
+            a_matrices[key] = construct_A_matrix(n_gates, filt)
+        return a_matrices[key].copy()
+
+    phase_proc.construct_A_matrix = cached_A_matrix
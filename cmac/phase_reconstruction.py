@@ -0,0 +1,80 @@
+""" Differential phase reconstruction from KDP on plain float32 buffers.
+The KDP is cleaned and integrated along range with a cumulative trapezoid
+computed in place, in blocks of rays that can run on a thread pool, so no
+masked array operations or full volume temporaries are involved. """
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def reconstruct_phase(kdp, excluded, rrange, max_kdp=15.0, block_size=1024,
+                      n_threads=1):
+    """
+    Cleans KDP and integrates it along range into differential phase.
+
+    KDP is set to zero at excluded gates and clipped at max_kdp, then
+    integrated with the trapezoidal rule and divided by the number of
+    gates, as in fix_phase_fields.
+
+    Parameters
+    ----------
+    kdp : array
+        KDP of shape (nrays, ngates). Masked values are used as their
+        underlying data.
+    excluded : array
+        Boolean array of shape (nrays, ngates), True for gates whose KDP is
+        set to zero.
+    rrange : array
+        Range of the gates.
+
+    Other Parameters
+    ----------------
+    max_kdp : float
+        KDP values above max_kdp are clipped to it.
+    block_size : int
+        Number of rays per block. If None the volume is one block.
+    n_threads : int
+        Number of threads to process blocks with.
+
+    Returns
+    -------
+    kdp_out : array
+        Cleaned float32 KDP of shape (nrays, ngates).
+    phase : array
+        Float32 reconstructed phase of shape (nrays, ngates - 1). Element
+        i is the integral up to gate i + 1.
+
+    """
+    kdp_out = np.array(np.ma.getdata(kdp), dtype=np.float32, order='C')
+    excluded = np.ma.getdata(excluded)
+    nrays, ngates = kdp_out.shape
+    phase = np.empty((nrays, ngates - 1), dtype=np.float32)
+    half_dr = (0.5 * np.diff(np.asarray(rrange, dtype=np.float64))).astype(
+        np.float32)
+    scale = np.float32(1.0 / ngates)
+
+    if block_size is None or block_size >= nrays:
+        blocks = [(0, nrays)]
+    else:
+        blocks = [(start, min(start + block_size, nrays))
+                  for start in range(0, nrays, block_size)]
+
+    def _do_block(block):
+        start, end = block
+        this_kdp = kdp_out[start:end]
+        this_kdp[excluded[start:end]] = 0.0
+        np.minimum(this_kdp, max_kdp, out=this_kdp)
+        this_phase = phase[start:end]
+        np.add(this_kdp[:, :-1], this_kdp[:, 1:], out=this_phase)
+        this_phase *= half_dr
+        np.cumsum(this_phase, axis=1, out=this_phase)
+        this_phase *= scale
+
+    if n_threads > 1 and len(blocks) > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(_do_block, blocks))
+    else:
+        for block in blocks:
+            _do_block(block)
+    return kdp_out, phase
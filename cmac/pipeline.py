@@ -0,0 +1,265 @@
+""" Dependency graph of the cmac() stages. Each stage lists the stages whose
+fields it reads and the fields it adds to the radar, so a subset of the CMAC
+products can be resolved to the stages that compute them, and stages that do
+not depend on each other can run at the same time on a thread pool. Most of
+the stages spend their time in NumPy, SciPy or GDAL code that releases the
+GIL. """
+
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import time
+
+from .config import get_zs_relationships
+
+# Settings used by cmac() before the stages run, the offsets and flips
+# applied to the input fields.
+PREPARE_CONFIG = ('site_alt', 'gen_clutter_from_refl',
+                  'gen_clutter_from_refl_diff', 'gen_clutter_from_refl_alt',
+                  'zdr_offset', 'offset_zdrs', 'ref_offset', 'flip_phidp',
+                  'phidp_flipped', 'flip_velocity')
+
+# Stages in execution order, each with the stages it requires, the fields
+# it adds to the radar and the settings it reads, config values or cmac()
+# arguments.
+STAGES = OrderedDict([
+    ('sounding', {
+        'requires': (),
+        'fields': ('sounding_temperature', 'height'),
+        'config': ()}),
+    ('snr', {
+        'requires': (),
+        'fields': ('signal_to_noise_ratio',),
+        'config': ()}),
+    ('texture', {
+        'requires': (),
+        'fields': ('velocity_texture', 'clutter_masked_velocity'),
+        'config': ('clutter_mask_z_for_texture', 'sweep_aware_filter')}),
+    ('beam_blockage', {
+        'requires': (),
+        'fields': ('partial_beam_blockage', 'cumulative_beam_blockage'),
+        'config': ('geotiff', 'radar_height_offset', 'beam_width')}),
+    ('classification', {
+        'requires': ('sounding', 'snr', 'texture', 'beam_blockage'),
+        'fields': ('gate_id',),
+        'config': ('mbfs', 'hard_const', 'sweep_aware_filter',
+                   'fast_path_gates')}),
+    # reference_velocity, the previous volume aligned to the rays, is only
+    # listed so the stage cache keeps it; cmac() removes it from the radar.
+    ('simulated_velocity', {
+        'requires': (),
+        'fields': ('simulated_velocity', 'reference_velocity'),
+        'config': ('velocity_reference',)}),
+    ('dealias', {
+        'requires': ('classification', 'simulated_velocity'),
+        'fields': ('corrected_velocity',),
+        'config': ()}),
+    ('phase', {
+        'requires': ('sounding', 'classification'),
+        'fields': ('corrected_differential_phase',
+                   'filtered_corrected_differential_phase',
+                   'corrected_specific_diff_phase',
+                   'filtered_corrected_specific_diff_phase',
+                   'unfolded_differential_phase'),
+        'config': ('ref_offset', 'self_const', 'lp_min_gates',
+                   'lp_solver', 'n_lp_workers')}),
+    ('attenuation', {
+        'requires': ('sounding', 'classification', 'phase'),
+        'fields': ('height_over_iso0', 'specific_attenuation',
+                   'path_integrated_attenuation', 'corrected_reflectivity',
+                   'specific_differential_attenuation',
+                   'path_integrated_differential_attenuation',
+                   'corrected_differential_reflectivity'),
+        'config': ('attenuation_a_coef', 'c_coef', 'd_coef', 'beta_coef')}),
+    ('rain_rate', {
+        'requires': ('classification', 'attenuation'),
+        'fields': ('rain_rate_A',),
+        'config': ('rain_rate_a_coef', 'rain_rate_b_coef')}),
+    ('snow_rate', {
+        'requires': ('classification', 'attenuation'),
+        'fields': tuple(
+            'snow_rate_%s' % relationship['abbreviation']
+            for relationship in get_zs_relationships().values()),
+        'config': ('snow_density', 'zs_relationships')}),
+])
+
+
+def resolve_stages(products=None):
+    """
+    Stages needed to compute a set of CMAC products.
+
+    Parameters
+    ----------
+    products : list
+        Names of the fields wanted, or of stages. None stands for every
+        product.
+
+    Returns
+    -------
+    stages : list
+        Names of the stages computing the products and every stage they
+        depend on, in execution order.
+
+    """
+    if products is None:
+        return list(STAGES.keys())
+    if isinstance(products, str):
+        products = [products]
+    owners = {}
+    for name, stage in STAGES.items():
+        for field in stage['fields']:
+            owners[field] = name
+
+    pending = []
+    for product in products:
+        if product in STAGES:
+            pending.append(product)
+        elif product in owners:
+            pending.append(owners[product])
+        else:
+            raise ValueError('Unknown CMAC product %s. Products are the '
+                             'fields or stages of pipeline.STAGES.' % product)
+    needed = set()
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending.extend(STAGES[name]['requires'])
+    return [name for name in STAGES.keys() if name in needed]
+
+
+def stage_fields(stages):
+    """ Fields added by a list of stages. """
+    return [field for name in stages for field in STAGES[name]['fields']]
+
+
+def select_fields(radar, products, input_fields):
+    """ Removes from the radar the fields that are neither in input_fields
+    nor selected by products, so intermediate fields computed only for
+    other stages are not written out. Nothing is removed if products is
+    None. """
+    if products is None:
+        return radar
+    keep = set(input_fields)
+    for product in [products] if isinstance(products, str) else products:
+        if product in STAGES:
+            keep.update(STAGES[product]['fields'])
+        else:
+            keep.add(product)
+    for field in list(radar.fields.keys()):
+        if field not in keep:
+            del radar.fields[field]
+    return radar
+
+
+def run_stages(radar, state, stages, functions, n_threads=1):
+    """
+    Runs stages of the pipeline, each as soon as the stages it requires
+    are done.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar object the stages add their fields to.
+    state : dict
+        Values shared between the stages.
+    stages : list
+        Names of the stages to run, in execution order, see
+        resolve_stages. Requirements outside of this list are assumed to
+        be done.
+    functions : dict
+        Function of each stage, called with the radar and state.
+
+    Other Parameters
+    ----------------
+    n_threads : int
+        Number of threads running stages. With one thread the stages run
+        one after another in order.
+
+    Returns
+    -------
+    timings : OrderedDict
+        Start and end time of each stage.
+
+    """
+    timings = {}
+
+    def _run(name):
+        start = time.time()
+        functions[name](radar, state)
+        timings[name] = (start, time.time())
+
+    if n_threads <= 1:
+        for name in stages:
+            _run(name)
+    else:
+        selected = set(stages)
+        requires = {name: set(STAGES[name]['requires']) & selected
+                    for name in stages}
+        pending = list(stages)
+        running = {}
+        done = set()
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            while pending or running:
+                for name in [name for name in pending
+                             if requires[name] <= done]:
+                    pending.remove(name)
+                    running[executor.submit(_run, name)] = name
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    # Raises the error of a failed stage, the running
+                    # stages are waited for when leaving the executor.
+                    future.result()
+                    done.add(running.pop(future))
+    return OrderedDict([(name, timings[name]) for name in stages])
+
+
+def stage_overlap(timings):
+    """
+    Duration of each stage and the part of it spent while other stages
+    were running.
+
+    Parameters
+    ----------
+    timings : dict
+        Start and end time of each stage, as returned by run_stages.
+
+    Returns
+    -------
+    overlap : OrderedDict
+        Duration and overlapped time in seconds of each stage.
+    wall_time : float
+        Time from the start of the first stage to the end of the last.
+
+    """
+    overlap = OrderedDict()
+    for name, (start, end) in timings.items():
+        # Union of the intersections with the other stages.
+        others = sorted([(max(start, o_start), min(end, o_end))
+                         for o_name, (o_start, o_end) in timings.items()
+                         if o_name != name and o_start < end
+                         and o_end > start])
+        shared = 0.0
+        covered = start
+        for o_start, o_end in others:
+            o_start = max(o_start, covered)
+            if o_end > o_start:
+                shared += o_end - o_start
+                covered = o_end
+        overlap[name] = {'duration': end - start, 'overlap': shared}
+    if not timings:
+        return overlap, 0.0
+    wall_time = (max([end for _, end in timings.values()])
+                 - min([start for start, _ in timings.values()]))
+    return overlap, wall_time
+
+
+def print_stage_timings(timings):
+    """ Prints the duration of the stages and the time gained by running
+    them at the same time. """
+    overlap, wall_time = stage_overlap(timings)
+    total = sum([stage['duration'] for stage in overlap.values()])
+    print('## %.2f s of stages ran in %.2f s, %.2f s gained by overlap' % (
+        total, wall_time, total - wall_time))
+    for name, stage in overlap.items():
+        print('##    %s: %.2f s, %.2f s overlapped' % (
+            name, stage['duration'], stage['overlap']))
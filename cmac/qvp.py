@@ -0,0 +1,326 @@
+""" Quasi-vertical profile time series. Profiles are computed as in
+cmac_processing.retrieve_qvp, the mean of each field over the sweep
+closest to a given elevation interpolated to fixed heights, for every
+volume of a campaign. The interpolation weights are computed once per
+sweep geometry and shared by all fields and volumes, and the profiles are
+written into preallocated (time, height) arrays that are saved as one CF
+netCDF or Zarr time series. """
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+
+import netCDF4
+import numpy as np
+import pyart
+import xarray as xr
+
+_DEFAULT_QVP_FIELDS = ['differential_phase', 'cross_correlation_ratio',
+                       'spectrum_width', 'reflectivity',
+                       'differential_reflectivity']
+
+# Interpolation weights by sweep geometry, per process.
+_WEIGHT_CACHE = {}
+_MAX_CACHED_WEIGHTS = 16
+
+
+def interpolation_weights(z, heights):
+    """
+    Weights of the linear interpolation from gate altitudes to heights,
+    extrapolated linearly beyond the gates as interp1d does with
+    fill_value='extrapolate'.
+
+    Parameters
+    ----------
+    z : array
+        Increasing gate altitudes.
+    heights : array
+        Heights to interpolate to.
+
+    Returns
+    -------
+    lower, upper : array
+        Index of the gates on either side of each height.
+    weight : array
+        Weight of the upper gate. Zero between gates of the same
+        altitude, where the lower gate is used.
+
+    """
+    z = np.asarray(z, dtype=np.float64)
+    heights = np.asarray(heights, dtype=np.float64)
+    upper = np.clip(np.searchsorted(z, heights), 1, len(z) - 1)
+    lower = upper - 1
+    dz = z[upper] - z[lower]
+    weight = np.where(dz == 0, 0.0, (heights - z[lower])
+                      / np.where(dz == 0, 1.0, dz))
+    return lower, upper, weight
+
+
+def _cached_weights(z, heights):
+    """ Interpolation weights, reused for sweeps of identical geometry. """
+    z = np.ascontiguousarray(z, dtype=np.float64)
+    heights = np.ascontiguousarray(heights, dtype=np.float64)
+    key = hashlib.sha1(z.tobytes() + heights.tobytes()).hexdigest()
+    if key not in _WEIGHT_CACHE:
+        if len(_WEIGHT_CACHE) >= _MAX_CACHED_WEIGHTS:
+            _WEIGHT_CACHE.pop(next(iter(_WEIGHT_CACHE)))
+        _WEIGHT_CACHE[key] = interpolation_weights(z, heights)
+    return _WEIGHT_CACHE[key]
+
+
+def volume_qvp(radar, heights, fields=None, desired_angle=20.0):
+    """
+    Quasi-vertical profiles of one volume.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar volume.
+    heights : array
+        Heights in meters of the profiles.
+
+    Other Parameters
+    ----------------
+    fields : list
+        Fields to compute profiles of. Fields missing from the radar give
+        profiles of NaN.
+    desired_angle : float
+        Elevation angle of the sweep used. The sweep closest to it is
+        used.
+
+    Returns
+    -------
+    time : datetime
+        Start time of the volume.
+    profiles : dict
+        Profile of each field, float32 arrays of the size of heights.
+        Heights where every ray is masked are NaN.
+
+    """
+    if fields is None:
+        fields = _DEFAULT_QVP_FIELDS
+    index = abs(radar.fixed_angle['data'] - desired_angle).argmin()
+    ss = radar.sweep_start_ray_index['data'][index]
+    se = radar.sweep_end_ray_index['data'][index]
+    mid = int((ss + se) / 2)
+    lower, upper, weight = _cached_weights(
+        radar.gate_altitude['data'][mid, :], heights)
+
+    profiles = {}
+    for fld in fields:
+        if fld not in radar.fields:
+            profiles[fld] = np.full(len(weight), np.nan, dtype=np.float32)
+            continue
+        mean = np.ma.filled(
+            radar.get_field(index, fld).mean(axis=0).astype(np.float64),
+            np.nan)
+        profiles[fld] = (mean[lower] * (1.0 - weight)
+                         + mean[upper] * weight).astype(np.float32)
+    time = netCDF4.num2date(radar.time['data'][0], radar.time['units'])
+    return time, profiles
+
+
+def _field_attributes(radar, fields):
+    attributes = {}
+    for fld in fields:
+        if fld in radar.fields:
+            attributes[fld] = {
+                key: radar.fields[fld][key]
+                for key in ('units', 'long_name', 'standard_name')
+                if key in radar.fields[fld]}
+    return attributes
+
+
+def _file_qvp(filename, heights, fields, desired_angle, reader):
+    radar = reader(filename)
+    time, profiles = volume_qvp(radar, heights, fields, desired_angle)
+    return time, profiles, _field_attributes(radar, fields)
+
+
+class QVPTimeSeries(object):
+    """
+    Quasi-vertical profiles of many volumes in preallocated
+    (time, height) arrays.
+
+    Parameters
+    ----------
+    heights : array
+        Heights in meters of the profiles.
+
+    Other Parameters
+    ----------------
+    fields : list
+        Fields to compute profiles of.
+    desired_angle : float
+        Elevation angle of the sweep used for the profiles.
+    ntimes : int
+        Expected number of volumes. The arrays grow when more volumes are
+        added.
+
+    Attributes
+    ----------
+    failures : dict
+        Error of each volume that could not be read, by file name. Their
+        profiles are NaN and their time NaT.
+
+    """
+    def __init__(self, heights, fields=None, desired_angle=20.0, ntimes=16):
+        if fields is None:
+            fields = _DEFAULT_QVP_FIELDS
+        self.heights = np.asarray(heights, dtype=np.float64)
+        self.fields = list(fields)
+        self.desired_angle = desired_angle
+        self.times = np.full(max(ntimes, 1), np.datetime64('NaT'),
+                             dtype='datetime64[us]')
+        self.data = {fld: np.full((max(ntimes, 1), len(self.heights)),
+                                  np.nan, dtype=np.float32)
+                     for fld in self.fields}
+        self.attributes = {}
+        self.failures = {}
+        self.ntimes = 0
+
+    def _grow(self, size):
+        if size <= len(self.times):
+            return
+        size = max(size, 2 * len(self.times))
+        times = np.full(size, np.datetime64('NaT'), dtype=self.times.dtype)
+        times[:len(self.times)] = self.times
+        self.times = times
+        for fld, values in self.data.items():
+            data = np.full((size, len(self.heights)), np.nan,
+                           dtype=np.float32)
+            data[:len(values)] = values
+            self.data[fld] = data
+
+    def insert(self, index, time, profiles, attributes=None):
+        """ Writes the profiles of one volume at a time index. """
+        self._grow(index + 1)
+        self.times[index] = np.datetime64(time.isoformat())
+        for fld in self.fields:
+            self.data[fld][index] = profiles[fld]
+        if attributes is not None:
+            for fld, attrs in attributes.items():
+                self.attributes.setdefault(fld, attrs)
+        self.ntimes = max(self.ntimes, index + 1)
+
+    def insert_failure(self, index, filename, error):
+        """ Records a volume that could not be read, leaving NaN profiles
+        at its time index. """
+        self._grow(index + 1)
+        self.failures[filename] = error
+        self.ntimes = max(self.ntimes, index + 1)
+        print('## ' + filename + ' failed: ' + error)
+
+    def add_radar(self, radar):
+        """ Computes and appends the profiles of a radar volume. """
+        time, profiles = volume_qvp(radar, self.heights, self.fields,
+                                    self.desired_angle)
+        self.insert(self.ntimes, time, profiles,
+                    _field_attributes(radar, self.fields))
+
+    def to_dataset(self):
+        """ Returns the time series as a CF xarray Dataset, sorted in
+        time. """
+        order = np.argsort(self.times[:self.ntimes], kind='stable')
+        data_vars = {}
+        for fld in self.fields:
+            attrs = dict(self.attributes.get(fld, {}))
+            attrs['cell_methods'] = 'time: point azimuth: mean'
+            data_vars[fld] = (('time', 'height'),
+                              self.data[fld][:self.ntimes][order], attrs)
+        coords = {
+            'time': ('time', self.times[:self.ntimes][order],
+                     {'standard_name': 'time', 'long_name': 'Volume start time'}),
+            'height': ('height', self.heights,
+                       {'standard_name': 'altitude', 'units': 'm',
+                        'long_name': 'Height above mean sea level',
+                        'positive': 'up'})}
+        attrs = {
+            'Conventions': 'CF-1.7',
+            'title': 'Quasi-vertical profiles',
+            'elevation_angle': self.desired_angle,
+            'comment': 'Azimuthal mean of the sweep closest to the '
+                       'elevation angle, interpolated to fixed heights.'}
+        if self.failures:
+            attrs['failed_volumes'] = ', '.join(sorted(self.failures))
+        return xr.Dataset(data_vars, coords=coords, attrs=attrs)
+
+    def write(self, filename):
+        """ Writes the time series to a netCDF file, or to a Zarr store if
+        filename ends in .zarr. """
+        dataset = self.to_dataset()
+        if filename.rstrip('/').endswith('.zarr'):
+            dataset.to_zarr(filename, mode='w')
+        else:
+            dataset.to_netcdf(filename)
+        return filename
+
+
+def compute_qvp_series(volumes, heights, fields=None, desired_angle=20.0,
+                       n_workers=1, reader=pyart.io.read, output=None):
+    """
+    Quasi-vertical profile time series of many volumes.
+
+    Parameters
+    ----------
+    volumes : iterable
+        Radar objects or file names. File names are read with reader, in
+        n_workers processes.
+    heights : array
+        Heights in meters of the profiles.
+
+    Other Parameters
+    ----------------
+    fields : list
+        Fields to compute profiles of.
+    desired_angle : float
+        Elevation angle of the sweep used for the profiles.
+    n_workers : int
+        Number of processes reading files.
+    reader : function
+        Function reading a radar file. Must be picklable when n_workers is
+        larger than one.
+    output : str
+        If given, the time series is written to this netCDF file or, if it
+        ends in .zarr, Zarr store.
+
+    Returns
+    -------
+    series : QVPTimeSeries
+        The profile time series. Files that can not be read are recorded
+        in its failures and leave NaN profiles.
+
+    """
+    volumes = list(volumes)
+    series = QVPTimeSeries(heights, fields, desired_angle,
+                           ntimes=len(volumes))
+    files = [(i, volume) for i, volume in enumerate(volumes)
+             if isinstance(volume, str)]
+    for i, volume in enumerate(volumes):
+        if not isinstance(volume, str):
+            time, profiles = volume_qvp(volume, series.heights,
+                                        series.fields, desired_angle)
+            series.insert(i, time, profiles,
+                          _field_attributes(volume, series.fields))
+
+    if n_workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(
+                _file_qvp, filename, series.heights, series.fields,
+                desired_angle, reader): i for i, filename in files}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    series.insert(i, *future.result())
+                except Exception as err:
+                    series.insert_failure(i, volumes[i], repr(err))
+    else:
+        for i, filename in files:
+            try:
+                series.insert(i, *_file_qvp(filename, series.heights,
+                                            series.fields, desired_angle,
+                                            reader))
+            except Exception as err:
+                series.insert_failure(i, filename, repr(err))
+    if output is not None:
+        series.write(output)
+    return series
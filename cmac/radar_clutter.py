@@ -22,7 +22,7 @@ def tall_clutter(files, config,
                  clutter_thresh_min=0.0002,
                  clutter_thresh_max=0.25, radius=1,
                  max_height=2000., write_radar=True,
-                 out_file=None, use_dask=False):
+                 out_file=None, use_dask=False, geometry_cache=None):
     """
     Wind Farm Clutter Calculation
 
@@ -58,6 +58,9 @@ def tall_clutter(files, config,
     use_dask : bool
         Use dask instead of running stats for calculation. The will reduce
         run time.
+    geometry_cache : GeometryCache
+        If given, the gate heights are taken from it instead of being
+        computed for every file, see geometry_cache.GeometryCache.
 
     Returns
     -------
@@ -83,6 +86,8 @@ def tall_clutter(files, config,
                                       ncp_field, vel_field])
             reflect_array = deepcopy(radar.fields[refl_field]['data'])
             ncp = radar.fields[ncp_field]['data']
+            if geometry_cache is not None:
+                geometry_cache.apply(radar)
             height = radar.gate_z["data"]
             up_in_the_air = height > max_height
             the_mask = np.logical_or.reduce(
@@ -109,6 +114,8 @@ def tall_clutter(files, config,
                     print('Working on file: ' + file)
                     reflect_array = radar.fields[refl_field]['data']
                     ncp = deepcopy(radar.fields[ncp_field]['data'])
+                    if geometry_cache is not None:
+                        geometry_cache.apply(radar)
                     height = radar.gate_z["data"]
                     reflect_array = np.ma.masked_where(
                         np.logical_or(height > max_height, ncp < 0.8),
@@ -0,0 +1,108 @@
+""" Coverage and histogram statistics of CMAC volumes. Statistics are
+computed on views of the sweep slices of the field arrays with
+count_nonzero, and the gate_id class fractions are counted on the packed
+masks of the gate_id category registry, so no copies of the radar are
+made. """
+
+import numpy as np
+
+from .gate_categories import get_gate_categories
+
+
+def _sweep_label(sweep):
+    return 'all' if sweep is None else 'sweep_%d' % sweep
+
+
+def coverage_key(threshold):
+    """ Key of the coverage of a threshold in the statistics of a sweep,
+    for example coverage_10 or coverage_m2p5. """
+    return 'coverage_' + ('%g' % threshold).replace('.', 'p').replace(
+        '-', 'm')
+
+
+def coverage_statistics(radar, field='corrected_reflectivity',
+                        thresholds=(10.0, 40.0), sweeps=(0,),
+                        histogram_bins=None, class_fractions=False,
+                        categories=None):
+    """
+    Coverage statistics of a radar volume.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar object with the field.
+
+    Other Parameters
+    ----------------
+    field : str
+        Field to compute coverage and histograms of.
+    thresholds : list
+        Thresholds of the coverage. The coverage is the percentage of the
+        gates of a sweep with a value greater or equal to the threshold,
+        masked gates counting as below it.
+    sweeps : list
+        Sweeps to compute statistics of. None in the list stands for the
+        whole volume.
+    histogram_bins : array
+        If given, the counts of the unmasked values of the field in these
+        bins are computed for each sweep.
+    class_fractions : bool
+        If True, the percentage of the gates of each gate_id class is
+        computed for each sweep.
+    categories : GateCategories
+        Gate id registry to use for the class fractions. By default the
+        registry of the radar, see gate_categories.get_gate_categories.
+
+    Returns
+    -------
+    statistics : dict
+        Statistics by sweep label, sweep_<n> or all, each a dict with the
+        number of gates, coverage_<threshold>, histogram and
+        fraction_<class> entries.
+
+    """
+    data = radar.fields[field]['data']
+    values = np.ma.getdata(data)
+    masked = np.ma.getmaskarray(data)
+    if class_fractions and categories is None:
+        categories = get_gate_categories(radar)
+
+    statistics = {}
+    for sweep in sweeps:
+        if sweep is None:
+            this_slice = slice(0, radar.nrays)
+        else:
+            this_slice = radar.get_slice(sweep)
+        this_values = values[this_slice]
+        valid = ~masked[this_slice]
+        total = this_values.size
+        sweep_stats = {'gates': total}
+        for threshold in thresholds:
+            above = np.count_nonzero(
+                np.logical_and(this_values >= threshold, valid))
+            sweep_stats[coverage_key(threshold)] = 100.0 * above / total
+        if histogram_bins is not None:
+            counts, _ = np.histogram(this_values[valid], histogram_bins)
+            sweep_stats['histogram'] = counts
+        if class_fractions:
+            for name, _ in categories.sorted_items():
+                count = categories.plane(name).count_rays(
+                    this_slice.start, this_slice.stop)
+                sweep_stats['fraction_%s' % name] = 100.0 * count / total
+        statistics[_sweep_label(sweep)] = sweep_stats
+    return statistics
+
+
+def statistics_to_metadata(statistics, field='corrected_reflectivity',
+                           histogram_bins=None, prefix='cmac_statistics'):
+    """ Flattens coverage statistics into metadata entries that can be
+    written as netCDF global attributes, named
+    <prefix>_<sweep>_<statistic>. """
+    metadata = {}
+    for sweep_label, sweep_stats in statistics.items():
+        for key, value in sweep_stats.items():
+            metadata['_'.join([prefix, sweep_label, key])] = value
+    metadata[prefix + '_field'] = field
+    if histogram_bins is not None:
+        metadata[prefix + '_histogram_bins'] = np.asarray(histogram_bins)
+    return metadata
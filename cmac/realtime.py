@@ -0,0 +1,287 @@
+""" Near real time CMAC 2.0 service. An input directory is watched for new
+radar volumes, which are queued to a pool of warm workers as soon as they
+are completely written. The ingest to product latency is reported for
+every volume. """
+
+import fnmatch
+import glob
+import os
+import time
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+
+from .batch_processing import (find_files, make_entry, match_sonde,
+                               output_file_name, parse_file_datetime,
+                               process_volume, _run_entry)
+from .config import get_cmac_values
+from .worker_context import init_worker_context
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+    _INOTIFY_AVAILABLE = True
+except ImportError:
+    _INOTIFY_AVAILABLE = False
+
+
+class DirectoryWatcher(object):
+    """
+    Watches a directory for new files, using inotify when the
+    inotify_simple package is available and polling otherwise.
+
+    Files are only reported once their size and modification time have
+    not changed for settle_time seconds, so volumes that are still being
+    written are not picked up.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to watch. Sub directories are not watched.
+
+    Other Parameters
+    ----------------
+    pattern : str
+        Glob pattern of the files to report.
+    settle_time : float
+        Seconds a file has to be unchanged before it is reported.
+    poll_interval : float
+        Seconds between checks of the directory.
+    use_inotify : bool
+        Use inotify if available. If False, polling is always used.
+    include_existing : bool
+        If True, files already in the directory are reported too.
+
+    """
+
+    def __init__(self, directory, pattern='*', settle_time=30.0,
+                 poll_interval=5.0, use_inotify=True,
+                 include_existing=False):
+        self.directory = directory
+        self.pattern = pattern
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        # path: (size, mtime, time of last change)
+        self._candidates = {}
+        self._seen = set()
+        if not include_existing:
+            self._seen.update(self._list_files())
+        self._inotify = None
+        if use_inotify and _INOTIFY_AVAILABLE:
+            self._inotify = INotify()
+            self._inotify.add_watch(
+                directory, inotify_flags.CLOSE_WRITE
+                | inotify_flags.MOVED_TO | inotify_flags.CREATE
+                | inotify_flags.MODIFY)
+        elif use_inotify:
+            warnings.warn('inotify_simple is not installed, falling back'
+                          + ' to polling the directory.')
+
+    def _list_files(self):
+        return set(glob.glob(os.path.join(self.directory, self.pattern)))
+
+    def _new_files(self):
+        """ Returns the files that changed since the last check. """
+        if self._inotify is None:
+            return self._list_files() - self._seen
+        events = self._inotify.read(timeout=int(self.poll_interval * 1000))
+        return set([
+            os.path.join(self.directory, event.name) for event in events
+            if fnmatch.fnmatch(event.name, self.pattern)])
+
+    def poll(self):
+        """ Returns a list of (path, detection time) of the files that
+        have settled since the last call. """
+        now = time.time()
+        for path in self._new_files():
+            if path not in self._candidates and path not in self._seen:
+                self._candidates[path] = (None, None, now)
+
+        ready = []
+        for path, (size, mtime, changed) in list(self._candidates.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Removed or renamed before it settled.
+                del self._candidates[path]
+                continue
+            if (stat.st_size, stat.st_mtime) != (size, mtime):
+                self._candidates[path] = (stat.st_size, stat.st_mtime, now)
+            elif now - changed >= self.settle_time:
+                del self._candidates[path]
+                self._seen.add(path)
+                ready.append((path, now))
+        return ready
+
+    def watch(self):
+        """ Generator yielding (path, detection time) of settled files
+        forever. """
+        while True:
+            for item in self.poll():
+                yield item
+            if self._inotify is None or self._candidates:
+                time.sleep(self.poll_interval)
+
+
+def _init_service_worker(config, clutter_file):
+    """ Loads the worker context used by process_volume when a service
+    worker starts. """
+    init_worker_context(config, clutter_file=clutter_file)
+
+
+def run_service(input_dir, sonde_path, config, out_path,
+                image_directory=None, clutter_file=None, pattern='*',
+                sonde_pattern='*.cdf', radar_date_format=None,
+                sonde_date_format=None, n_workers=2, settle_time=30.0,
+                poll_interval=5.0, process_func=process_volume,
+                max_volumes=None, use_inotify=True, include_existing=False,
+                history=1000, **kwargs):
+    """
+    Runs CMAC 2.0 as a service on new radar volumes in a directory.
+
+    Parameters
+    ----------
+    input_dir : str
+        Directory new radar volumes land in.
+    sonde_path : str
+        Directory of the sonde files, searched again for every volume so
+        new sondes are picked up.
+    config : str
+        Radar configuration name found in default_config.py.
+    out_path : str
+        Directory to write the CMAC radar files to.
+
+    Other Parameters
+    ----------------
+    image_directory : str
+        Directory to save quicklooks in.
+    clutter_file : str
+        Clutter file to use for every radar volume.
+    pattern, sonde_pattern : str
+        Glob patterns of the radar and sonde files.
+    radar_date_format, sonde_date_format : str
+        strptime formats of the file names, see parse_file_datetime.
+    n_workers : int
+        Number of worker processes. Workers keep their WorkerContext
+        between volumes.
+    settle_time, poll_interval, use_inotify, include_existing
+        See DirectoryWatcher.
+    process_func : function
+        Function called with each entry, defaults to process_volume.
+    max_volumes : int
+        Stop after this many volumes, run forever if None.
+    history : int
+        Number of volumes whose latencies are kept.
+
+    Returns
+    -------
+    latencies : deque
+        Dictionaries with the radar file, the ingest to product latency,
+        the time until the settled file was detected and the queueing and
+        processing time of the last history volumes.
+
+    """
+    save_name = get_cmac_values(config)['save_name']
+    watcher = DirectoryWatcher(input_dir, pattern=pattern,
+                               settle_time=settle_time,
+                               poll_interval=poll_interval,
+                               use_inotify=use_inotify,
+                               include_existing=include_existing)
+
+    def start_pool():
+        return ProcessPoolExecutor(
+            max_workers=n_workers, initializer=_init_service_worker,
+            initargs=(config, clutter_file))
+
+    def restart_pool():
+        nonlocal executor
+        print('## Worker pool broken, restarting it')
+        executor.shutdown(wait=False)
+        executor = start_pool()
+
+    def submit(entry, landed, detected):
+        entry['attempts'] += 1
+        try:
+            future = executor.submit(_run_entry, process_func, entry,
+                                     kwargs, ())
+        except BrokenProcessPool:
+            restart_pool()
+            future = executor.submit(_run_entry, process_func, entry,
+                                     kwargs, ())
+        in_flight[future] = (entry, landed, detected, executor)
+
+    executor = start_pool()
+    kwargs['image_directory'] = image_directory
+    in_flight = {}
+    latencies = deque(maxlen=history)
+    n_volumes = 0
+    print('## Watching ' + input_dir + ' for new radar volumes')
+    try:
+        while max_volumes is None or n_volumes < max_volumes:
+            for radar_file, detected in watcher.poll():
+                try:
+                    radar_time = parse_file_datetime(
+                        radar_file, radar_date_format)
+                except ValueError:
+                    print(radar_file + ' has no parsable date, skipping!')
+                    continue
+                try:
+                    landed = os.stat(radar_file).st_mtime
+                except OSError:
+                    print(radar_file + ' was removed, skipping!')
+                    continue
+                sonde_files = find_files(sonde_path, sonde_pattern)
+                sonde_times = [parse_file_datetime(x, sonde_date_format)
+                               for x in sonde_files]
+                entry = make_entry(
+                    radar_file, radar_time,
+                    match_sonde(radar_time, sonde_times, sonde_files),
+                    clutter_file,
+                    output_file_name(out_path, save_name, radar_time),
+                    config)
+                submit(entry, landed, detected)
+            if not in_flight:
+                if watcher._inotify is None:
+                    time.sleep(poll_interval)
+                continue
+            done, _ = futures_wait(list(in_flight.keys()),
+                                   timeout=poll_interval,
+                                   return_when='FIRST_COMPLETED')
+            for future in done:
+                entry, landed, detected, pool = in_flight.pop(future)
+                finished = time.time()
+                try:
+                    result = future.result()
+                except BrokenProcessPool as err:
+                    # A worker died, such as an OOM kill, and took the
+                    # pool and the volumes in flight down with it. They
+                    # are retried once in a new pool.
+                    if pool is executor:
+                        restart_pool()
+                    if entry['attempts'] < 2:
+                        submit(entry, landed, detected)
+                        continue
+                    result = {'ok': False, 'error': repr(err)}
+                except Exception as err:
+                    result = {'ok': False, 'error': repr(err)}
+                latency = {'radar_file': entry['radar_file'],
+                           'ok': result['ok'],
+                           'latency': finished - landed,
+                           'detected': detected - landed,
+                           'processing': finished - detected}
+                latencies.append(latency)
+                n_volumes += 1
+                if result['ok']:
+                    print('## ' + entry['output_file'] + ' published, '
+                          + 'ingest to product latency %.1f s '
+                          '(detected after %.1f s, processing %.1f s)' % (
+                              latency['latency'], latency['detected'],
+                              latency['processing']))
+                else:
+                    print('## ' + entry['radar_file'] + ' failed: '
+                          + result['error'].split('\n')[0])
+    finally:
+        executor.shutdown()
+    return latencies
+
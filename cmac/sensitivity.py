@@ -0,0 +1,200 @@
+""" Sensitivity of the attenuation correction and rain rate to their
+coefficients. The stages of cmac() up to the phase processing run once per
+volume, then the ZPhi attenuation correction is evaluated once for each
+distinct set of attenuation coefficients, optionally in worker processes,
+and R(A) for every coefficient set at once by broadcasting. The results are
+stacked along a coefficient_set dimension. """
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import copy
+
+import numpy as np
+import pyart
+import xarray as xr
+
+from .cmac_processing import attenuation_inputs, attenuation_zphi
+from .cmac_radar import cmac
+from .config import get_cmac_values, get_field_names
+from .gate_categories import get_gate_categories
+
+ATTENUATION_COEFFICIENTS = ('attenuation_a_coef', 'c_coef', 'd_coef',
+                            'beta_coef')
+RAIN_RATE_COEFFICIENTS = ('rain_rate_a_coef', 'rain_rate_b_coef')
+_ZPHI_FIELDS = ('corrected_reflectivity',
+                'corrected_differential_reflectivity', 'specific_attenuation')
+
+# Radar, field names and gate filter of the volume, per worker process.
+_WORKER_INPUTS = {}
+
+
+def complete_coefficient_sets(coefficient_sets, cmac_config):
+    """ Coefficient sets with the coefficients they do not give taken from
+    cmac_config. """
+    return [{name: coefficients.get(name, cmac_config[name])
+             for name in ATTENUATION_COEFFICIENTS + RAIN_RATE_COEFFICIENTS}
+            for coefficients in coefficient_sets]
+
+
+def attenuation_groups(coefficient_sets):
+    """
+    Distinct attenuation coefficients of a list of coefficient sets.
+
+    Returns
+    -------
+    unique : list
+        Dicts of distinct attenuation coefficients, in order of first use.
+    index : array
+        Index in unique of the attenuation coefficients of each set.
+
+    """
+    keys = OrderedDict()
+    index = []
+    for coefficients in coefficient_sets:
+        key = tuple([coefficients[name] for name in ATTENUATION_COEFFICIENTS])
+        if key not in keys:
+            keys[key] = len(keys)
+        index.append(keys[key])
+    unique = [dict(zip(ATTENUATION_COEFFICIENTS, key)) for key in keys]
+    return unique, np.array(index, dtype=np.intp)
+
+
+def _zphi_arrays(radar, field_config, gatefilter, coefficients):
+    fields = attenuation_zphi(radar, field_config, coefficients, gatefilter)
+    spec_at, _, cor_z, _, _, cor_zdr = fields
+    return {'corrected_reflectivity': cor_z['data'],
+            'corrected_differential_reflectivity': cor_zdr['data'],
+            'specific_attenuation': spec_at['data']}
+
+
+def _init_worker(radar, field_config, excluded):
+    gatefilter = pyart.correct.GateFilter(radar)
+    gatefilter.exclude_gates(excluded)
+    _WORKER_INPUTS.update(
+        {'radar': radar, 'field_config': field_config,
+         'gatefilter': gatefilter})
+
+
+def _worker_zphi(coefficients):
+    return _zphi_arrays(_WORKER_INPUTS['radar'],
+                        _WORKER_INPUTS['field_config'],
+                        _WORKER_INPUTS['gatefilter'], coefficients)
+
+
+def _to_float32(data):
+    return np.ma.filled(data.astype(np.float32), np.nan)
+
+
+def coefficient_sweep(radar, config, coefficient_sets, n_workers=1,
+                      output=None):
+    """
+    Attenuation corrected reflectivity and rain rate of a volume for many
+    sets of coefficients.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar object with the fields of the cmac() phase stage and the
+        stages before it, for example from
+        cmac(radar, sonde, config, products=['phase']).
+    config : str
+        A string pointing to dictionaries containing values for CMAC 2.0
+        specific to a radar.
+    coefficient_sets : list
+        Dicts of attenuation_a_coef, c_coef, d_coef, beta_coef,
+        rain_rate_a_coef and rain_rate_b_coef. Coefficients missing from a
+        set are taken from the config.
+
+    Other Parameters
+    ----------------
+    n_workers : int
+        Number of processes evaluating the attenuation correction for the
+        distinct attenuation coefficients.
+    output : str
+        If given, the results are written to this netCDF file.
+
+    Returns
+    -------
+    dataset : xarray Dataset
+        corrected_reflectivity, corrected_differential_reflectivity,
+        specific_attenuation and rain_rate_A with dimensions
+        (coefficient_set, time, range), and the coefficients of each set
+        as coordinates. Gates outside the rain, melting and snow classes
+        are NaN.
+
+    """
+    cmac_config = get_cmac_values(config)
+    field_config = get_field_names(config)
+    sets = complete_coefficient_sets(coefficient_sets, cmac_config)
+    unique, index = attenuation_groups(sets)
+
+    gatefilter = get_gate_categories(radar).gatefilter(
+        radar, ['rain', 'melting', 'snow'])
+    # The correction reads its inputs from the corrected field names, so
+    # they are set on a copy holding the uncorrected fields.
+    work = copy.copy(radar)
+    work.fields = dict(radar.fields)
+    work.fields.update(attenuation_inputs(radar, field_config, gatefilter))
+
+    if n_workers > 1 and len(unique) > 1:
+        with ProcessPoolExecutor(
+                max_workers=min(n_workers, len(unique)),
+                initializer=_init_worker,
+                initargs=(work, field_config,
+                          gatefilter.gate_excluded)) as executor:
+            results = list(executor.map(_worker_zphi, unique))
+    else:
+        results = [_zphi_arrays(work, field_config, gatefilter, coefficients)
+                   for coefficients in unique]
+
+    data = {name: np.stack([_to_float32(result[name])
+                            for result in results])[index]
+            for name in _ZPHI_FIELDS}
+    # R(A) for all coefficient sets at once.
+    rr_a = np.array([coefficients['rain_rate_a_coef'] for coefficients
+                     in sets], dtype=np.float32)[:, np.newaxis, np.newaxis]
+    rr_b = np.array([coefficients['rain_rate_b_coef'] for coefficients
+                     in sets], dtype=np.float32)[:, np.newaxis, np.newaxis]
+    data['rain_rate_A'] = rr_a * data['specific_attenuation'] ** rr_b
+
+    attributes = {
+        'corrected_reflectivity': {
+            'units': 'dBZ',
+            'long_name': 'Attenuation corrected reflectivity'},
+        'corrected_differential_reflectivity': {
+            'units': 'dB',
+            'long_name': 'Attenuation corrected differential reflectivity'},
+        'specific_attenuation': {
+            'units': 'dB/km', 'long_name': 'Specific attenuation'},
+        'rain_rate_A': {
+            'units': 'mm/hr', 'standard_name': 'rainfall_rate',
+            'long_name': 'Rain rate from specific attenuation'}}
+    dims = ('coefficient_set', 'time', 'range')
+    data_vars = {name: (dims, values, attributes[name])
+                 for name, values in data.items()}
+    coords = {
+        'time': ('time', radar.time['data'], {'units': radar.time['units']}),
+        'range': ('range', radar.range['data'], {'units': 'meters'})}
+    for name in ATTENUATION_COEFFICIENTS + RAIN_RATE_COEFFICIENTS:
+        coords[name] = ('coefficient_set', np.array(
+            [coefficients[name] for coefficients in sets]))
+    dataset = xr.Dataset(data_vars, coords=coords, attrs={
+        'title': 'CMAC attenuation and rain rate coefficient sensitivity',
+        'comment': 'Attenuation corrected with the ZPhi method and rain '
+                   'rate R=rain_rate_a_coef*A**rain_rate_b_coef for each '
+                   'coefficient set.'})
+    if output is not None:
+        dataset.to_netcdf(output)
+    return dataset
+
+
+def cmac_sensitivity(radar, sonde, config, coefficient_sets, n_workers=1,
+                     output=None, **kwargs):
+    """
+    Runs cmac() up to the phase processing once and evaluates the
+    attenuation correction and rain rate for each coefficient set, see
+    coefficient_sweep. Other keyword arguments are passed on to cmac().
+    """
+    radar = cmac(radar, sonde, config, products=['phase'], **kwargs)
+    return coefficient_sweep(radar, config, coefficient_sets,
+                             n_workers=n_workers, output=output)
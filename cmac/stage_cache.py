@@ -0,0 +1,180 @@
+""" Checkpoints of the fields computed by the cmac() stages. The fields of a
+stage are stored under a key hashing the input volume, the settings the
+stage reads and the keys of the stages it requires, so when a coefficient
+of a late stage is retuned the volume is reprocessed from that stage on and
+the gate ids, dealiased velocities and LP phase processing are read back
+instead of computed again. """
+
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+from .pipeline import PREPARE_CONFIG, STAGES
+
+# Stages whose fields are cached by default, the expensive ones and those
+# the others depend on.
+DEFAULT_CACHED_STAGES = ('sounding', 'texture', 'classification',
+                         'dealias', 'phase')
+
+
+def file_hash(*paths):
+    """ SHA1 hash of the contents of files, None paths are skipped. """
+    sha = hashlib.sha1()
+    for path in paths:
+        if path is None:
+            continue
+        with open(path, 'rb') as infile:
+            for block in iter(lambda: infile.read(1 << 20), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def volume_hash(radar, sonde=None, sonde_fields=()):
+    """ SHA1 hash of the fields, gate count and start time of a radar
+    volume and of the sonde variables used by cmac(). """
+    sha = hashlib.sha1()
+    sha.update(('%d %d %r %s' % (
+        radar.nrays, radar.ngates, float(radar.time['data'][0]),
+        radar.time['units'])).encode())
+    for name in sorted(radar.fields.keys()):
+        data = radar.fields[name]['data']
+        sha.update(name.encode())
+        sha.update(np.ascontiguousarray(np.ma.getdata(data)).tobytes())
+        sha.update(np.packbits(np.ma.getmaskarray(data)).tobytes())
+    if sonde is not None:
+        for name in sonde_fields:
+            sha.update(name.encode())
+            sha.update(np.ascontiguousarray(
+                np.asarray(sonde[name][:])).tobytes())
+    return sha.hexdigest()
+
+
+def _settings_json(settings, names):
+    return json.dumps({name: settings.get(name) for name in names},
+                      sort_keys=True, default=repr)
+
+
+def stage_keys(input_hash, settings, field_config=None):
+    """
+    Cache key of every stage of pipeline.STAGES.
+
+    Parameters
+    ----------
+    input_hash : str
+        Hash of the input volume, see file_hash and volume_hash.
+    settings : dict
+        Config values and cmac() arguments read by the stages.
+
+    Other Parameters
+    ----------------
+    field_config : dict
+        Field names of the radar, read by every stage.
+
+    Returns
+    -------
+    keys : dict
+        Key of each stage. A key changes when the input, the settings
+        of the stage or the key of a stage it requires changes.
+
+    """
+    base = '\n'.join([input_hash, _settings_json(settings, PREPARE_CONFIG),
+                      json.dumps(field_config, sort_keys=True, default=repr)])
+    keys = {}
+    for name, stage in STAGES.items():
+        parts = [base, name, _settings_json(settings, stage['config'])]
+        parts.extend([keys[required] for required in stage['requires']])
+        keys[name] = hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+    return keys
+
+
+class StageCache(object):
+    """
+    Directory of cached stage fields.
+
+    Parameters
+    ----------
+    directory : str
+        Directory the fields are stored in, one sub directory per stage.
+
+    Other Parameters
+    ----------------
+    input_hash : str
+        Hash of the input files of the volume, see file_hash. If None,
+        cmac hashes the radar fields and sonde, see volume_hash.
+    stages : list
+        Stages whose fields are cached.
+
+    """
+    def __init__(self, directory, input_hash=None,
+                 stages=DEFAULT_CACHED_STAGES):
+        self.directory = directory
+        self.input_hash = input_hash
+        self.stages = tuple(stages)
+
+    def _path(self, stage, key):
+        return os.path.join(self.directory, stage, key + '.pkl')
+
+    def __contains__(self, item):
+        return os.path.exists(self._path(*item))
+
+    def get(self, stage, key):
+        """ Fields of a stage stored under key, or None. """
+        path = self._path(stage, key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as infile:
+            return pickle.load(infile)
+
+    def put(self, stage, key, fields):
+        """ Stores the fields of a stage under key. """
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to a temporary name and renamed so concurrent workers
+        # never read a partial checkpoint.
+        with open(path + '.part', 'wb') as outfile:
+            pickle.dump(fields, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.part', path)
+
+    def wrap(self, stage, function, key, restore=None):
+        """
+        Stage function that reads the fields of the stage from the cache
+        if they are stored under key, and otherwise runs function and
+        stores the fields it added.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage.
+        function : function
+            Stage function, called with the radar and the state shared
+            by the stages.
+        key : str
+            Cache key of the stage, see stage_keys.
+
+        Other Parameters
+        ----------------
+        restore : function
+            Called with the radar and state after the fields are read
+            from the cache, to rebuild the values the stage adds to the
+            state.
+
+        """
+        if stage not in self.stages:
+            return function
+
+        def _stage(radar, state):
+            fields = self.get(stage, key)
+            if fields is None:
+                function(radar, state)
+                self.put(stage, key, {
+                    name: radar.fields[name] for name in STAGES[stage][
+                        'fields'] if name in radar.fields})
+            else:
+                print('## Read %s from the stage cache' % stage)
+                radar.fields.update(fields)
+                if restore is not None:
+                    restore(radar, state)
+        return _stage
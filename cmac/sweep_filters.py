@@ -0,0 +1,113 @@
+""" Sweep aware filtering. Each sweep is filtered on its own so windows do
+not mix gates from different elevations, and full circle sweeps are padded
+circularly in azimuth so the window wraps around north. Sweeps are
+independent and ndimage releases the GIL, so they are filtered on a
+thread pool. """
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import ndimage
+
+
+def sweep_slices(radar):
+    """ Returns a list of (start, end) ray index pairs, end exclusive,
+    of every sweep in a radar. """
+    return [(int(start), int(end) + 1) for start, end in zip(
+        radar.sweep_start_ray_index['data'],
+        radar.sweep_end_ray_index['data'])]
+
+
+def full_circle_sweeps(radar, tolerance=2.0):
+    """ Returns a list of booleans, True for sweeps that are PPIs covering
+    the full 360 degrees of azimuth. """
+    full = []
+    for start, end in sweep_slices(radar):
+        if radar.scan_type != 'ppi' or end - start < 2:
+            full.append(False)
+            continue
+        azimuth = np.sort(radar.azimuth['data'][start:end])
+        gaps = np.diff(np.append(azimuth, azimuth[0] + 360.0))
+        full.append(bool(gaps.max() <= tolerance * np.median(gaps)))
+    return full
+
+
+def pad_sweep(data, pad, wrap):
+    """ Pads a full circle sweep circularly by pad rays on both sides and
+    returns it with the padding used. Sector sweeps are returned as they
+    are and keep the boundary handling of the filter. """
+    if not wrap:
+        return data, 0
+    pad = min(pad, data.shape[0])
+    return np.pad(data, ((pad, pad), (0, 0)), mode='wrap'), pad
+
+
+def sweep_median_filter(radar, data, size, n_threads=1, out=None):
+    """
+    Median filter applied sweep by sweep.
+
+    Parameters
+    ----------
+    radar : Radar
+        Radar the data belongs to, used for the sweep boundaries and to
+        find full circle sweeps.
+    data : array
+        Array of shape (nrays, ngates) to filter.
+    size : tuple
+        Size of the median filter in rays and gates.
+
+    Other Parameters
+    ----------------
+    n_threads : int
+        Number of threads to filter sweeps with.
+    out : array
+        Preallocated output array.
+
+    Returns
+    -------
+    filtered : array
+        The filtered array.
+
+    """
+    data = np.asarray(data)
+    if out is None:
+        out = np.empty_like(data)
+    pad = size[0]
+    wraps = full_circle_sweeps(radar)
+
+    def _do_sweep(args):
+        (start, end), wrap = args
+        padded, this_pad = pad_sweep(data[start:end], pad, wrap)
+        filtered = ndimage.median_filter(padded, size=size)
+        out[start:end] = filtered[this_pad:this_pad + end - start]
+
+    jobs = list(zip(sweep_slices(radar), wraps))
+    if n_threads > 1 and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(_do_sweep, jobs))
+    else:
+        for job in jobs:
+            _do_sweep(job)
+    return out
+
+
+def nearest_index(sorted_values, values, tolerance, circular=False):
+    """ Index of the nearest of sorted_values for each value, -1 where it
+    is further than tolerance. Circular values are angles in degrees, so
+    the first and last values are neighbours. Used to align the rays and
+    gates of volumes whose rays do not line up. """
+    values = np.asarray(values, dtype=float)
+    size = len(sorted_values)
+    upper = np.searchsorted(sorted_values, values)
+    if circular:
+        candidates = np.stack([(upper - 1) % size, upper % size])
+        diff = np.abs(sorted_values[candidates] - values)
+        diff = np.minimum(diff, 360.0 - diff)
+    else:
+        candidates = np.stack([np.clip(upper - 1, 0, size - 1),
+                               np.clip(upper, 0, size - 1)])
+        diff = np.abs(sorted_values[candidates] - values)
+    best = diff.argmin(axis=0)
+    index = np.take_along_axis(candidates, best[np.newaxis], 0)[0]
+    index[np.take_along_axis(diff, best[np.newaxis], 0)[0] > tolerance] = -1
+    return index
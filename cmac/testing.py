@@ -0,0 +1,212 @@
+""" Synthetic radar volumes and sondes for testing and benchmarking CMAC 2.0.
+The volumes follow the scan strategies of the X-SAPR, C-SAPR2 and SAIL
+radars and contain reflectivity, velocity, RhoHV, NCP, PhiDP and ZDR fields
+named as in default_config.py. """
+
+import numpy as np
+import pyart
+import xarray as xr
+
+from .config import get_field_names
+
+# Scan strategies: radar configuration, fixed angles, rays per sweep,
+# number of gates, gate spacing in meters and Nyquist velocity.
+SCAN_STRATEGIES = {
+    'xsapr': {'config': 'xsapr_i5_ppi',
+              'fixed_angles': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+              'rays_per_sweep': 360, 'ngates': 801,
+              'gate_spacing': 50.0, 'nyquist': 16.5},
+    'csapr2': {'config': 'cacti_csapr2_ppi',
+               'fixed_angles': [0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 6.0,
+                                8.0, 10.0, 12.5, 15.0, 17.5, 20.0, 25.0],
+               'rays_per_sweep': 360, 'ngates': 1100,
+               'gate_spacing': 100.0, 'nyquist': 16.5},
+    'sail': {'config': 'sail_xband_ppi',
+             'fixed_angles': [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 8.0, 10.0],
+             'rays_per_sweep': 720, 'ngates': 1200,
+             'gate_spacing': 50.0, 'nyquist': 15.9},
+}
+
+
+def make_synthetic_radar(scan='xsapr', scale=1.0, freezing_level=3000.0,
+                         u_wind=10.0, v_wind=5.0, n_cells=4, seed=0):
+    """
+    Creates a synthetic PPI volume.
+
+    Parameters
+    ----------
+    scan : str
+        Scan strategy in SCAN_STRATEGIES, one of xsapr, csapr2 and sail.
+
+    Other Parameters
+    ----------------
+    scale : float
+        Factor applied to the number of rays per sweep and the number of
+        gates, to benchmark larger or smaller volumes.
+    freezing_level : float
+        Height in meters of the 0C level. Reflectivity weakens and RhoHV
+        drops in a melting layer just below it.
+    u_wind, v_wind : float
+        Uniform wind used for the radial velocity, which is folded at the
+        Nyquist velocity of the scan strategy.
+    n_cells : int
+        Number of convective cells embedded in stratiform rain.
+    seed : int
+        Seed for the random noise and cell positions.
+
+    Returns
+    -------
+    radar : Radar
+        Synthetic radar volume.
+
+    """
+    strategy = SCAN_STRATEGIES[scan]
+    field_names = get_field_names(strategy['config'])
+    rng = np.random.RandomState(seed)
+    rays_per_sweep = int(strategy['rays_per_sweep'] * scale)
+    ngates = int(strategy['ngates'] * scale)
+    fixed_angles = np.array(strategy['fixed_angles'], dtype='float32')
+    nsweeps = len(fixed_angles)
+    nyquist = strategy['nyquist']
+
+    radar = pyart.testing.make_empty_ppi_radar(
+        ngates, rays_per_sweep, nsweeps)
+    spacing = strategy['gate_spacing']
+    radar.range['data'] = (np.arange(ngates, dtype='float32') * spacing
+                           + spacing / 2.0)
+    radar.range['meters_between_gates'] = spacing
+    radar.fixed_angle['data'] = fixed_angles
+    radar.elevation['data'] = np.repeat(fixed_angles, rays_per_sweep)
+    radar.azimuth['data'] = np.tile(np.linspace(
+        0.0, 360.0, rays_per_sweep, endpoint=False, dtype='float32'),
+                                    nsweeps)
+    radar.time['data'] = np.arange(radar.nrays, dtype='float64') * 0.05
+    radar.latitude['data'] = np.array([36.49], dtype='float64')
+    radar.longitude['data'] = np.array([-97.59], dtype='float64')
+    radar.altitude['data'] = np.array([328.0], dtype='float64')
+    radar.init_gate_x_y_z()
+    radar.init_gate_longitude_latitude()
+    radar.init_gate_altitude()
+    radar.instrument_parameters = {'nyquist_velocity': {
+        'data': np.full(radar.nrays, nyquist, dtype='float32'),
+        'units': 'm/s', 'long_name': 'Nyquist velocity'}}
+
+    x = radar.gate_x['data']
+    y = radar.gate_y['data']
+    z = radar.gate_z['data']
+    shape = x.shape
+
+    # Stratiform rain with embedded convective cells, weakening above the
+    # freezing level and enhanced in a melting layer below it.
+    max_range = radar.range['data'][-1]
+    refl = 25.0 - 10.0 * np.hypot(x, y) / max_range
+    for _ in range(n_cells):
+        cx, cy = rng.uniform(-0.6, 0.6, 2) * max_range
+        size = rng.uniform(0.03, 0.08) * max_range
+        refl = refl + 25.0 * np.exp(-((x - cx)**2 + (y - cy)**2)
+                                    / (2.0 * size**2))
+    melt = np.logical_and(z > freezing_level - 500.0, z <= freezing_level)
+    refl[melt] += 5.0
+    above = z > freezing_level
+    refl[above] -= 10.0 + (z[above] - freezing_level) / 500.0
+    echo = np.logical_and(refl > 0.0, z < freezing_level + 6000.0)
+    noise = rng.normal(0.0, 1.0, shape)
+    refl = np.where(echo, refl + noise, rng.uniform(-15.0, 0.0, shape))
+
+    ncp = np.where(echo, rng.uniform(0.7, 1.0, shape),
+                   rng.uniform(0.0, 0.3, shape))
+    rhohv = np.where(echo, 0.985 + 0.01 * rng.uniform(-1.0, 1.0, shape),
+                     rng.uniform(0.2, 0.7, shape))
+    rhohv[np.logical_and(echo, melt)] = 0.92
+    zdr = np.where(echo, np.clip(0.2 + 0.05 * (refl - 20.0), -0.5, 4.0),
+                   rng.uniform(-4.0, 4.0, shape)) + 0.2 * noise
+
+    # Radial velocity of a uniform wind, folded at the Nyquist velocity.
+    az = np.deg2rad(radar.azimuth['data'])[:, np.newaxis]
+    el = np.deg2rad(radar.elevation['data'])[:, np.newaxis]
+    vr = (u_wind * np.sin(az) + v_wind * np.cos(az)) * np.cos(el)
+    vr = vr + 0.5 * noise
+    vr = np.mod(vr + nyquist, 2.0 * nyquist) - nyquist
+    vr = np.where(echo, vr, rng.uniform(-nyquist, nyquist, shape))
+
+    # Differential phase integrated from a KDP(Z) relationship.
+    kdp = np.where(np.logical_and(echo, ~above),
+                   1e-4 * (10.0**(refl / 10.0))**0.7, 0.0)
+    phidp = 40.0 + 2.0 * np.cumsum(kdp, axis=1) * spacing / 1000.0
+    phidp = np.where(echo, phidp + 2.0 * noise,
+                     rng.uniform(-180.0, 180.0, shape))
+
+    snr = refl + 20.0 * np.log10(1000.0 / radar.range['data'])
+
+    data = {'reflectivity': (refl, 'dBZ', 'equivalent_reflectivity_factor'),
+            'velocity': (vr, 'm/s',
+                         'radial_velocity_of_scatterers_away_from_instrument'),
+            'normalized_coherent_power': (ncp, '1',
+                                          'normalized_coherent_power'),
+            'cross_correlation_ratio': (rhohv, '1',
+                                        'cross_correlation_ratio_hv'),
+            'input_phidp_field': (phidp, 'degrees',
+                                  'differential_phase_hv'),
+            'differential_reflectivity': (zdr, 'dB',
+                                          'log_differential_reflectivity_hv'),
+            'signal_to_noise_ratio': (snr, 'dB', 'signal_to_noise_ratio')}
+    for key, (values, units, standard_name) in data.items():
+        name = field_names.get(key)
+        if name is None:
+            continue
+        radar.add_field(name, {
+            'data': np.ma.masked_invalid(values.astype('float32')),
+            'units': units, 'standard_name': standard_name,
+            'long_name': standard_name, '_FillValue': -9999.0},
+                        replace_existing=True)
+
+    # Fields some configurations expect in addition to the named ones.
+    refl_name = field_names['reflectivity']
+    if 'input_clutter_corrected_reflectivity' in field_names:
+        radar.add_field_like(
+            refl_name, 'attenuation_corrected_reflectivity_h',
+            radar.fields[refl_name]['data'].copy(), replace_existing=True)
+    for name in ('uncorrected_differential_phase', 'differential_phase'):
+        if name not in radar.fields:
+            radar.add_field_like(
+                field_names['input_phidp_field'], name,
+                radar.fields[field_names['input_phidp_field']]['data'].copy(),
+                replace_existing=True)
+    return radar
+
+
+def make_synthetic_sonde(surface_temperature=20.0, surface_altitude=328.0,
+                         lapse_rate=6.5e-3, u_wind=10.0, v_wind=5.0,
+                         nlevels=500, top=20000.0):
+    """
+    Creates a synthetic sonde dataset with the variable names used in
+    default_config.py.
+
+    Parameters
+    ----------
+    surface_temperature : float
+        Temperature in degrees Celsius at the surface.
+    surface_altitude : float
+        Altitude in meters of the first level.
+    lapse_rate : float
+        Temperature lapse rate in degrees per meter.
+    u_wind, v_wind : float
+        Wind components in m/s, constant with height.
+    nlevels : int
+        Number of levels.
+    top : float
+        Altitude in meters of the last level.
+
+    Returns
+    -------
+    sonde : xarray Dataset
+        Synthetic sonde.
+
+    """
+    alt = np.linspace(surface_altitude, top, nlevels)
+    tdry = surface_temperature - lapse_rate * (alt - surface_altitude)
+    return xr.Dataset({
+        'alt': ('time', alt, {'units': 'm'}),
+        'tdry': ('time', tdry, {'units': 'C'}),
+        'u_wind': ('time', np.full(nlevels, u_wind), {'units': 'm/s'}),
+        'v_wind': ('time', np.full(nlevels, v_wind), {'units': 'm/s'})})
@@ -0,0 +1,54 @@
+""" Unit Tests for CMAC 2.0's accumulation.py module. """
+
+import datetime
+
+import numpy as np
+
+from cmac.accumulation import PrecipAccumulator
+
+
+def _volumes():
+    start = datetime.datetime(2020, 3, 31, 22, 40)
+    azimuth = np.arange(0.0, 360.0, 10.0)
+    for i in range(20):
+        time = start + datetime.timedelta(minutes=10 * i)
+        if i >= 15:
+            # A gap longer than max_gap.
+            time += datetime.timedelta(hours=1)
+        rate = np.full((36, 5), 2.0 + i % 2, dtype=np.float32)
+        yield time, azimuth, {'rain_rate_A': rate}
+
+
+def test_accumulation_totals_and_merge():
+    azimuth = np.arange(0.0, 360.0, 10.0)
+    rrange = np.arange(5) * 100.0
+    serial = PrecipAccumulator(['rain_rate_A'], azimuth, rrange,
+                               max_gap=1200.0)
+    for volume in _volumes():
+        serial.add(*volume)
+
+    # 23:00 to 00:00 is fully covered, mean rate 2.5 mm/h.
+    total = serial.totals[('hourly', datetime.datetime(2020, 3, 31, 23))]
+    np.testing.assert_allclose(total['depth']['rain_rate_A'], 2.5)
+    assert total['seconds'] == 3600.0
+    # The month changes at midnight.
+    assert ('monthly', datetime.datetime(2020, 4, 1)) in serial.totals
+    missing = sum(value['missing_seconds'] for key, value
+                  in serial.totals.items() if key[0] == 'daily')
+    assert missing == 70 * 60.0
+
+    volumes = list(_volumes())
+    first = PrecipAccumulator(['rain_rate_A'], azimuth, rrange,
+                              max_gap=1200.0)
+    second = PrecipAccumulator(['rain_rate_A'], azimuth, rrange,
+                               max_gap=1200.0, open_start=True)
+    for volume in volumes[:7]:
+        first.add(*volume)
+    for volume in volumes[7:]:
+        second.add(*volume)
+    first.merge(second)
+    assert sorted(first.totals) == sorted(serial.totals)
+    for key, value in serial.totals.items():
+        np.testing.assert_allclose(first.totals[key]['depth']['rain_rate_A'],
+                                   value['depth']['rain_rate_A'])
+        assert first.totals[key]['seconds'] == value['seconds']
@@ -0,0 +1,123 @@
+""" Unit Tests for CMAC 2.0's batch_processing.py module. """
+
+import datetime
+import os
+
+import netCDF4
+
+from cmac.batch_processing import (ProcessingManifest, parse_file_datetime,
+                                   estimate_volume_memory, make_entry,
+                                   read_volume_shape, run_manifest,
+                                   _next_entry,
+                                   STATE_DONE, STATE_FAILED, STATE_PENDING)
+
+
+def test_parse_file_datetime():
+    expected = datetime.datetime(2022, 3, 1, 12, 30, 5)
+    assert parse_file_datetime(
+        '/data/xprecipradar_guc_volume_20220301-123005.b1.nc') == expected
+    assert parse_file_datetime(
+        'gucsondewnpnM1.b1.20220301.123005.cdf') == expected
+    assert parse_file_datetime(
+        'gucsondewnpnM1.b1.20220301.123005.cdf',
+        'gucsondewnpnM1.b1.%Y%m%d.%H%M%S.cdf') == expected
+
+
+def test_manifest_build_and_restart(tmpdir):
+    radar_files = ['xprecipradar_guc_volume_20220301-120000.b1.nc',
+                   'xprecipradar_guc_volume_20220301-180000.b1.nc']
+    sonde_files = ['gucsondewnpnM1.b1.20220301.113000.cdf',
+                   'gucsondewnpnM1.b1.20220301.173000.cdf']
+    path = str(tmpdir.join('manifest.json'))
+    manifest = ProcessingManifest.build(
+        radar_files, sonde_files, 'sail_xband_ppi', str(tmpdir), path=path)
+    assert len(manifest.entries) == 2
+    assert manifest.entries[0]['sonde_file'] == sonde_files[0]
+    assert manifest.entries[1]['sonde_file'] == sonde_files[1]
+    assert os.path.dirname(manifest.entries[0]['output_file']).endswith(
+        '202203')
+
+    manifest.mark_running(manifest.entries[0])
+    manifest.mark_failed(manifest.entries[1], 'OSError', retry=False)
+    manifest = ProcessingManifest.load(path)
+    assert manifest.entries[0]['state'] == STATE_PENDING
+    assert manifest.entries[1]['state'] == STATE_FAILED
+    manifest.reset_failed()
+    manifest.mark_done(manifest.entries[0])
+    assert len(manifest.select(STATE_PENDING)) == 1
+    assert len(manifest.select(STATE_DONE)) == 1
+
+
+def test_estimate_volume_memory():
+    small = estimate_volume_memory(360, 500, 10)
+    large = estimate_volume_memory(3600, 500, 10)
+    assert small > 360 * 500 * 8 * 10
+    assert large == 10 * small
+
+
+def test_max_volume_memory_without_budget(tmpdir):
+    radar_file = str(tmpdir.join('radar.nc'))
+    with netCDF4.Dataset(radar_file, 'w') as dataset:
+        dataset.createDimension('time', 3600)
+        dataset.createDimension('range', 500)
+        dataset.createDimension('sweep', 10)
+        dataset.createVariable('reflectivity', 'f4', ('time', 'range'))
+        dataset.createVariable('azimuth', 'f4', ('time',))
+    assert read_volume_shape(radar_file) == (3600, 500, 1, 10)
+    entry = make_entry(radar_file, datetime.datetime(2022, 3, 1), None,
+                       None, 'out.nc', 'sail_xband_ppi')
+    max_volume_memory = estimate_volume_memory(3600, 500, 1) / 4.0
+    assert _next_entry([entry], {}, None, max_volume_memory) is entry
+    assert entry['sweeps_per_chunk'] == 2
+    assert entry['memory'] <= max_volume_memory
+
+
+def test_manifest_journal(tmpdir):
+    path = str(tmpdir.join('manifest.json'))
+    entries = [make_entry('radar_%d.nc' % i, datetime.datetime(2022, 3, 1),
+                          None, None, 'out_%d.nc' % i, 'sail_xband_ppi')
+               for i in range(3)]
+    manifest = ProcessingManifest(entries, path=path)
+    manifest.save()
+    manifest.mark_running(entries[0])
+    manifest.mark_done(entries[0])
+    manifest.mark_failed(entries[1], 'OSError', retry=False)
+    assert os.path.exists(path + '.journal')
+    # A line cut short by a killed run is ignored.
+    with open(path + '.journal', 'a') as outfile:
+        outfile.write('{"index": 2, "ent')
+    manifest = ProcessingManifest.load(path)
+    assert not os.path.exists(path + '.journal')
+    assert [entry['state'] for entry in manifest.entries] == [
+        STATE_DONE, STATE_FAILED, STATE_PENDING]
+
+
+def _kill_worker_once(entry, marker_dir):
+    # The first volume kills its worker once, the others succeed.
+    marker = os.path.join(marker_dir, 'killed')
+    if entry['radar_file'] == 'radar_0.nc' and not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+
+
+def _missing_file(entry):
+    raise FileNotFoundError(entry['radar_file'])
+
+
+def test_run_manifest_broken_pool(tmpdir):
+    entries = [make_entry('radar_%d.nc' % i, datetime.datetime(2022, 3, 1),
+                          None, None, 'out_%d.nc' % i, 'sail_xband_ppi')
+               for i in range(4)]
+    manifest = ProcessingManifest(entries, path=str(tmpdir.join('m.json')))
+    summary = run_manifest(manifest, process_func=_kill_worker_once,
+                           n_workers=2, marker_dir=str(tmpdir))
+    assert summary[STATE_DONE] == 4
+
+
+def test_run_manifest_missing_file_not_retried():
+    entries = [make_entry('radar_0.nc', datetime.datetime(2022, 3, 1),
+                          None, None, 'out_0.nc', 'sail_xband_ppi')]
+    manifest = ProcessingManifest(entries)
+    summary = run_manifest(manifest, process_func=_missing_file, n_workers=1)
+    assert summary[STATE_FAILED] == 1
+    assert entries[0]['attempts'] == 1
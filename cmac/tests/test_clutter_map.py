@@ -0,0 +1,67 @@
+""" Unit Tests for CMAC 2.0's clutter_map.py module. """
+
+import numpy as np
+import pyart
+
+from cmac.clutter_map import ClutterMap
+
+
+def _clutter_radar():
+    radar = pyart.testing.make_empty_ppi_radar(30, 360, 3)
+    radar.fixed_angle['data'] = np.array([0.5, 1.5, 2.5])
+    clutter = np.zeros((radar.nrays, radar.ngates), dtype='int32')
+    clutter[::7, ::3] = 1
+    radar.add_field('ground_clutter', {'data': clutter})
+    return radar
+
+
+def test_same_layout_is_unchanged():
+    radar = _clutter_radar()
+    clutter_map = ClutterMap.from_radar(radar)
+    volume = _clutter_radar()
+    del volume.fields['ground_clutter']
+    clutter_map.add_fields(volume)
+    np.testing.assert_array_equal(volume.fields['ground_clutter']['data'],
+                                  radar.fields['ground_clutter']['data'])
+
+
+def test_jitter_and_missing_sweeps():
+    radar = _clutter_radar()
+    clutter = radar.fields['ground_clutter']['data']
+    clutter_map = ClutterMap.from_radar(radar)
+
+    # Two sweeps, the first of a fixed angle the map does not have, with
+    # jittered azimuths starting at 90 degrees.
+    volume = pyart.testing.make_empty_ppi_radar(30, 360, 2)
+    volume.fixed_angle['data'] = np.array([3.5, 1.5])
+    volume.azimuth['data'] = np.mod(
+        volume.azimuth['data'] + 90.0 + 0.3, 360.0)
+    rays, gates = clutter_map.lookup(volume)
+    np.testing.assert_array_equal(gates, np.arange(30))
+    assert (rays[:360] == -1).all()
+    np.testing.assert_array_equal(rays[360:], 360 + np.mod(
+        np.arange(360) + 90, 360))
+    field = clutter_map.field_for(volume, 'ground_clutter')
+    assert (field['data'][:360] == 0).all()
+    np.testing.assert_array_equal(field['data'][360:],
+                                  clutter[rays[360:]])
+    # The lookup is cached per scan layout.
+    assert clutter_map.lookup(volume)[0] is rays
+
+
+def test_maximum_fill():
+    radar = _clutter_radar()
+    clutter = radar.fields['ground_clutter']['data']
+    clutter_map = ClutterMap.from_radar(radar, fill_value='maximum')
+
+    # A sweep the map does not have and gates beyond its range are
+    # flagged, as the map's flags are the conservative choice.
+    volume = pyart.testing.make_empty_ppi_radar(40, 360, 2)
+    volume.fixed_angle['data'] = np.array([3.5, 1.5])
+    volume.range['data'] = np.arange(40) * np.diff(radar.range['data'])[0]
+    field = clutter_map.field_for(volume, 'ground_clutter')
+    np.testing.assert_array_equal(field['data'][:360, :30],
+                                  np.tile(clutter.max(axis=0), (360, 1)))
+    assert (field['data'][:, 30:] == 1).all()
+    np.testing.assert_array_equal(field['data'][360:, :30],
+                                  clutter[360:720])
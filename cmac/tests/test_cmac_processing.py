@@ -0,0 +1,131 @@
+""" Unit Tests for CMAC 2.0's cmac_processing.py module. """
+
+import numpy as np
+import pyart
+
+from cmac.cmac_processing import snow_rate, snow_rates
+from cmac.config import get_zs_relationships
+
+
+def test_snow_rates_match_snow_rate():
+    radar = pyart.testing.make_target_radar()
+    refl = radar.fields['reflectivity']['data']
+    radar.add_field_like('reflectivity', 'corrected_reflectivity',
+                         np.ma.masked_greater(refl, 35.0))
+    snow_gates = pyart.correct.GateFilter(radar)
+    snow_gates.exclude_below('corrected_reflectivity', 5.0)
+    zs_relationships = get_zs_relationships()
+
+    expected = {}
+    for citation, zs in zs_relationships.items():
+        snow_rate(radar, 1 / 0.073, zs['A'], zs['B'], citation,
+                  zs['abbreviation'])
+        name = 'snow_rate_%s' % zs['abbreviation']
+        expected[name] = np.ma.masked_where(
+            snow_gates.gate_excluded, radar.fields[name]['data'])
+
+    snow_rates(radar, 1 / 0.073, zs_relationships, gatefilter=snow_gates)
+    for name, data in expected.items():
+        result = radar.fields[name]['data']
+        np.testing.assert_array_equal(np.ma.getmaskarray(result),
+                                      np.ma.getmaskarray(data))
+        np.testing.assert_allclose(result.compressed(), data.compressed(),
+                                   rtol=1e-6)
+        assert radar.fields[name]['units'] == 'mm/h'
+
+
+def test_fix_phase_fields_matches_cumulative_trapezoid():
+    from scipy import integrate
+    from cmac.cmac_processing import fix_phase_fields
+
+    radar = pyart.testing.make_empty_ppi_radar(300, 10, 3)
+    rng = np.random.RandomState(0)
+    rrange = radar.range['data']
+    kdp_data = np.ma.masked_less(rng.uniform(-1.0, 20.0, (30, 300)), 0.0)
+    kdp = {'data': kdp_data, 'units': 'degrees/km'}
+    phidp = {'data': np.ma.masked_greater(
+        rng.uniform(0.0, 180.0, (30, 300)), 170.0), 'units': 'degrees'}
+    # GateFilter checks masks against the shape of the first field.
+    radar.add_field('differential_phase', phidp)
+    gatefilter = pyart.correct.GateFilter(radar)
+    gatefilter.exclude_gates(rng.uniform(size=(30, 300)) > 0.8)
+
+    cumulative_trapezoid = getattr(integrate, 'cumulative_trapezoid', None)
+    if cumulative_trapezoid is None:
+        cumulative_trapezoid = integrate.cumtrapz
+    expected_kdp = kdp_data.copy()
+    expected_kdp[gatefilter.gate_excluded] = 0.0
+    expected_kdp[expected_kdp > 15.0] = 15.0
+    expected_phase = cumulative_trapezoid(
+        np.ma.getdata(expected_kdp), rrange, axis=1) / len(rrange)
+
+    for block_size, n_threads in ((None, 1), (7, 3)):
+        phidp_filt, kdp_filt = fix_phase_fields(
+            kdp, phidp, rrange, gatefilter, block_size=block_size,
+            n_threads=n_threads)
+        np.testing.assert_allclose(kdp_filt['data'].filled(-1),
+                                   expected_kdp.filled(-1), rtol=1e-6)
+        np.testing.assert_allclose(phidp_filt['data'][:, :-1],
+                                   expected_phase, rtol=1e-4, atol=1e-4)
+        np.testing.assert_array_equal(phidp_filt['data'][:, -1],
+                                      phidp['data'][:, -1])
+        assert kdp_filt['units'] == 'degrees/km'
+    # The inputs are left untouched.
+    assert kdp['data'] is kdp_data
+    assert np.ma.is_masked(kdp_data)
+
+
+def _batch_radars(n_volumes):
+    rng = np.random.RandomState(0)
+    radars = []
+    for _ in range(n_volumes):
+        radar = pyart.testing.make_empty_ppi_radar(40, 36, 2)
+        shape = (radar.nrays, radar.ngates)
+        radar.add_field('velocity', {'data': np.ma.masked_greater(
+            rng.uniform(-10.0, 10.0, shape), 9.0)})
+        radar.add_field('cross_correlation_ratio',
+                        {'data': rng.uniform(0.5, 1.0, shape)})
+        radar.add_field('normalized_coherent_power',
+                        {'data': rng.uniform(0.0, 1.0, shape)})
+        radar.add_field('height', {'data': rng.uniform(0.0, 12000.0, shape)})
+        radar.add_field('sounding_temperature',
+                        {'data': rng.uniform(-20.0, 20.0, shape)})
+        radar.add_field('signal_to_noise_ratio',
+                        {'data': rng.uniform(0.0, 40.0, shape)})
+        radars.append(radar)
+    return radars
+
+
+def test_batch_texture_matches_get_texture():
+    from cmac.cmac_processing import batch_texture, get_texture
+
+    radars = _batch_radars(3)
+    for sweep_aware in (False, True):
+        textures = batch_texture(radars, 'velocity', nyq=10.0,
+                                 sweep_aware=sweep_aware)
+        for radar, texture in zip(radars, textures):
+            expected = get_texture(radar, 'velocity', nyq=10.0,
+                                   sweep_aware=sweep_aware)
+            np.testing.assert_array_equal(texture['data'].filled(-1.0),
+                                          expected['data'].filled(-1.0))
+
+
+def test_batch_fuzz_matches_do_my_fuzz():
+    from cmac.cmac_processing import batch_fuzz, do_my_fuzz, get_texture
+
+    radars = _batch_radars(3)
+    for radar in radars:
+        radar.add_field('velocity_texture', get_texture(
+            radar, 'velocity', nyq=10.0))
+    for sweep_aware in (False, True):
+        gate_ids = batch_fuzz(radars, 'cross_correlation_ratio',
+                              'normalized_coherent_power', verbose=False,
+                              sweep_aware=sweep_aware)
+        for radar, (gid, cats) in zip(radars, gate_ids):
+            expected, expected_cats = do_my_fuzz(
+                radar, 'cross_correlation_ratio',
+                'normalized_coherent_power', verbose=False,
+                sweep_aware=sweep_aware)
+            np.testing.assert_array_equal(gid['data'], expected['data'])
+            assert list(cats) == list(expected_cats)
+            assert gid['valid_max'] == expected['valid_max']
@@ -0,0 +1,173 @@
+""" Unit Tests for CMAC 2.0's cmac_radar.py module. """
+
+import copy
+
+import numpy as np
+import pytest
+
+from cmac import cmac
+from cmac.cmac_radar import cmac_batch, cmac_chunked
+from cmac.config import _DEFAULT_CMAC_VALUES
+from cmac.phase_processing import solver_available
+from cmac.testing import make_synthetic_radar, make_synthetic_sonde
+from cmac.velocity_reference import VelocityReference
+
+
+def _synthetic_volume(seed=0):
+    """ Small X-SAPR volume with rain in the first quarter of every sweep
+    and noise in the rest. """
+    radar = make_synthetic_radar('xsapr', scale=0.2, n_cells=0, seed=seed)
+    noise = np.arange(radar.nrays) % 72 >= 18
+    radar.fields['normalized_coherent_power']['data'][noise] = 0.05
+    radar.fields['cross_correlation_ratio']['data'][noise] = 0.1
+    radar.fields['reflectivity']['data'][noise] = -30.0
+    sonde = make_synthetic_sonde(surface_temperature=5.0)
+    return radar, sonde, noise
+
+
+@pytest.mark.skipif(not solver_available('cvxopt'),
+                    reason='cvxopt is not installed')
+def test_cmac_lp_min_gates(monkeypatch):
+    config = _DEFAULT_CMAC_VALUES['xsapr_i5_ppi']
+    monkeypatch.setitem(config, 'lp_solver', 'cvxopt')
+    monkeypatch.setitem(config, 'lp_min_gates', 20)
+    radar, sonde, noise = _synthetic_volume()
+    cmac_radar = cmac(radar, sonde, 'xsapr_i5_ppi', verbose=False,
+                      n_lp_workers=2)
+    phidp = cmac_radar.fields['corrected_differential_phase']['data']
+    kdp = cmac_radar.fields['corrected_specific_diff_phase']['data']
+    # Rays of noise are not solved, every ray of rain is.
+    assert np.all(phidp[noise] == 0)
+    assert np.all(kdp[noise] == 0)
+    assert np.all(np.abs(phidp[~noise]).max(axis=1) > 0)
+
+
+@pytest.mark.skipif(not solver_available('cvxopt'),
+                    reason='cvxopt is not installed')
+def test_cmac_fast_path_schema(monkeypatch):
+    config = _DEFAULT_CMAC_VALUES['xsapr_i5_ppi']
+    monkeypatch.setitem(config, 'lp_solver', 'cvxopt')
+    monkeypatch.setitem(config, 'lp_min_gates', 20)
+    radar, sonde, _ = _synthetic_volume()
+    cmac_radar = cmac(copy.deepcopy(radar), sonde, 'xsapr_i5_ppi',
+                      verbose=False)
+    monkeypatch.setitem(config, 'fast_path_gates',
+                        radar.nrays * radar.ngates)
+    fast_radar = cmac(radar, sonde, 'xsapr_i5_ppi', verbose=False)
+
+    assert sorted(fast_radar.fields.keys()) == sorted(
+        cmac_radar.fields.keys())
+    for name, field in cmac_radar.fields.items():
+        fast_field = fast_radar.fields[name]
+        assert fast_field['data'].dtype == field['data'].dtype, name
+        assert sorted(fast_field.keys()) == sorted(field.keys()), name
+        for key, value in field.items():
+            if key != 'data':
+                np.testing.assert_equal(fast_field[key], value,
+                                        err_msg=name + ' ' + key)
+    for name in ('corrected_velocity', 'corrected_differential_phase',
+                 'corrected_specific_diff_phase', 'specific_attenuation',
+                 'path_integrated_differential_attenuation'):
+        assert np.ma.count(fast_radar.fields[name]['data']) == 0, name
+
+
+def test_cmac_reference_velocity_schema(monkeypatch):
+    config = _DEFAULT_CMAC_VALUES['xsapr_i5_ppi']
+    radar, sonde, _ = _synthetic_volume()
+    monkeypatch.setitem(config, 'fast_path_gates',
+                        radar.nrays * radar.ngates)
+    sonde_radar = cmac(copy.deepcopy(radar), sonde, 'xsapr_i5_ppi',
+                       verbose=False)
+
+    # The previous volume is the same scan, ten seconds earlier.
+    previous = copy.deepcopy(radar)
+    previous.time['data'] = previous.time['data'] - 10.0
+    previous.add_field('corrected_velocity', copy.deepcopy(
+        previous.fields['velocity']))
+    reference = VelocityReference()
+    reference.update(previous)
+    assert reference.reference(radar) is not None
+    reference_radar = cmac(radar, sonde, 'xsapr_i5_ppi', verbose=False,
+                           velocity_reference=reference)
+    assert sorted(reference_radar.fields.keys()) == sorted(
+        sonde_radar.fields.keys())
+    assert 'simulated_velocity' in reference_radar.fields
+    assert 'reference_velocity' not in reference_radar.fields
+
+
+@pytest.mark.skipif(not solver_available('cvxopt'),
+                    reason='cvxopt is not installed')
+def test_cmac_chunked_matches_cmac(monkeypatch):
+    config = _DEFAULT_CMAC_VALUES['xsapr_i5_ppi']
+    monkeypatch.setitem(config, 'lp_solver', 'cvxopt')
+    monkeypatch.setitem(config, 'coverage_statistics', {})
+    radar, sonde, _ = _synthetic_volume()
+    assert radar.nsweeps > 2
+    cmac_radar = cmac(copy.deepcopy(radar), sonde, 'xsapr_i5_ppi',
+                      verbose=False)
+    # The low sweeps have no gate below freezing.
+    chunked_radar = cmac_chunked(radar, sonde, 'xsapr_i5_ppi',
+                                 sweeps_per_chunk=2, verbose=False)
+
+    assert sorted(chunked_radar.fields.keys()) == sorted(
+        cmac_radar.fields.keys())
+    for name, field in cmac_radar.fields.items():
+        chunked_data = chunked_radar.fields[name]['data']
+        np.testing.assert_array_equal(np.ma.getmaskarray(chunked_data),
+                                      np.ma.getmaskarray(field['data']),
+                                      err_msg=name)
+        np.testing.assert_allclose(np.ma.filled(chunked_data, 0),
+                                   np.ma.filled(field['data'], 0),
+                                   atol=1e-5, err_msg=name)
+    # The coverage statistics are those of the whole volume.
+    assert 'cmac_statistics_field' in cmac_radar.metadata
+    np.testing.assert_equal(chunked_radar.metadata, cmac_radar.metadata)
+
+
+@pytest.mark.skipif(not solver_available('cvxopt'),
+                    reason='cvxopt is not installed')
+def test_cmac_batch_matches_cmac(monkeypatch):
+    config = _DEFAULT_CMAC_VALUES['xsapr_i5_ppi']
+    monkeypatch.setitem(config, 'lp_solver', 'cvxopt')
+    volumes = [_synthetic_volume(seed)[:2] for seed in (0, 1)]
+    cmac_radars = [cmac(copy.deepcopy(radar), sonde, 'xsapr_i5_ppi',
+                        verbose=False) for radar, sonde in volumes]
+    batch_radars = cmac_batch([radar for radar, _ in volumes],
+                              [sonde for _, sonde in volumes],
+                              'xsapr_i5_ppi', verbose=False)
+
+    for batch_radar, cmac_radar in zip(batch_radars, cmac_radars):
+        assert sorted(batch_radar.fields.keys()) == sorted(
+            cmac_radar.fields.keys())
+        for name, field in cmac_radar.fields.items():
+            batch_field = batch_radar.fields[name]
+            assert batch_field['data'].dtype == field['data'].dtype, name
+            np.testing.assert_array_equal(
+                np.ma.getmaskarray(batch_field['data']),
+                np.ma.getmaskarray(field['data']), err_msg=name)
+            np.testing.assert_array_equal(
+                np.ma.filled(batch_field['data'], 0),
+                np.ma.filled(field['data'], 0), err_msg=name)
+            for key, value in field.items():
+                if key != 'data':
+                    np.testing.assert_equal(batch_field[key], value,
+                                            err_msg=name + ' ' + key)
+        np.testing.assert_equal(batch_radar.metadata, cmac_radar.metadata)
+
+
+def test_cbb_flag_missing_rays():
+    radar, sonde, _ = _synthetic_volume()
+    cbb = np.zeros((radar.nrays - 10, radar.ngates), dtype='int32')
+    cbb[0] = 1
+    radar.fields['cbb_flag'] = {'data': cbb}
+    cmac_radar = cmac(copy.deepcopy(radar), sonde, 'xsapr_i5_ppi',
+                      verbose=False, products=['classification'])
+    # The rays the flag does not have are blocked.
+    gate_id = cmac_radar.fields['gate_id']['data']
+    assert np.all(gate_id[0] == 6)
+    assert np.all(gate_id[-10:] == 6)
+
+    radar.fields['cbb_flag'] = {'data': cbb[:, :-1]}
+    with pytest.raises(ValueError):
+        cmac(radar, sonde, 'xsapr_i5_ppi', verbose=False,
+             products=['classification'])
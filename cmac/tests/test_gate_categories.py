@@ -0,0 +1,30 @@
+""" Unit Tests for CMAC 2.0's gate_categories.py module. """
+
+import numpy as np
+import pyart
+
+from cmac.gate_categories import GateCategories, get_gate_categories
+
+
+def test_gate_categories_notes_and_masks():
+    radar = pyart.testing.make_empty_ppi_radar(10, 4, 1)
+    data = np.array([[0, 1, 2, 3, 4, 5, 1, 1, 2, 2]] * 4)
+    field = {'data': data,
+             'notes': '0:multi_trip,1:rain,2:snow,3:no_scatter,4:melting'}
+    radar.add_field('gate_id', field)
+
+    categories = get_gate_categories(radar)
+    assert categories['melting'] == 4
+    categories.add('clutter', 5, radar.fields['gate_id'])
+    assert radar.fields['gate_id']['notes'].endswith(',5:clutter')
+    assert radar.fields['gate_id']['valid_max'] == 5
+    assert get_gate_categories(radar) is categories
+    assert categories.color_list()[-1] == 'black'
+
+    np.testing.assert_array_equal(categories.mask('rain'), data == 1)
+    gatefilter = categories.gatefilter(radar, ['rain', 'snow'])
+    np.testing.assert_array_equal(gatefilter.gate_included,
+                                  np.logical_or(data == 1, data == 2))
+
+    rebuilt = GateCategories.from_notes(radar.fields['gate_id']['notes'])
+    assert rebuilt.sorted_items() == categories.sorted_items()
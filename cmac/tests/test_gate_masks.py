@@ -0,0 +1,36 @@
+""" Unit Tests for CMAC 2.0's gate_masks.py module. """
+
+import numpy as np
+import pyart
+
+from cmac.gate_masks import GateMask
+
+
+def test_gate_mask_algebra_matches_boolean_arrays():
+    rng = np.random.RandomState(0)
+    # 13 gates so the packed bits have padding in their last byte.
+    first = rng.uniform(size=(7, 13)) > 0.5
+    second = rng.uniform(size=(7, 13)) > 0.3
+    mask_a = GateMask.from_array(first)
+    mask_b = GateMask.from_array(second)
+
+    np.testing.assert_array_equal((mask_a | mask_b).to_array(),
+                                  first | second)
+    np.testing.assert_array_equal((mask_a & mask_b).to_array(),
+                                  first & second)
+    np.testing.assert_array_equal((mask_a - mask_b).to_array(),
+                                  first & ~second)
+    np.testing.assert_array_equal((~mask_a).to_array(), ~first)
+    assert (~mask_a).count() == np.count_nonzero(~first)
+    assert ~~mask_a == mask_a
+
+
+def test_gate_mask_gatefilter():
+    radar = pyart.testing.make_empty_ppi_radar(10, 4, 2)
+    # GateFilter checks masks against the shape of the first field.
+    radar.add_field('reflectivity', {'data': np.ma.zeros((8, 10))})
+    mask = np.zeros((8, 10), dtype=bool)
+    mask[2:5, 3:7] = True
+    gatefilter = GateMask.from_array(mask).gatefilter(radar)
+    np.testing.assert_array_equal(gatefilter.gate_included, mask)
+    assert GateMask.from_gatefilter(gatefilter) == GateMask.from_array(mask)
@@ -0,0 +1,36 @@
+""" Unit Tests for CMAC 2.0's geometry_cache.py module. """
+
+import numpy as np
+import pyart
+
+from cmac.geometry_cache import GEOMETRY_NAMES, GeometryCache
+
+
+def test_geometry_matches_pyart(tmp_path):
+    radar = pyart.testing.make_target_radar()
+    cache = GeometryCache(str(tmp_path), angle_quantum=None)
+    geometry = cache.geometry(radar)
+    for name in GEOMETRY_NAMES:
+        pyart_data = getattr(radar, name)['data']
+        assert geometry[name].dtype == pyart_data.dtype, name
+        np.testing.assert_array_equal(geometry[name], pyart_data)
+        assert not geometry[name].flags.writeable
+
+    # Another radar of the same layout maps the stored arrays.
+    other = pyart.testing.make_target_radar()
+    assert cache.key(other) == cache.key(radar)
+    cache.apply(other)
+    assert isinstance(other.gate_z['data'], np.memmap)
+    np.testing.assert_array_equal(GeometryCache(
+        str(tmp_path), angle_quantum=None).geometry(other)['gate_altitude'],
+                                  geometry['gate_altitude'])
+
+
+def test_angle_quantum():
+    radar = pyart.testing.make_target_radar()
+    jittered = pyart.testing.make_target_radar()
+    jittered.azimuth['data'] = jittered.azimuth['data'] + 0.001
+    cache = GeometryCache(angle_quantum=0.01)
+    assert cache.key(radar) == cache.key(jittered)
+    assert GeometryCache(angle_quantum=None).key(radar) != GeometryCache(
+        angle_quantum=None).key(jittered)
@@ -0,0 +1,90 @@
+""" Unit Tests for CMAC 2.0's phase_processing.py module. """
+
+import copy
+
+import numpy as np
+import pyart
+import pytest
+
+from cmac.phase_processing import (_ray_batches, phase_proc_lp_parallel,
+                                   solver_available)
+
+
+def test_ray_batches_select_rays_within_sweeps():
+    radar = pyart.testing.make_empty_ppi_radar(10, 6, 2)
+    batches = _ray_batches(radar, 4)
+    assert [list(rays) for rays in batches] == [
+        [0, 1, 2, 3], [4, 5], [6, 7, 8, 9], [10, 11]]
+
+    solved = np.zeros(12, dtype=bool)
+    solved[[1, 2, 5, 6, 11]] = True
+    batches = _ray_batches(radar, 2, solved)
+    assert [list(rays) for rays in batches] == [[1, 2], [5], [6, 11]]
+
+
+def _phase_radar():
+    """ Two sweeps of rain up to gate 60 with a rising phase, a ray
+    without rain and a ray with rain up to gate 10. """
+    radar = pyart.testing.make_empty_ppi_radar(120, 8, 2)
+    radar.range['data'] = np.arange(120, dtype='float32') * 250.0
+    rng = np.random.RandomState(0)
+    refl = np.full((16, 120), 30.0)
+    refl[:, 60:] = -10.0
+    refl[5] = -10.0
+    refl[13, 10:] = -10.0
+    phidp = (np.cumsum(refl > 0, axis=1) * 0.5 + 20.0
+             + rng.normal(0, 2, (16, 120)))
+    radar.add_field('reflectivity', {'data': np.ma.array(refl)})
+    radar.add_field('differential_phase', {'data': np.ma.array(phidp)})
+    gatefilter = pyart.filters.GateFilter(radar)
+    gatefilter.exclude_below('reflectivity', 10)
+    return radar, gatefilter
+
+
+@pytest.mark.skipif(not solver_available('cvxopt'),
+                    reason='cvxopt is not installed')
+def test_phase_proc_lp_parallel_matches_serial():
+    radar, gatefilter = _phase_radar()
+    kwargs = {'LP_solver': 'cvxopt', 'nowrap': 50, 'fzl': 4000.0,
+              'ncpts': 2,
+              'phidp_field': 'differential_phase',
+              'refl_field': 'reflectivity'}
+    serial_radar = copy.deepcopy(radar)
+    phidp, kdp = pyart.correct.phase_proc_lp_gf(
+        serial_radar, gatefilter=gatefilter, **kwargs)
+    batch_phidp, batch_kdp = phase_proc_lp_parallel(
+        radar, gatefilter=gatefilter, n_workers=2, rays_per_batch=3,
+        **kwargs)
+    assert sorted(batch_phidp.keys()) == sorted(phidp.keys())
+    assert sorted(batch_kdp.keys()) == sorted(kdp.keys())
+    np.testing.assert_allclose(
+        radar.fields['unfolded_differential_phase']['data'],
+        serial_radar.fields['unfolded_differential_phase']['data'])
+    np.testing.assert_allclose(batch_phidp['data'], phidp['data'],
+                               atol=1e-6)
+    np.testing.assert_allclose(batch_kdp['data'], kdp['data'], atol=1e-6)
+
+    # Rays below min_gates are not solved and hold zero phase and KDP.
+    radar, gatefilter = _phase_radar()
+    min_phidp, min_kdp = phase_proc_lp_parallel(
+        radar, gatefilter=gatefilter, min_gates=20, **kwargs)
+    solved = ~np.isin(np.arange(16), [5, 13])
+    np.testing.assert_allclose(min_phidp['data'][solved],
+                               phidp['data'][solved], atol=1e-6)
+    np.testing.assert_allclose(min_kdp['data'][solved],
+                               kdp['data'][solved], atol=1e-6)
+    assert np.all(min_phidp['data'][~solved] == 0)
+    assert np.all(min_kdp['data'][~solved] == 0)
+    # Every ray, solved or not, holds the unfolded input phase.
+    assert np.abs(radar.fields['unfolded_differential_phase']['data'][
+        13, :10]).max() > 0
+    np.testing.assert_allclose(
+        radar.fields['unfolded_differential_phase']['data'],
+        serial_radar.fields['unfolded_differential_phase']['data'])
+
+
+def test_phase_proc_lp_parallel_missing_solver():
+    radar, gatefilter = _phase_radar()
+    with pytest.raises(ImportError):
+        phase_proc_lp_parallel(radar, gatefilter=gatefilter, n_workers=2,
+                               LP_solver='not_a_solver')
@@ -0,0 +1,55 @@
+""" Unit Tests for CMAC 2.0's pipeline.py module. """
+
+import numpy as np
+import pyart
+import pytest
+
+from cmac.pipeline import (
+    STAGES, resolve_stages, run_stages, select_fields, stage_overlap)
+
+
+def test_resolve_stages():
+    assert resolve_stages() == list(STAGES.keys())
+    assert resolve_stages(['gate_id', 'corrected_velocity']) == [
+        'sounding', 'snr', 'texture', 'beam_blockage', 'classification',
+        'simulated_velocity', 'dealias']
+    stages = resolve_stages(['corrected_reflectivity', 'rain_rate_A'])
+    assert 'phase' in stages and 'rain_rate' in stages
+    assert 'dealias' not in stages and 'snow_rate' not in stages
+    assert resolve_stages('texture') == ['texture']
+    with pytest.raises(ValueError):
+        resolve_stages(['not_a_product'])
+
+
+def test_select_fields():
+    radar = pyart.testing.make_empty_ppi_radar(10, 4, 1)
+    for field in ['reflectivity', 'height', 'gate_id', 'rain_rate_A']:
+        radar.add_field(field, {'data': np.zeros((4, 10))})
+    select_fields(radar, ['rain_rate'], ['reflectivity'])
+    assert sorted(radar.fields.keys()) == ['rain_rate_A', 'reflectivity']
+
+
+def test_run_stages_order():
+    stages = resolve_stages(['rain_rate_A', 'corrected_velocity'])
+    for n_threads in [1, 4]:
+        finished = []
+        functions = {name: (lambda radar, state, name=name:
+                            finished.append(name)) for name in stages}
+        timings = run_stages(None, {}, stages, functions,
+                             n_threads=n_threads)
+        assert list(timings.keys()) == stages
+        assert sorted(finished) == sorted(stages)
+        for name in stages:
+            for required in STAGES[name]['requires']:
+                assert finished.index(required) < finished.index(name)
+
+
+def test_stage_overlap():
+    timings = {'a': (0.0, 4.0), 'b': (1.0, 2.0), 'c': (1.5, 3.0),
+               'd': (5.0, 6.0)}
+    overlap, wall_time = stage_overlap(timings)
+    assert wall_time == 6.0
+    assert overlap['a'] == {'duration': 4.0, 'overlap': 2.0}
+    assert overlap['b']['overlap'] == 1.0
+    assert overlap['c']['overlap'] == 1.5
+    assert overlap['d']['overlap'] == 0.0
@@ -0,0 +1,69 @@
+""" Unit Tests for CMAC 2.0's qvp.py module. """
+
+import warnings
+
+import numpy as np
+import pyart
+from scipy import interpolate
+
+from cmac.cmac_processing import retrieve_qvp
+from cmac.qvp import compute_qvp_series, interpolation_weights
+
+
+def test_interpolation_weights_match_interp1d():
+    z = np.cumsum(np.linspace(10.0, 30.0, 50))
+    values = np.sin(z / 200.0)
+    heights = np.linspace(-100.0, 1500.0, 40)
+    lower, upper, weight = interpolation_weights(z, heights)
+    expected = interpolate.interp1d(
+        z, values, bounds_error=False, fill_value='extrapolate')(heights)
+    np.testing.assert_allclose(
+        values[lower] * (1.0 - weight) + values[upper] * weight, expected)
+
+
+def test_interpolation_weights_repeated_altitudes():
+    z = np.array([0.0, 100.0, 100.0, 200.0])
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        lower, upper, weight = interpolation_weights(
+            z, np.array([50.0, 100.0, 150.0]))
+    assert np.isfinite(weight).all()
+    values = np.array([0.0, 1.0, 1.0, 2.0])
+    np.testing.assert_allclose(
+        values[lower] * (1.0 - weight) + values[upper] * weight,
+        [0.5, 1.0, 1.5])
+
+
+def test_qvp_series_matches_retrieve_qvp():
+    radar = pyart.testing.make_target_radar()
+    heights = np.linspace(0.0, 2000.0, 21)
+    expected = retrieve_qvp(radar, heights, flds=['reflectivity'])
+    series = compute_qvp_series([radar, radar], heights,
+                                fields=['reflectivity', 'missing'])
+    assert series.ntimes == 2
+    # The gate altitudes of the target radar repeat, where interp1d
+    # divides by zero and gives NaN and the weights use the lower gate.
+    valid = np.isfinite(expected['reflectivity'])
+    for i in range(2):
+        assert np.isfinite(series.data['reflectivity'][i]).all()
+        np.testing.assert_allclose(series.data['reflectivity'][i][valid],
+                                   expected['reflectivity'][valid],
+                                   rtol=1e-5)
+        assert np.isnan(series.data['missing'][i]).all()
+    dataset = series.to_dataset()
+    assert dataset['reflectivity'].dims == ('time', 'height')
+    assert dataset.attrs['Conventions'] == 'CF-1.7'
+
+
+def test_qvp_series_unreadable_file(tmpdir):
+    radar = pyart.testing.make_target_radar()
+    heights = np.linspace(0.0, 2000.0, 21)
+    missing = str(tmpdir.join('missing.nc'))
+    series = compute_qvp_series([radar, missing, radar], heights,
+                                fields=['reflectivity'])
+    assert series.ntimes == 3
+    assert list(series.failures.keys()) == [missing]
+    assert np.isnan(series.data['reflectivity'][1]).all()
+    assert np.isnat(series.times[1])
+    assert not np.isnan(series.data['reflectivity'][2]).all()
+    assert series.to_dataset().attrs['failed_volumes'] == missing
@@ -0,0 +1,39 @@
+""" Unit Tests for CMAC 2.0's radar_statistics.py module. """
+
+import numpy as np
+import pyart
+
+from cmac import area_coverage
+from cmac.gate_categories import get_gate_categories
+from cmac.radar_statistics import coverage_statistics
+
+
+def test_coverage_statistics():
+    radar = pyart.testing.make_empty_ppi_radar(20, 10, 3)
+    rng = np.random.RandomState(0)
+    refl = np.ma.masked_less(rng.uniform(-10.0, 60.0, (30, 20)), 0.0)
+    radar.add_field('corrected_reflectivity', {'data': refl})
+    gate_id = rng.randint(0, 5, (30, 20))
+    radar.add_field('gate_id', {
+        'data': gate_id,
+        'notes': '0:multi_trip,1:rain,2:snow,3:no_scatter,4:melting'})
+
+    first = refl[0:10]
+    expected = (100.0 * np.count_nonzero(np.ma.filled(first >= 10.0, False))
+                / first.size,
+                100.0 * np.count_nonzero(np.ma.filled(first >= 40.0, False))
+                / first.size)
+    np.testing.assert_allclose(area_coverage(radar), expected)
+
+    statistics = coverage_statistics(
+        radar, thresholds=(10.0,), sweeps=(1, None),
+        histogram_bins=np.arange(0.0, 70.0, 10.0), class_fractions=True)
+    assert statistics['all']['gates'] == 600
+    assert statistics['sweep_1']['histogram'].sum() == refl[10:20].count()
+    fractions = [value for key, value in statistics['sweep_1'].items()
+                 if key.startswith('fraction_')]
+    np.testing.assert_allclose(sum(fractions), 100.0)
+    categories = get_gate_categories(radar)
+    np.testing.assert_allclose(
+        statistics['sweep_1']['fraction_rain'],
+        100.0 * np.count_nonzero(categories.mask('rain')[10:20]) / 200.0)
@@ -0,0 +1,50 @@
+""" Unit Tests for CMAC 2.0's realtime.py module. """
+
+import os
+
+from cmac.realtime import DirectoryWatcher, run_service
+
+
+def _write_output(entry, image_directory=None):
+    os.makedirs(os.path.dirname(entry['output_file']), exist_ok=True)
+    open(entry['output_file'], 'w').close()
+
+
+def test_directory_watcher_polling(tmpdir):
+    old_file = str(tmpdir.join('radar_20220301.120000.nc'))
+    open(old_file, 'w').close()
+    watcher = DirectoryWatcher(str(tmpdir), pattern='*.nc', settle_time=0.0,
+                               poll_interval=0.01, use_inotify=False)
+    new_file = str(tmpdir.join('radar_20220301.121000.nc'))
+    with open(new_file, 'w') as outfile:
+        outfile.write('volume')
+    # Seen on the first poll, reported once unchanged on the next.
+    assert watcher.poll() == []
+    ready = watcher.poll()
+    assert [path for path, _ in ready] == [new_file]
+    assert watcher.poll() == []
+
+    # Files removed before they settle are dropped.
+    removed_file = str(tmpdir.join('radar_20220301.122000.nc'))
+    open(removed_file, 'w').close()
+    watcher.poll()
+    os.remove(removed_file)
+    assert watcher.poll() == []
+
+
+def test_run_service_polling(tmpdir):
+    input_dir = tmpdir.mkdir('input')
+    sonde_dir = tmpdir.mkdir('sonde')
+    out_dir = tmpdir.mkdir('output')
+    open(str(sonde_dir.join('gucsondewnpnM1.b1.20220301.113000.cdf')),
+         'w').close()
+    open(str(input_dir.join('xprecipradar_guc_volume_20220301-120000.b1.nc')),
+         'w').close()
+    latencies = run_service(str(input_dir), str(sonde_dir), 'sail_xband_ppi',
+                            str(out_dir), pattern='*.nc', n_workers=1,
+                            settle_time=0.0, poll_interval=0.01,
+                            process_func=_write_output, max_volumes=1,
+                            use_inotify=False, include_existing=True)
+    assert len(latencies) == 1
+    assert latencies[0]['ok']
+    assert len(out_dir.join('202203').listdir()) == 1
@@ -0,0 +1,90 @@
+""" Unit Tests for CMAC 2.0's sensitivity.py module. """
+
+import copy
+
+import numpy as np
+import pytest
+
+from cmac import cmac
+from cmac.config import _DEFAULT_CMAC_VALUES, get_cmac_values
+from cmac.phase_processing import solver_available
+from cmac.sensitivity import (
+    attenuation_groups, cmac_sensitivity, coefficient_sweep,
+    complete_coefficient_sets)
+from cmac.testing import make_synthetic_radar, make_synthetic_sonde
+
+
+def test_attenuation_groups():
+    cmac_config = get_cmac_values('xsapr_i6_ppi')
+    sets = complete_coefficient_sets(
+        [{'rain_rate_a_coef': 200.0}, {'rain_rate_a_coef': 300.0},
+         {'c_coef': 0.1}], cmac_config)
+    assert sets[0]['d_coef'] == cmac_config['d_coef']
+    assert sets[1]['rain_rate_a_coef'] == 300.0
+
+    unique, index = attenuation_groups(sets)
+    assert len(unique) == 2
+    np.testing.assert_array_equal(index, [0, 0, 1])
+    assert unique[1]['c_coef'] == 0.1
+
+
+def _synthetic_volume():
+    """ Small X-SAPR volume with rain in the first quarter of every sweep
+    and noise in the rest. """
+    radar = make_synthetic_radar('xsapr', scale=0.2, n_cells=0)
+    noise = np.arange(radar.nrays) % 72 >= 18
+    radar.fields['normalized_coherent_power']['data'][noise] = 0.05
+    radar.fields['cross_correlation_ratio']['data'][noise] = 0.1
+    radar.fields['reflectivity']['data'][noise] = -30.0
+    return radar, make_synthetic_sonde(surface_temperature=5.0)
+
+
+def _assert_matches(values, field):
+    """ Compares the gates where both the sweep value and field are
+    valid. """
+    data = np.ma.filled(np.ma.asarray(field['data'], dtype=float), np.nan)
+    valid = np.isfinite(values) & np.isfinite(data)
+    assert valid.sum() > 100
+    np.testing.assert_allclose(values[valid], data[valid], rtol=1e-5,
+                               atol=1e-5)
+
+
+@pytest.mark.skipif(not solver_available('cvxopt'),
+                    reason='cvxopt is not installed')
+def test_cmac_sensitivity_matches_cmac(monkeypatch):
+    monkeypatch.setitem(_DEFAULT_CMAC_VALUES['xsapr_i5_ppi'], 'lp_solver',
+                        'cvxopt')
+    radar, sonde = _synthetic_volume()
+    cmac_radar = cmac(copy.deepcopy(radar), sonde, 'xsapr_i5_ppi',
+                      verbose=False)
+    dataset = cmac_sensitivity(radar, sonde, 'xsapr_i5_ppi', [{}],
+                               verbose=False)
+    for name in ('corrected_reflectivity', 'specific_attenuation',
+                 'rain_rate_A'):
+        _assert_matches(dataset[name].values[0], cmac_radar.fields[name])
+
+
+@pytest.mark.skipif(not solver_available('cvxopt'),
+                    reason='cvxopt is not installed')
+def test_coefficient_sweep_workers(monkeypatch):
+    monkeypatch.setitem(_DEFAULT_CMAC_VALUES['xsapr_i5_ppi'], 'lp_solver',
+                        'cvxopt')
+    radar, sonde = _synthetic_volume()
+    radar = cmac(radar, sonde, 'xsapr_i5_ppi', products=['phase'],
+                 verbose=False)
+    a_coef = get_cmac_values('xsapr_i5_ppi')['attenuation_a_coef']
+    sets = [{}, {'attenuation_a_coef': 2.0 * a_coef},
+            {'rain_rate_a_coef': 300.0}]
+    serial = coefficient_sweep(radar, 'xsapr_i5_ppi', sets)
+    parallel = coefficient_sweep(radar, 'xsapr_i5_ppi', sets, n_workers=2)
+    for name in ('corrected_reflectivity', 'specific_attenuation',
+                 'rain_rate_A'):
+        np.testing.assert_array_equal(parallel[name].values,
+                                      serial[name].values)
+    # Sets differing only in the rain rate share the attenuation.
+    np.testing.assert_array_equal(
+        serial['specific_attenuation'].values[2],
+        serial['specific_attenuation'].values[0])
+    assert not np.array_equal(serial['specific_attenuation'].values[1],
+                              serial['specific_attenuation'].values[0],
+                              equal_nan=True)
@@ -0,0 +1,44 @@
+""" Unit Tests for CMAC 2.0's stage_cache.py module. """
+
+import numpy as np
+
+from cmac.pipeline import STAGES
+from cmac.stage_cache import StageCache, stage_keys
+
+
+def test_stage_keys_follow_dependencies():
+    settings = {'attenuation_a_coef': 0.08, 'rain_rate_a_coef': 294.0,
+                'sweep_aware_filter': False}
+    keys = stage_keys('volume', settings)
+    settings['attenuation_a_coef'] = 0.06
+    retuned = stage_keys('volume', settings)
+    changed = [name for name in STAGES if keys[name] != retuned[name]]
+    assert changed == ['attenuation', 'rain_rate', 'snow_rate']
+    assert stage_keys('other', settings)['sounding'] != retuned['sounding']
+
+
+class _Radar(object):
+    def __init__(self):
+        self.fields = {}
+
+
+def test_stage_cache_wrap(tmpdir):
+    cache = StageCache(str(tmpdir), stages=('dealias',))
+    calls = []
+
+    def dealias(radar, state):
+        calls.append(1)
+        radar.fields['corrected_velocity'] = {
+            'data': np.ma.masked_less(np.arange(4.0), 1.0)}
+
+    stage = cache.wrap('dealias', dealias, 'key')
+    radar = _Radar()
+    stage(radar, {})
+    restored = _Radar()
+    stage(restored, {})
+    assert len(calls) == 1
+    np.testing.assert_array_equal(
+        restored.fields['corrected_velocity']['data'].mask,
+        radar.fields['corrected_velocity']['data'].mask)
+    assert ('dealias', 'key') in cache
+    assert cache.wrap('phase', dealias, 'key') is dealias
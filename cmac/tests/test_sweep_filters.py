@@ -0,0 +1,26 @@
+""" Unit Tests for CMAC 2.0's sweep_filters.py module. """
+
+import numpy as np
+import pyart
+from scipy import ndimage
+
+from cmac.sweep_filters import full_circle_sweeps, sweep_median_filter
+
+
+def test_sweep_median_filter_wraps_and_keeps_sweeps_apart():
+    radar = pyart.testing.make_empty_ppi_radar(50, 36, 3)
+    radar.azimuth['data'] = np.tile(np.arange(0.0, 360.0, 10.0), 3)
+    assert full_circle_sweeps(radar) == [True, True, True]
+
+    rng = np.random.RandomState(0)
+    data = rng.uniform(0.0, 1.0, (radar.nrays, radar.ngates))
+    for n_threads in (1, 3):
+        filtered = sweep_median_filter(radar, data, size=(3, 4),
+                                       n_threads=n_threads)
+        for sweep in range(3):
+            this_sweep = data[sweep * 36:(sweep + 1) * 36]
+            padded = np.concatenate([this_sweep[-3:], this_sweep,
+                                     this_sweep[:3]])
+            expected = ndimage.median_filter(padded, size=(3, 4))[3:-3]
+            np.testing.assert_array_equal(
+                filtered[sweep * 36:(sweep + 1) * 36], expected)
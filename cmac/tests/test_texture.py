@@ -0,0 +1,19 @@
+""" Unit Tests for CMAC 2.0's texture.py module. """
+
+import numpy as np
+import pyart
+from scipy import ndimage
+
+from cmac.texture import velocity_texture
+
+
+def test_velocity_texture_blocks_match_full_volume():
+    rng = np.random.RandomState(0)
+    vel = rng.uniform(-16.5, 16.5, (725, 300))
+    vel[100:110, 50:60] = np.nan
+    expected = ndimage.median_filter(
+        pyart.util.angular_texture_2d(vel, 4, 16.5), size=(4, 4))
+    for block_size, n_threads in ((None, 1), (100, 1), (64, 4), (7, 2)):
+        texture = velocity_texture(vel, 16.5, block_size=block_size,
+                                   n_threads=n_threads)
+        np.testing.assert_array_equal(texture, expected)
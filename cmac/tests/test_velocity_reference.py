@@ -0,0 +1,42 @@
+""" Unit Tests for CMAC 2.0's velocity_reference.py module. """
+
+import numpy as np
+import pyart
+
+from cmac.velocity_reference import VelocityReference
+
+
+def _volume(start, azimuth_offset=0.0):
+    radar = pyart.testing.make_empty_ppi_radar(20, 36, 2)
+    radar.time['units'] = 'seconds since 2020-01-01T00:00:00Z'
+    radar.time['data'] = start + np.arange(radar.nrays, dtype=float)
+    radar.azimuth['data'] = np.mod(
+        radar.azimuth['data'] + azimuth_offset, 360.0)
+    radar.fixed_angle['data'] = np.array([0.5, 1.5])
+    return radar
+
+
+def test_reference_aligns_previous_volume():
+    previous = _volume(0.0)
+    data = np.ma.masked_less(np.random.RandomState(0).uniform(
+        -30.0, 30.0, (previous.nrays, previous.ngates)), -25.0)
+    previous.add_field('corrected_velocity', {'data': data})
+    reference = VelocityReference(max_gap=600.0)
+    assert reference.reference(previous) is None
+    reference.update(previous)
+
+    # The rays of the next volume are jittered and in another order.
+    radar = _volume(300.0, azimuth_offset=0.4)
+    order = np.roll(np.arange(36), 5)
+    radar.azimuth['data'][:36] = radar.azimuth['data'][:36][order]
+    ref_vel = reference.reference(radar)
+    np.testing.assert_array_equal(ref_vel['data'][36:].filled(-999.0),
+                                  data[36:].filled(-999.0))
+    np.testing.assert_array_equal(ref_vel['data'][:36].filled(-999.0),
+                                  data[:36][order].filled(-999.0))
+
+    # Too late, or a sweep never seen before.
+    assert reference.reference(_volume(1000.0)) is None
+    radar = _volume(300.0)
+    radar.fixed_angle['data'] = np.array([0.5, 3.0])
+    assert reference.reference(radar) is None
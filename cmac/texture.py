@@ -0,0 +1,116 @@
+""" Velocity texture computed in blocks of rays, so the temporaries of the
+angular texture and the median filter are bounded by the block size rather
+than the size of the volume. """
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyart
+from scipy import ndimage
+
+from .sweep_filters import pad_sweep
+
+
+def velocity_texture(vel, nyq, window=4, median_size=(4, 4),
+                     block_size=1024, n_threads=1, out=None, sweeps=None,
+                     wrap=None):
+    """
+    Angular texture of a velocity array followed by a median filter,
+    computed block by block along the ray axis.
+
+    Each block is extended by a halo of neighbouring rays wide enough for
+    the texture window and the median filter, and only its interior is
+    written to the output. The edges of the volume keep the boundary
+    handling of pyart.util.angular_texture_2d and ndimage.median_filter,
+    so the result is identical to filtering the whole volume at once.
+
+    Parameters
+    ----------
+    vel : array
+        Velocity array of shape (nrays, ngates). Masked values are used
+        as their underlying data, as in pyart.util.angular_texture_2d.
+    nyq : float
+        Nyquist velocity.
+
+    Other Parameters
+    ----------------
+    window : int
+        Size of the angular texture window.
+    median_size : tuple
+        Size of the median filter.
+    block_size : int
+        Number of rays per block. If None the volume is one block.
+    n_threads : int
+        Number of threads to process blocks with.
+    out : array
+        Preallocated float64 output array of shape (nrays, ngates).
+    sweeps : list
+        List of (start, end) ray index pairs, end exclusive. If given,
+        each sweep is one block and no window crosses a sweep boundary,
+        block_size is then ignored.
+    wrap : list
+        List of booleans, one per sweep, True for sweeps that are padded
+        circularly in azimuth. See sweep_filters.full_circle_sweeps.
+
+    Returns
+    -------
+    texture : array
+        Median filtered velocity texture.
+
+    """
+    vel = np.asarray(vel)
+    nrays = vel.shape[0]
+    if out is None:
+        out = np.empty(vel.shape, dtype='float64')
+    if sweeps is not None:
+        if wrap is None:
+            wrap = [False] * len(sweeps)
+        return _sweep_texture(vel, nyq, window, median_size, n_threads,
+                              out, sweeps, wrap)
+    if block_size is None or block_size >= nrays:
+        blocks = [(0, nrays)]
+    else:
+        blocks = [(start, min(start + block_size, nrays))
+                  for start in range(0, nrays, block_size)]
+    # Rays on either side of a block that influence its interior.
+    halo = window + max(median_size)
+
+    def _do_block(block):
+        start, end = block
+        halo_start = max(start - halo, 0)
+        halo_end = min(end + halo, nrays)
+        std_dev = pyart.util.angular_texture_2d(
+            vel[halo_start:halo_end], window, nyq)
+        filtered = ndimage.median_filter(std_dev, size=median_size)
+        out[start:end] = filtered[start - halo_start:end - halo_start]
+
+    if n_threads > 1 and len(blocks) > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(_do_block, blocks))
+    else:
+        for block in blocks:
+            _do_block(block)
+    return out
+
+
+def _sweep_texture(vel, nyq, window, median_size, n_threads, out, sweeps,
+                   wrap):
+    """ Velocity texture computed sweep by sweep, with full circle sweeps
+    padded circularly in azimuth. """
+    halo = window + max(median_size)
+
+    def _do_sweep(job):
+        (start, end), this_wrap = job
+        padded, pad = pad_sweep(vel[start:end], halo, this_wrap)
+        std_dev = pyart.util.angular_texture_2d(padded, window, nyq)
+        filtered = ndimage.median_filter(std_dev, size=median_size)
+        out[start:end] = filtered[pad:pad + end - start]
+
+    jobs = list(zip(sweeps, wrap))
+    if n_threads > 1 and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(_do_sweep, jobs))
+    else:
+        for job in jobs:
+            _do_sweep(job)
+    return out
@@ -0,0 +1,143 @@
+""" Dealiasing reference from the previous volume. When volumes of a radar
+are processed in sequence, the dealiased velocity of the last volume is a
+better reference for the region based dealiasing than the velocity
+simulated from a sonde that may be hours old. The last dealiased velocity
+of each sweep is kept and aligned with the rays and gates of the next
+volume. """
+
+import datetime
+
+import netCDF4
+import numpy as np
+
+from .sweep_filters import nearest_index, sweep_slices
+
+
+class VelocityReference(object):
+    """
+    Last dealiased velocity of each sweep of a radar.
+
+    Parameters
+    ----------
+    max_gap : float
+        Largest time in seconds between a sweep and the stored sweep of
+        the same fixed angle for the stored velocity to be used.
+
+    Other Parameters
+    ----------------
+    angle_tolerance : float
+        Largest difference in degrees between the fixed angles of
+        matching sweeps.
+    ray_tolerance : float
+        Largest difference in degrees between the azimuth, or elevation
+        for RHIs, of a ray and the nearest stored ray. Rays without a
+        stored ray this close are masked.
+    field : str
+        Name of the dealiased velocity field stored.
+
+    """
+
+    def __init__(self, max_gap=600.0, angle_tolerance=0.5,
+                 ray_tolerance=2.0, field='corrected_velocity'):
+        self.max_gap = max_gap
+        self.angle_tolerance = angle_tolerance
+        self.ray_tolerance = ray_tolerance
+        self.field = field
+        # fixed angle: {'time', 'angles', 'range', 'circular', 'data'}
+        self.sweeps = {}
+
+    def key(self):
+        """ String identifying the stored sweeps and the settings, used in
+        the stage cache keys. """
+        return repr((self.max_gap, self.angle_tolerance, self.ray_tolerance,
+                     sorted([(angle, sweep['time'])
+                             for angle, sweep in self.sweeps.items()])))
+
+    def update(self, radar):
+        """ Stores the dealiased velocity of each sweep of a radar. Sweeps
+        without a valid gate keep the velocity stored before. """
+        data = radar.fields[self.field]['data']
+        times = _ray_times(radar)
+        angles = _ray_angles(radar)
+        for sweep, (start, end) in enumerate(sweep_slices(radar)):
+            velocity = np.ma.array(data[start:end], copy=True)
+            if velocity.count() == 0:
+                continue
+            order = np.argsort(angles[start:end], kind='stable')
+            self.sweeps[float(radar.fixed_angle['data'][sweep])] = {
+                'time': float(times[start:end].mean()),
+                'angles': angles[start:end][order],
+                'range': np.array(radar.range['data'], dtype=float),
+                'circular': radar.scan_type == 'ppi',
+                'data': velocity[order]}
+
+    def reference(self, radar):
+        """
+        Stored velocity aligned with the rays and gates of a radar.
+
+        Parameters
+        ----------
+        radar : Radar
+            Radar the reference is wanted for.
+
+        Returns
+        -------
+        reference : dict
+            Field of the stored velocity of the nearest ray and gate,
+            masked where there is none. None if a sweep has no stored
+            sweep of the same fixed angle recorded up to max_gap seconds
+            before it, or no valid aligned gate.
+
+        """
+        times = _ray_times(radar)
+        angles = _ray_angles(radar)
+        data = np.ma.masked_all((radar.nrays, radar.ngates), dtype='float64')
+        for sweep, (start, end) in enumerate(sweep_slices(radar)):
+            stored = self._match(radar.fixed_angle['data'][sweep])
+            if stored is None:
+                return None
+            gap = times[start:end].mean() - stored['time']
+            if not 0.0 < gap <= self.max_gap:
+                return None
+            rays = nearest_index(stored['angles'], angles[start:end],
+                                 self.ray_tolerance, stored['circular'])
+            gate_spacing = np.median(np.diff(stored['range'])) if len(
+                stored['range']) > 1 else np.inf
+            gates = nearest_index(stored['range'], radar.range['data'],
+                                  gate_spacing / 2.0)
+            aligned = stored['data'][np.maximum(rays, 0)][
+                :, np.maximum(gates, 0)]
+            aligned[rays < 0] = np.ma.masked
+            aligned[:, gates < 0] = np.ma.masked
+            if aligned.count() == 0:
+                return None
+            data[start:end] = aligned
+        return {'data': data, 'units': 'm/s',
+                'long_name': 'Dealiased velocity of the previous volume',
+                'coordinates': 'elevation azimuth range'}
+
+    def _match(self, fixed_angle):
+        """ Stored sweep of the nearest fixed angle, or None. """
+        if not self.sweeps:
+            return None
+        angle = min(self.sweeps.keys(), key=lambda x: abs(x - fixed_angle))
+        if abs(angle - fixed_angle) > self.angle_tolerance:
+            return None
+        return self.sweeps[angle]
+
+
+def _ray_angles(radar):
+    """ Azimuth of the rays, or elevation for RHIs. """
+    if radar.scan_type == 'rhi':
+        return np.asarray(radar.elevation['data'], dtype=float)
+    return np.mod(np.asarray(radar.azimuth['data'], dtype=float), 360.0)
+
+
+def _ray_times(radar):
+    """ Time of the rays in seconds since 1970-01-01. """
+    start = netCDF4.num2date(0, radar.time['units'],
+                             only_use_cftime_datetimes=False,
+                             only_use_python_datetimes=True)
+    offset = (start.replace(tzinfo=None)
+              - datetime.datetime(1970, 1, 1)).total_seconds()
+    return offset + np.asarray(radar.time['data'], dtype=float)
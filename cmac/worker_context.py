@@ -0,0 +1,202 @@
+""" Per worker process context holding the static resources used for every
+radar volume, so configs, flag arrays, the DOD template, the clutter map
+and sondes are loaded once per worker instead of once per volume. """
+
+import gc
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from .batch_processing import match_sonde, parse_file_datetime
+from .clutter_map import ClutterMap
+from .config import (get_cmac_values, get_field_names, get_metadata,
+                     get_plot_values, get_zs_relationships)
+from .geometry_cache import GeometryCache
+from .velocity_reference import VelocityReference
+
+
+class WorkerContext(object):
+    """
+    Static resources for processing radar volumes of a single radar.
+
+    Files are only read the first time a resource is requested, after
+    which the in memory copy is reused for every volume the worker
+    handles.
+
+    Parameters
+    ----------
+    config : str
+        Radar configuration name found in default_config.py.
+
+    Other Parameters
+    ----------------
+    flag_file : str
+        CF/Radial file containing a cbb_flag terrain blockage field.
+    dod_file : str
+        netCDF file with the data object design used to reset the
+        attributes of the written CMAC files.
+    clutter_file : str
+        CF/Radial file containing a ground_clutter field.
+    sonde_files : list
+        Sonde files available to the worker.
+    sonde_date_format : str
+        strptime format of the sonde file names.
+    max_sondes : int
+        Number of opened sondes kept in memory.
+    gc_interval : int
+        Run the garbage collector every gc_interval volumes.
+
+    """
+
+    def __init__(self, config, flag_file=None, dod_file=None,
+                 clutter_file=None, sonde_files=None, sonde_date_format=None,
+                 max_sondes=4, gc_interval=10):
+        self.config = config
+        self.cmac_config = get_cmac_values(config)
+        self.field_config = get_field_names(config)
+        self.meta_config = get_metadata(config)
+        try:
+            self.plot_config = get_plot_values(config)
+        except KeyError:
+            self.plot_config = {}
+        self.zs_relationships = get_zs_relationships()
+        self.flag_file = flag_file
+        self.dod_file = dod_file
+        self.clutter_file = clutter_file
+        self.max_sondes = max_sondes
+        self.gc_interval = gc_interval
+        self.volumes_processed = 0
+        self._flag_map = None
+        self._dod = None
+        self._clutter_map = None
+        self._velocity_reference = None
+        self._geometry_caches = {}
+        self._sondes = OrderedDict()
+        if sonde_files is None:
+            sonde_files = []
+        self.sonde_files = sorted(sonde_files)
+        self.sonde_times = np.array([
+            parse_file_datetime(x, sonde_date_format)
+            for x in self.sonde_files])
+
+    @property
+    def flag_map(self):
+        """ ClutterMap of the cbb_flag field read from flag_file. Rays and
+        gates the file does not cover take the maximum of the flag, so
+        they are treated as blocked. """
+        if self._flag_map is None and self.flag_file is not None:
+            self._flag_map = ClutterMap.from_file(
+                self.flag_file, fields=('cbb_flag',), fill_value='maximum')
+        return self._flag_map
+
+    @property
+    def cbb_flag(self):
+        """ cbb_flag field dictionary read from flag_file. """
+        if self.flag_map is None:
+            return None
+        return self.flag_map.fields['cbb_flag']
+
+    @property
+    def dod(self):
+        """ The data object design dataset, loaded into memory. """
+        if self._dod is None and self.dod_file is not None:
+            import xarray as xr
+            with xr.open_dataset(self.dod_file,
+                                 mask_and_scale=False) as dod:
+                self._dod = dod.load()
+        return self._dod
+
+    @property
+    def clutter_map(self):
+        """ ClutterMap of the ground_clutter field read from
+        clutter_file. """
+        if self._clutter_map is None and self.clutter_file is not None:
+            self._clutter_map = ClutterMap.from_file(
+                self.clutter_file, fields=('ground_clutter',))
+        return self._clutter_map
+
+    @property
+    def clutter_field(self):
+        """ ground_clutter field dictionary read from clutter_file. """
+        if self.clutter_map is None:
+            return None
+        return self.clutter_map.fields['ground_clutter']
+
+    def sonde_file_for(self, radar_time):
+        """ Returns the sonde file closest in time to radar_time. """
+        return match_sonde(radar_time, self.sonde_times, self.sonde_files)
+
+    def open_sonde(self, sonde_file):
+        """ Returns the sonde dataset for sonde_file, loaded into memory.
+        The most recently used sondes are kept, as consecutive volumes
+        usually share a sonde. """
+        if sonde_file in self._sondes:
+            self._sondes.move_to_end(sonde_file)
+            return self._sondes[sonde_file]
+        import xarray as xr
+        with xr.open_dataset(sonde_file) as sonde:
+            sonde = sonde.load()
+        self._sondes[sonde_file] = sonde
+        if len(self._sondes) > self.max_sondes:
+            self._sondes.popitem(last=False)
+        return sonde
+
+    def geometry_cache(self, directory=None):
+        """ GeometryCache of the gate coordinates of the scan layouts
+        seen by this worker, stored in directory if given, see
+        geometry_cache.GeometryCache. """
+        if directory not in self._geometry_caches:
+            self._geometry_caches[directory] = GeometryCache(directory)
+        return self._geometry_caches[directory]
+
+    def velocity_reference(self, max_gap):
+        """ VelocityReference keeping the dealiased velocity of the
+        volumes processed by this worker, see
+        velocity_reference.VelocityReference. """
+        if (self._velocity_reference is None
+                or self._velocity_reference.max_gap != max_gap):
+            self._velocity_reference = VelocityReference(max_gap=max_gap)
+        return self._velocity_reference
+
+    def add_static_fields(self, radar):
+        """ Adds the cbb_flag and ground_clutter fields to a radar,
+        aligned with its rays and gates by the nearest ray lookup of
+        ClutterMap, which is computed once per scan layout. """
+        for static_map in (self.flag_map, self.clutter_map):
+            if static_map is not None:
+                static_map.add_fields(radar)
+        return radar
+
+    def finish_volume(self):
+        """ Marks a volume as finished, running the garbage collector
+        every gc_interval volumes rather than after every volume. """
+        self.volumes_processed += 1
+        if self.gc_interval and self.volumes_processed % self.gc_interval == 0:
+            gc.collect()
+
+
+_WORKER_CONTEXTS = {}
+
+
+def get_worker_context(config, **kwargs):
+    """
+    Returns the WorkerContext of this process for a configuration,
+    creating it on first use. Keyword arguments are passed on to
+    WorkerContext and are part of the cache key.
+    """
+    key = (config, os.getpid(), repr(sorted(kwargs.items())))
+    if key not in _WORKER_CONTEXTS:
+        _WORKER_CONTEXTS[key] = WorkerContext(config, **kwargs)
+    return _WORKER_CONTEXTS[key]
+
+
+def init_worker_context(config, **kwargs):
+    """ Initializer for process pools, loads the worker context of a
+    configuration before the first volume arrives. """
+    context = get_worker_context(config, **kwargs)
+    # Touch the lazily loaded resources so the first volume is not slower.
+    context.cbb_flag
+    context.dod
+    context.clutter_field
+    return context
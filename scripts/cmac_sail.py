@@ -1,11 +1,11 @@
-from cmac import cmac, get_sounding_times, get_sounding_file_name, config, quicklooks_ppi
+from cmac import cmac, get_sounding_times, get_sounding_file_name, quicklooks_ppi
+from cmac.worker_context import get_worker_context
 import pyart
 import glob
 import pyart
 import datetime
 import numpy as np
 import netCDF4
-import xarray as xr
 import os
 import subprocess
 import re
@@ -19,7 +19,6 @@ import matplotlib.pyplot as plt
 
 from distributed import LocalCluster, Client, wait, progress
 #from dask_jobqueue import SLURMCluster
-from copy import deepcopy
 
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -33,10 +32,13 @@ def parse_radar_date(filename):
     fname = filename.split("/")[-1]
     return datetime.datetime.strptime(fname, "xprecipradar_guc_volume_%Y%m%d-%H%M%S.b1.nc")
 
-def run_cmac_and_plotting(radar_file_path, rad_time, cmac_config, sonde_times,
-                          sounding_files, clutter_file_path, geotiff,
+def run_cmac_and_plotting(radar_file_path, rad_time, context, geotiff,
                           out_path, img_directory, sweep=3, dd_lobes=False):
-    """ For dask we need the radar plotting routines all in one subroutine. """
+    """ For dask we need the radar plotting routines all in one subroutine.
+    Static resources such as the configs, the cbb flags, the DOD and the
+    sondes come from the worker context and are only loaded once per
+    worker. """
+    cmac_config = context.cmac_config
     match_datetime = re.search(r'\d{4}\d{2}\d{2}.\d{6}', radar_file_path)
     match_month = re.search(r'\d{4}\d{2}', radar_file_path)
     file_datetime = match_datetime.group()
@@ -51,8 +53,6 @@ def run_cmac_and_plotting(radar_file_path, rad_time, cmac_config, sonde_times,
         
     if os.path.exists(file_name):
         print("Skipping " + file_name)
-        import gc
-        gc.collect()
         return
     
     try:
@@ -68,10 +68,7 @@ def run_cmac_and_plotting(radar_file_path, rad_time, cmac_config, sonde_times,
 
     
     # For SAIL, discard all range values below 300 m
-    beam_block = pyart.io.read('flag_radar.nc')
-    radar.fields['cbb_flag'] = deepcopy(beam_block.fields['cbb_flag'])
-    radar.fields['cbb_flag']['data'] = radar.fields['cbb_flag']['data'][:radar.nrays, :]
-    del beam_block
+    context.add_static_fields(radar)
 
     valid_rays = int(np.argwhere(radar.range["data"] >= 300.)[0])
     print(valid_rays)
@@ -79,10 +76,9 @@ def run_cmac_and_plotting(radar_file_path, rad_time, cmac_config, sonde_times,
         radar.fields[field]["data"] = radar.fields[field]["data"][:, valid_rays:]
     radar.range["data"] = radar.range["data"][valid_rays:]
     radar.ngates = len(radar.range["data"])
-    sonde_index = np.argmin(np.abs(sonde_times - rad_time))
-    sounding_file = sounding_files[sonde_index]
+    sonde_index = np.argmin(np.abs(context.sonde_times - rad_time))
     # Retrieve closest sonde in time to the time of the radar file.
-    sonde = xr.open_dataset(sounding_file)
+    sonde = context.open_sonde(context.sonde_files[sonde_index])
     # Running the cmac code to produce a cmac_radar object.
     processed = False
     while not processed:
@@ -91,17 +87,14 @@ def run_cmac_and_plotting(radar_file_path, rad_time, cmac_config, sonde_times,
                          meta_append='config')
             processed = True
         except ValueError:
-            sonde.close()
             sonde_index += 1
-            sounding_file = sounding_files[sonde_index]
-            sonde = xr.open_dataset(sounding_file)
+            sonde = context.open_sonde(context.sonde_files[sonde_index])
     # Free up some memory.
     del radar
-    sonde.close()
 
     # Produce the cmac_radar file from the cmac_radar object.
     # Check metadata and fill values
-    out_ds = xr.open_dataset('dod.nc', mask_and_scale=False)
+    out_ds = context.dod
 
     pyart.io.write_cfradial(file_name, cmac_radar)
     
@@ -135,15 +128,17 @@ def run_cmac_and_plotting(radar_file_path, rad_time, cmac_config, sonde_times,
     # Delete the cmac_radar object and move on to the next radar file.
     del cmac_radar
     plt.close('all')
+    context.finish_volume()
     return
 
 def process_t(index):
-    meta_config = config.get_metadata('sail_xband_ppi')
-    cmac_config = config.get_cmac_values('sail_xband_ppi')
-    field_config = config.get_field_names('sail_xband_ppi')
+    context = get_worker_context(
+        'sail_xband_ppi', flag_file='flag_radar.nc', dod_file='dod.nc',
+        sonde_files=sonde_file_list,
+        sonde_date_format='gucsondewnpnM1.b1.%Y%m%d.%H%M%S.cdf')
     radar_file = file_list[index]
     radar_time = radar_times[index]
-    run_cmac_and_plotting(radar_file, radar_time, cmac_config, sonde_times, sonde_file_list, None, None, out_path, img_dir) 
+    run_cmac_and_plotting(radar_file, radar_time, context, None, out_path, img_dir)
     
 if __name__ == "__main__":
     print("process start time: ", time.strftime("%H:%M:%S"))
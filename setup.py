@@ -118,8 +118,11 @@ setup(
     classifiers=CLASSIFIERS,
     packages=find_packages(),
     scripts=['scripts/cmac',
+             'scripts/cmac_accumulate',
              'scripts/cmac_animation',
+             'scripts/cmac_batch',
              'scripts/cmac_dask',
+             'scripts/cmac_service',
              'scripts/xsapr_cmac_ipcluster',
              'scripts/xsapr_cmac_pyspark'],
 )